@@ -1,40 +1,33 @@
+import argparse
+import os
+import queue
+import random
+import re
 import socket
 import threading
 import signal
 import sys
+import time
 
 # Конфигурация портов
 PORT_WEB = 5000       # Веб-интерфейс (HTTP)
 PORT_DB_MOCK = 5001   # Имитация базы данных (Custom TCP)
 PORT_ADMIN = 5002     # Консоль администратора (Telnet-like)
 
-# Флаг для координации остановки
-shutdown_event = threading.Event()
-
-def service_web_ui():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        server.bind(("0.0.0.0", PORT_WEB))
-        server.listen(5)
-        server.settimeout(1.0)  # чтобы accept() не блокировался навсегда
-        print(f"[APP] Web UI запущен на порту {PORT_WEB}")
-    except OSError as e:
-        print(f"[ERROR] Не удалось запустить Web UI на порту {PORT_WEB}: {e}")
-        return
-
-    while not shutdown_event.is_set():
-        try:
-            client, _ = server.accept()
-        except socket.timeout:
-            continue  # проверяем флаг остановки
-        except OSError:
-            break  # сокет закрыт — выходим
-
-        try:
-            request = client.recv(1024)
+# Настройки нагрузочного стенда (переменные окружения или аргументы командной строки).
+# По умолчанию ответы байт в байт прежние; клиенты обслуживаются параллельно пулом потоков.
+BACKLOG = int(os.environ.get("APP_BACKLOG", "1024"))
+MAX_THREADS = int(os.environ.get("APP_MAX_THREADS", "1000"))          # одновременно обслуживаемых клиентов
+BODY_SIZE = int(os.environ.get("APP_BODY_SIZE", "0"))                  # 0 — исходная страница
+LATENCY_MS = float(os.environ.get("APP_LATENCY_MS", "0"))              # задержка перед ответом
+JITTER_MS = float(os.environ.get("APP_JITTER_MS", "0"))                # + случайно от 0 до JITTER
+CHUNKED = os.environ.get("APP_CHUNKED", "0") == "1"                    # тело в Transfer-Encoding: chunked
+CHUNK_SIZE = int(os.environ.get("APP_CHUNK_SIZE", "16384"))
+CHUNK_DELAY_MS = float(os.environ.get("APP_CHUNK_DELAY_MS", "0"))      # пауза между кусками (медленный поток)
+KEEPALIVE = os.environ.get("APP_KEEPALIVE", "0") == "1"                # HTTP/1.1 keep-alive на 5000
+IDLE_TIMEOUT = float(os.environ.get("APP_IDLE_TIMEOUT", "30"))         # простой клиента, сек
 
-            html_body = """
+HTML_BODY = """
             <html>
             <head><title>Warehouse ERP v2.4</title></head>
             <body>
@@ -45,101 +38,197 @@ def service_web_ui():
             </body>
             </html>
             """
+# Строка для тел заданного размера: с теми же словами, что маскирует прокси
+FILLER_ROW = "<p>Powered by Python Legacy Backend. Warehouse ERP v2.4 inventory row.</p>\n"
+HTTP_HEAD = "HTTP/1.1 200 OK\r\nServer: Warehouse-Internal-HTTPd/2.4\r\nContent-Type: text/html; charset=utf-8\r\n"
 
-            response = (
-                "HTTP/1.1 200 OK\r\n"
-                "Server: Warehouse-Internal-HTTPd/2.4\r\n"
-                "Content-Type: text/html; charset=utf-8\r\n"
-                "Connection: close\r\n"
-                "\r\n"
-                + html_body
-            )
-            client.sendall(response.encode('utf-8'))
-        except Exception:
-            pass
-        finally:
-            try:
-                client.close()
-            except:
-                pass
+_HTTP_START = re.compile(rb"[A-Z]+(?: |\Z)")  # начало строки запроса (метод) или его часть
+_CONTENT_LENGTH = re.compile(rb"\ncontent-length:[ \t]*(\d+)", re.IGNORECASE)
+_CONNECTION_CLOSE = re.compile(rb"\nconnection:[ \t]*close", re.IGNORECASE)
 
-    server.close()
-    print("[APP] Web UI остановлен")
+# Флаг для координации остановки
+shutdown_event = threading.Event()
 
 
-def service_database_mock():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    try:
-        server.bind(("0.0.0.0", PORT_DB_MOCK))
-        server.listen(5)
-        server.settimeout(1.0)
-        print(f"[APP] Data Service (Mock) запущен на порту {PORT_DB_MOCK}")
-    except OSError as e:
-        print(f"[ERROR] Не удалось запустить DB Mock на порту {PORT_DB_MOCK}: {e}")
-        return
+class HttpResponses:
+    """Ответы Web UI, собранные один раз при запуске: на запрос — только sendall готовых байт"""
+    def __init__(self, body_size, chunked, chunk_size, keepalive):
+        body = HTML_BODY.encode("utf-8")
+        if body_size:
+            rows = FILLER_ROW.encode("utf-8") * (body_size // len(FILLER_ROW) + 1)
+            body = (body.split(b"</body>")[0] + rows)[:body_size]
+        self.chunked = chunked
+        if chunked:
+            framing = "Transfer-Encoding: chunked\r\n"
+            pieces = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+            self.chunks = [b"%x\r\n" % len(p) + p + b"\r\n" for p in pieces] + [b"0\r\n\r\n"]
+            body = b""
+        elif keepalive or body_size:
+            framing = f"Content-Length: {len(body)}\r\n"
+        else:
+            framing = ""  # как раньше: тело до закрытия соединения
+        self.close = (HTTP_HEAD + framing + "Connection: close\r\n\r\n").encode("utf-8") + body
+        self.keep = (HTTP_HEAD + framing + "Connection: keep-alive\r\n\r\n").encode("utf-8") + body
 
-    while not shutdown_event.is_set():
-        try:
-            client, addr = server.accept()
-        except socket.timeout:
-            continue
-        except OSError:
+    def send(self, client, keep_alive, chunk_delay):
+        client.sendall(self.keep if keep_alive else self.close)
+        if self.chunked:
+            for chunk in self.chunks:
+                if chunk_delay:
+                    time.sleep(chunk_delay)
+                client.sendall(chunk)
+
+
+RESPONSES = HttpResponses(BODY_SIZE, CHUNKED, CHUNK_SIZE, KEEPALIVE)
+
+
+def artificial_delay():
+    if LATENCY_MS or JITTER_MS:
+        time.sleep((LATENCY_MS + random.uniform(0, JITTER_MS)) / 1000)
+
+
+def read_request(client, buffered):
+    """Запрос целиком: (заголовок, остаток буфера) или (None, b""), если клиент ушёл.
+    Не-HTTP данные (пробы сканера) — сразу, как раньше, без ожидания конца заголовка."""
+    data = buffered
+    while True:
+        if data and not _HTTP_START.match(data):
+            return data, b""
+        end, sep = data.find(b"\r\n\r\n"), 4
+        if end < 0:
+            end, sep = data.find(b"\n\n"), 2
+        if end >= 0:
             break
+        if len(data) > 65536:
+            return None, b""
+        chunk = client.recv(65536)
+        if not chunk:
+            return (data or None), b""
+        data += chunk
+    head, rest = data[:end + sep // 2], data[end + sep:]
+    match = _CONTENT_LENGTH.search(head)
+    length = int(match.group(1)) if match else 0
+    while len(rest) < length:  # тело дочитываем, чтобы закрытие не ушло RST
+        chunk = client.recv(min(65536, length - len(rest)))
+        if not chunk:
+            return None, b""
+        rest += chunk
+    return head, rest[length:]
+
+
+def handle_web(client):
+    buffered = b""
+    while True:
+        head, buffered = read_request(client, buffered)
+        if head is None:
+            return
+        request_line = head.split(b"\n", 1)[0].rstrip()
+        keep_alive = KEEPALIVE and request_line.endswith(b"HTTP/1.1") and not _CONNECTION_CLOSE.search(head)
+        artificial_delay()
+        RESPONSES.send(client, keep_alive, CHUNK_DELAY_MS / 1000)
+        if not keep_alive:
+            return
+
 
+def handle_database(client):
+    banner = "WH-DB-PROTOCOL-v1.0-RELEASE\nREADY\n"
+    client.sendall(banner.encode('utf-8'))
+    data = client.recv(1024)
+    if data:
+        artificial_delay()
+        client.sendall(b"ERROR: AUTH_REQUIRED\n")
+
+
+def handle_admin(client):
+    client.sendall(b"*** WAREHOUSE ROOT CONSOLE ***\n")
+    client.sendall(b"Login: ")
+    client.recv(1024)
+    artificial_delay()
+    client.sendall(b"\nAccess Denied.\n")
+
+
+def serve_client(client, handler):
+    try:
+        client.settimeout(IDLE_TIMEOUT)
+        handler(client)
+    except Exception:
+        pass
+    finally:
         try:
-            banner = "WH-DB-PROTOCOL-v1.0-RELEASE\nREADY\n"
-            client.sendall(banner.encode('utf-8'))
-            data = client.recv(1024)
-            if data:
-                client.sendall(b"ERROR: AUTH_REQUIRED\n")
-        except Exception:
+            client.close()
+        except:
             pass
-        finally:
-            try:
-                client.close()
-            except:
-                pass
 
-    server.close()
-    print("[APP] Data Service остановлен")
 
+class ClientPool:
+    """Потоки-обработчики клиентов переиспользуются: новый поток создаётся, только если
+    все заняты (не больше max_threads; дальше клиенты ждут в очереди). Запуск потока
+    на каждое соединение обходится дороже самой обработки короткого запроса."""
+    def __init__(self, max_threads):
+        self.max_threads = max_threads
+        self.threads = 0
+        self.idle = 0
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
 
-def service_admin_console():
+    def submit(self, client, handler):
+        with self.lock:
+            spawn = not self.idle and self.threads < self.max_threads
+            if spawn:
+                self.threads += 1
+            elif self.idle:
+                self.idle -= 1  # клиент достанется одному из свободных потоков
+        self.queue.put((client, handler))
+        if spawn:
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            client, handler = self.queue.get()
+            serve_client(client, handler)
+            with self.lock:
+                self.idle += 1
+
+
+CLIENTS = ClientPool(MAX_THREADS)
+
+
+def run_service(name, port, handler):
+    """Цикл accept: клиенты уходят в общий пул потоков, очередь accept() — BACKLOG"""
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
-        server.bind(("0.0.0.0", PORT_ADMIN))
-        server.listen(5)
-        server.settimeout(1.0)
-        print(f"[APP] Admin Console запущен на порту {PORT_ADMIN}")
+        server.bind(("0.0.0.0", port))
+        server.listen(BACKLOG)
+        server.settimeout(1.0)  # чтобы accept() не блокировался навсегда
+        print(f"[APP] {name} запущен на порту {port}")
     except OSError as e:
-        print(f"[ERROR] Не удалось запустить Admin Console на порту {PORT_ADMIN}: {e}")
+        print(f"[ERROR] Не удалось запустить {name} на порту {port}: {e}")
         return
 
     while not shutdown_event.is_set():
         try:
-            client, addr = server.accept()
+            client, _ = server.accept()
         except socket.timeout:
-            continue
+            continue  # проверяем флаг остановки
         except OSError:
-            break
-
-        try:
-            client.sendall(b"*** WAREHOUSE ROOT CONSOLE ***\n")
-            client.sendall(b"Login: ")
-            client.recv(1024)
-            client.sendall(b"\nAccess Denied.\n")
-        except Exception:
-            pass
-        finally:
-            try:
-                client.close()
-            except:
-                pass
+            break  # сокет закрыт — выходим
+        CLIENTS.submit(client, handler)
 
     server.close()
-    print("[APP] Admin Console остановлен")
+    print(f"[APP] {name} остановлен")
+
+
+def service_web_ui():
+    run_service("Web UI", PORT_WEB, handle_web)
+
+
+def service_database_mock():
+    run_service("Data Service (Mock)", PORT_DB_MOCK, handle_database)
+
+
+def service_admin_console():
+    run_service("Admin Console", PORT_ADMIN, handle_admin)
 
 
 def signal_handler(signum, frame):
@@ -147,7 +236,33 @@ def signal_handler(signum, frame):
     shutdown_event.set()
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Warehouse App — защищаемое приложение и стенд для нагрузки")
+    parser.add_argument("--backlog", type=int, default=BACKLOG, help="Размер очереди accept()")
+    parser.add_argument("--max-threads", type=int, default=MAX_THREADS,
+                        help="Сколько клиентов обслуживается одновременно")
+    parser.add_argument("--body-size", type=int, default=BODY_SIZE,
+                        help="Размер тела ответа Web UI, байт (0 — исходная страница)")
+    parser.add_argument("--latency-ms", type=float, default=LATENCY_MS, help="Задержка перед ответом, мс")
+    parser.add_argument("--jitter-ms", type=float, default=JITTER_MS,
+                        help="Случайная добавка к задержке, от 0 до N мс")
+    parser.add_argument("--chunked", action="store_true", default=CHUNKED,
+                        help="Отдавать тело Web UI кусками в Transfer-Encoding: chunked")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Размер куска, байт")
+    parser.add_argument("--chunk-delay-ms", type=float, default=CHUNK_DELAY_MS,
+                        help="Пауза перед каждым куском, мс (медленный поток)")
+    parser.add_argument("--keepalive", action="store_true", default=KEEPALIVE,
+                        help="Держать соединения Web UI открытыми между запросами (HTTP/1.1 keep-alive)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    BACKLOG, LATENCY_MS, JITTER_MS, CHUNK_DELAY_MS, KEEPALIVE = (
+        args.backlog, args.latency_ms, args.jitter_ms, args.chunk_delay_ms, args.keepalive)
+    RESPONSES = HttpResponses(args.body_size, args.chunked, args.chunk_size, args.keepalive)
+    CLIENTS = ClientPool(args.max_threads)
+
     print(">>> Запуск микросервиса 'Warehouse App'...")
 
     # Регистрация обработчика сигналов
@@ -171,4 +286,4 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         shutdown_event.set()
 
-    print("Приложение завершено.")
\ No newline at end of file
+    print("Приложение завершено.")
@@ -0,0 +1,108 @@
+# bench_admission.py
+# Обслуживание легитимного клиента во время скан-шторма: флудер с 127.0.0.2 открывает
+# соединения на 9000/9001/9002 и шлёт мусор (как bench/loadgen.py --payload raw),
+# легитимный клиент с 127.0.0.1 ходит на 9000 за страницей. Сравниваются прокси
+# без ограничения источников и с token bucket на IP (close / tarpit).
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+
+HTML = b"<html><head><title>Warehouse ERP v2.4</title></head><body>Powered by Python Legacy Backend</body></html>"
+APP_RESPONSE = (b"HTTP/1.1 200 OK\r\nServer: Warehouse-Internal-HTTPd/2.4\r\n"
+                b"Content-Type: text/html; charset=utf-8\r\nConnection: close\r\n\r\n" + HTML)
+
+async def stub_app(reader, writer):
+    try:
+        await reader.read(1024)
+        writer.write(APP_RESPONSE)
+        await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+async def flooder(deadline, counter):
+    ports = (9000, 9001, 9002)
+    i = 0
+    while time.perf_counter() < deadline:
+        i += 1
+        try:
+            async with asyncio.timeout(1.0):
+                reader, writer = await asyncio.open_connection("127.0.0.1", ports[i % 3],
+                                                               local_addr=("127.0.0.2", 0))
+                writer.write(b"HELLO\n")
+                await reader.read(1024)
+                writer.close()
+        except (OSError, TimeoutError):
+            pass
+        counter[0] += 1
+
+def flood_process(tasks, duration, result):
+    """Флудер в отдельном процессе, чтобы не отнимать event loop у легитимного клиента"""
+    async def main():
+        deadline = time.perf_counter() + duration
+        counter = [0]
+        await asyncio.gather(*(flooder(deadline, counter) for _ in range(tasks)))
+        result.value = counter[0]
+    asyncio.run(main())
+
+async def legit(deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        try:
+            async with asyncio.timeout(5.0):
+                reader, writer = await asyncio.open_connection("127.0.0.1", 9000)
+                writer.write(b"GET / HTTP/1.0\r\nHost: bench\r\n\r\n")
+                body = await reader.read()
+                writer.close()
+            if b"Internal Portal" in body:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors[0] += 1
+        except (OSError, TimeoutError):
+            errors[0] += 1
+        await asyncio.sleep(0.05)
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+async def run(label, env_extra, flood_tasks, duration):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000",
+               PROXY_LOG_POLICY="drop", **env_extra)
+    proc = subprocess.Popen([sys.executable, PROXY], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.sleep(1.5)
+        flood = multiprocessing.Value("q", 0)
+        storm = multiprocessing.Process(target=flood_process, args=(flood_tasks, duration, flood))
+        storm.start()
+        latencies, errors = [], [0]
+        await legit(time.perf_counter() + duration, latencies, errors)
+        storm.join()
+        print(f"{label:<14} {flood.value / duration:>9.0f} {len(latencies):>6} {errors[0]:>6} "
+              f"{percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f}")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+async def main():
+    flood_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    app = await asyncio.start_server(stub_app, "127.0.0.1", 5000, backlog=4096, reuse_address=True)
+    async with app:
+        print(f"flood tasks={flood_tasks}, duration={duration}s")
+        print(f"{'admission':<14} {'flood c/s':>9} {'ok':>6} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8}")
+        await run("off", {"PROXY_IP_RATE": "0"}, flood_tasks, duration)
+        await run("close", {"PROXY_IP_RATE": "20", "PROXY_REJECT_POLICY": "close"}, flood_tasks, duration)
+        await run("tarpit", {"PROXY_IP_RATE": "20", "PROXY_REJECT_POLICY": "tarpit"}, flood_tasks, duration)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+# bench_detector.py
+# Детектор обхода портов под флудом уникальных адресов: стоимость observe() на
+# соединение, память (скетчи фиксированы, tracemalloc не должен расти с числом
+# адресов), доля найденных настоящих сканеров и ложные сработки среди флуда.
+# Время синтетическое: поток растянут на --seconds секунд окна детектора.
+# Пример: python bench/bench_detector.py 2000000 --sweepers 50 --width 16384
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "proxy"))
+
+from detector import SweepDetector  # noqa: E402
+
+PORTS = (9000, 9001, 9002)
+
+def replay(detector, events):
+    """observe() на каждое событие и advance() раз в секунду синтетического времени,
+    как служебный цикл прокси; сдвиги кольца входят в замер"""
+    tick = 1.0
+    for now, ip, port in events:
+        if now >= tick:
+            detector.advance(now)
+            tick = int(now) + 1.0
+        detector.observe(ip, port, now)
+
+def run(sources, sweepers, seconds, width, seed=1):
+    rng = random.Random(seed)
+    detector = SweepDetector(width=width)
+    # Сканеры трогают все порты каждые 500 мс, флуд — по одному соединению с адреса
+    scanners = {f"203.0.113.{i}" for i in range(sweepers)}
+    events = [(i * seconds / sources, f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", rng.choice(PORTS))
+              for i in range(sources)]
+    for ip in scanners:
+        start = rng.uniform(0, seconds / 2)
+        events += [(start + k * 0.5 + j * 0.01, ip, port)
+                   for k in range(int(seconds / 2)) for j, port in enumerate(PORTS)]
+    events.sort()
+
+    started = time.perf_counter()
+    replay(detector, events)
+    elapsed = time.perf_counter() - started
+
+    # Второй проход под tracemalloc (он замедляет, поэтому отдельно от замера времени)
+    traced = SweepDetector(width=width)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    replay(traced, events)
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    found = detector.drain()
+    swept = {d.ip for d in found if d.kind == "sweep"}
+    false = sum(1 for d in found if d.ip not in scanners)
+    return {
+        "events": len(events),
+        "us_per_observe": elapsed / len(events) * 1e6,
+        "sketch_kb": detector.memory_bytes() // 1024,
+        "grown_kb": grown // 1024,
+        "recall": len(swept & scanners) / len(scanners) if scanners else 1.0,
+        "false": false,
+        "top": detector.top(3, now=events[-1][0]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Детектор обхода портов под флудом уникальных адресов")
+    parser.add_argument("sources", type=int, nargs="?", default=1000000, help="Уникальных адресов во флуде")
+    parser.add_argument("--sweepers", type=int, default=50, help="Настоящих сканеров среди них")
+    parser.add_argument("--seconds", type=float, default=60, help="На сколько секунд растянут поток")
+    parser.add_argument("--width", type=int, nargs="+", default=[4096, 16384], help="Ширины таблиц")
+    args = parser.parse_args()
+
+    print(f"{args.sources} адресов флуда + {args.sweepers} сканеров за {args.seconds:g} с")
+    print(f"{'width':>7} {'событий':>9} {'мкс/соед':>9} {'скетчи КБ':>10} {'рост КБ':>8} {'найдено':>8} {'ложных':>7}  top")
+    for width in args.width:
+        r = run(args.sources, args.sweepers, args.seconds, width)
+        top = ", ".join(f"{ip} {count}" for ip, count, _ in r["top"])
+        print(f"{width:>7} {r['events']:>9} {r['us_per_observe']:>9.2f} {r['sketch_kb']:>10} {r['grown_kb']:>8} "
+              f"{r['recall']:>8.0%} {r['false']:>7}  {top}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench_engine.py
+# A/B сравнение движков прокси (asyncio vs threaded): соединений/сек и p99 задержки.
+# Поднимает локальную заглушку приложения на 127.0.0.1:5000 и прокси в подпроцессе.
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+
+HTML = b"<html><head><title>Warehouse ERP v2.4</title></head><body>Powered by Python Legacy Backend</body></html>"
+APP_RESPONSE = (b"HTTP/1.1 200 OK\r\nServer: Warehouse-Internal-HTTPd/2.4\r\n"
+                b"Content-Type: text/html; charset=utf-8\r\nConnection: close\r\n\r\n" + HTML)
+
+async def stub_app(reader, writer):
+    try:
+        await reader.read(1024)
+        writer.write(APP_RESPONSE)
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def one_request(port, payload):
+    t0 = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        if payload:
+            writer.write(payload)
+            await writer.drain()
+        await reader.read()
+        writer.close()
+        return time.perf_counter() - t0, True
+    except OSError:
+        return time.perf_counter() - t0, False
+
+async def closed_loop(port, payload, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            lat, ok = await one_request(port, payload)
+            if ok: latencies.append(lat)
+            else: errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - t0
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+async def run_engine(engine, concurrency, duration):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000", PROXY_IP_RATE="0")
+    proc = subprocess.Popen([sys.executable, PROXY, "--engine", engine],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.sleep(1.5)
+        results = {}
+        for port, payload in ((9000, b"GET / HTTP/1.1\r\nHost: bench\r\n\r\n"), (9001, b"")):
+            lat, errors, elapsed = await closed_loop(port, payload, concurrency, duration)
+            results[port] = (len(lat) / elapsed, percentile(lat, 0.5), percentile(lat, 0.99), errors)
+        return results
+    finally:
+        proc.terminate()
+        proc.wait()
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    app = await asyncio.start_server(stub_app, "127.0.0.1", 5000, backlog=4096, reuse_address=True)
+    async with app:
+        print(f"concurrency={concurrency}, duration={duration}s")
+        print(f"{'engine':<10} {'port':>5} {'conn/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for engine in ("threaded", "asyncio"):
+            for port, (rate, p50, p99, errors) in (await run_engine(engine, concurrency, duration)).items():
+                print(f"{engine:<10} {port:>5} {rate:>10.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f} {errors:>7}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+# bench_fingerprint.py
+# Цена определения сервиса и рисков на корпусе баннеров (bench/banners.jsonl) в
+# зависимости от размера набора сигнатур. Сравнение: прежний разбор (any() по
+# спискам, четыре regex версий, цикл по строкам, проверка каждого слова),
+# автомат Ахо-Корасик (pyahocorasick) и trie-регулярка без него.
+import json
+import os
+import random
+import re
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scanner"))
+
+from fingerprint import SIGNATURES_PATH, Fingerprinter  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "bench", "banners.jsonl")
+EXTRA_COUNTS = [0, 100, 1000, 5000]
+ROUNDS = 200
+
+def naive_engine(sigs):
+    """Прежние detect_service_from_data + extract_risks над теми же списками"""
+    services = [(s["name"], [x.encode() for x in s["signatures"]], s.get("ignore_case")) for s in sigs["services"]]
+    keywords = sigs["keywords"]
+    headers = tuple(h.lower() + ":" for h in sigs["headers"])
+    version_patterns = [r'\b\d+\.\d+(?:\.\d+)?\b', r'[vV]\d+\.?\d*', r'/\d+\.\d+', r'-v\d+\.\d+']
+
+    def analyze(data):
+        total = data.lower()
+        service = sigs["default_service"]
+        for name, signatures, ignore_case in services:
+            if any((sig.lower() in total) if ignore_case else (sig in data) for sig in signatures):
+                service = name
+                break
+        text = data.decode("utf-8", errors="ignore")
+        risks = []
+        found = set()
+        for pattern in version_patterns:
+            found.update(re.findall(pattern, text))
+        if found:
+            risks.append(f"Обнаружены версии: {', '.join(sorted(found))}")
+        for line in text.splitlines():
+            stripped = line.strip()
+            if stripped.lower().startswith(headers):
+                risks.append(f"Раскрыт заголовок: {stripped}")
+        text_lower = text.lower()
+        found_keywords = [kw for kw in keywords if kw in text_lower]
+        if found_keywords:
+            risks.append(f"Чувствительные ключевые слова: {', '.join(sorted(set(found_keywords)))}")
+        if any(mark in text for mark in sigs["banner_marks"]):
+            risks.append("Обнаружен стилизованный баннер")
+        return service, risks
+
+    return analyze
+
+def grow(sigs, extra, rng):
+    """Набор сигнатур + extra случайных сигнатур сервисов и столько же ключевых слов"""
+    grown = json.loads(json.dumps(sigs))
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 14))) for _ in range(2 * extra)]
+    services = grown["services"]
+    for i, word in enumerate(words[:extra]):
+        services.insert(-1, {"name": f"svc-{i}", "signatures": [word], "ignore_case": True})
+    grown["keywords"] += words[extra:]
+    return grown
+
+def measure(analyze, corpus):
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        for data in corpus:
+            analyze(data)
+    return (time.perf_counter() - t0) / (ROUNDS * len(corpus)) * 1e6
+
+def main():
+    with open(CORPUS, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    corpus = [e["data"].encode("utf-8") for e in entries]
+    with open(SIGNATURES_PATH, encoding="utf-8") as f:
+        sigs = json.load(f)
+    rng = random.Random(1)
+
+    new = Fingerprinter.from_dict(sigs)
+    old = naive_engine(sigs)
+    agree = sum(new.analyze(d)[0] == old(d)[0] for d in corpus)
+    print(f"corpus: {len(corpus)} banners, {sum(map(len, corpus))} bytes; service guess agrees on {agree}/{len(corpus)}")
+    print(f"{'signatures':>10} {'old us':>9} {'automaton us':>13} {'trie re us':>11}")
+    for extra in EXTRA_COUNTS:
+        grown = grow(sigs, extra, rng)
+        automaton = Fingerprinter.from_dict(grown)
+        trie = Fingerprinter.from_dict(grown, use_automaton=False)
+        print(f"{len(trie):>10} {measure(naive_engine(grown), corpus):>9.1f} "
+              f"{measure(automaton.analyze, corpus) if automaton.automaton else float('nan'):>13.1f} "
+              f"{measure(trie.analyze, corpus):>11.1f}")
+
+if __name__ == "__main__":
+    main()
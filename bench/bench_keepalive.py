@@ -0,0 +1,101 @@
+# bench_keepalive.py
+# Запросы/сек и задержка на запрос через порт 9000 с пулом upstream-соединений и без него.
+# Заглушка приложения держит keep-alive и отвечает с Content-Length.
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+
+HTML = b"<html><head><title>Warehouse ERP v2.4</title></head><body>Powered by Python Legacy Backend</body></html>"
+APP_RESPONSE = (b"HTTP/1.1 200 OK\r\nServer: Warehouse-Internal-HTTPd/2.4\r\n"
+                b"Content-Type: text/html\r\nContent-Length: %d\r\n\r\n" % len(HTML) + HTML)
+REQUEST = b"GET / HTTP/1.1\r\nHost: bench\r\n\r\n"
+
+async def stub_app(reader, writer):
+    try:
+        buf = b""
+        while True:
+            while b"\r\n\r\n" not in buf:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    return
+                buf += chunk
+            _, _, buf = buf.partition(b"\r\n\r\n")
+            writer.write(APP_RESPONSE)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    if b"chunked" in head.lower():
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                return
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            await reader.readexactly(int(line.split(b":")[1]))
+            return
+    await reader.read()
+
+async def client(port, duration, latencies, pipeline):
+    deadline = time.perf_counter() + duration
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            writer.write(REQUEST * pipeline)
+            await writer.drain()
+            for _ in range(pipeline):
+                await read_response(reader)
+            latencies.append((time.perf_counter() - t0) / pipeline)
+    except (OSError, asyncio.IncompleteReadError):
+        # Прокси закрыл соединение (лимит запросов) — переподключаемся
+        await client(port, deadline - time.perf_counter(), latencies, pipeline)
+    finally:
+        writer.close()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+async def run(engine, pool_size, concurrency, duration, pipeline):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000",
+               PROXY_IP_RATE="0", PROXY_KEEPALIVE_MAX_REQUESTS="1000000")
+    proc = subprocess.Popen([sys.executable, PROXY, "--engine", engine, "--pool-size", str(pool_size)],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.sleep(1.5)
+        latencies = []
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client(9000, duration, latencies, pipeline) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+        return len(latencies) * pipeline / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    pipeline = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    app = await asyncio.start_server(stub_app, "127.0.0.1", 5000, backlog=4096, reuse_address=True)
+    async with app:
+        print(f"keep-alive clients={concurrency}, pipeline={pipeline}, duration={duration}s")
+        print(f"{'engine':<10} {'pool':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for engine in ("threaded", "asyncio"):
+            for pool_size in (0, 64):
+                rps, p50, p99 = await run(engine, pool_size, concurrency, duration, pipeline)
+                print(f"{engine:<10} {pool_size:>5} {rps:>9.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
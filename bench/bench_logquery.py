@@ -0,0 +1,167 @@
+# bench_logquery.py
+# Аналитика журнала на синтетическом security_events.log (по умолчанию 10 млн строк,
+# ~1 ГБ): grep -c и наивный построчный разбор на Python против proxy/logquery.py —
+# полная сводка (в одном и в нескольких процессах), сводки с фильтром по действию
+# и по IP, "top источников HONEYPOT_TRIGGER за последний час" через индекс времени
+# и подхват дописанных строк в режиме follow.
+# Пик памяти Python (tracemalloc) показывает, что агрегаты не растут с файлом.
+# Пример: python bench/bench_logquery.py --lines 10000000 --keep /tmp/events.log
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "proxy"))
+
+from logquery import LogReader, Query, follow, summarize  # noqa: E402
+
+# Действие, порт, детали, вес — примерно как в настоящем журнале
+EVENTS = [
+    ("HONEYPOT_TRIGGER", 9001, "Атака перехвачена", 30),
+    ("HONEYPOT_TRIGGER", 9002, "Атака перехвачена", 15),
+    ("OBFUSCATION", 9000, "Сработали правила: hide-server-banner", 25),
+    ("FORWARD", 9000, "Пропущен", 20),
+    ("DROP_EMPTY", 9000, "Пустой запрос (Scan)", 5),
+    ("BAD_REQUEST", 9000, "400: Некорректная строка запроса", 3),
+    ("ADMISSION_REJECT", 9000, "Отказ: превышен лимит", 2),
+]
+DISTINCT_IPS = 100000
+
+def generate(path, lines, days, seed=1):
+    """Журнал за последние days суток, источники по закону Ципфа, лёгкий беспорядок времени"""
+    rng = random.Random(seed)
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(DISTINCT_IPS)]
+    weights, total = [], 0.0
+    for rank in range(1, DISTINCT_IPS + 1):
+        total += 1 / rank ** 1.1
+        weights.append(total)
+    events = [f" -> :{port} | {action:<20} | {details}\n" for action, port, details, _ in EVENTS]
+    event_weights = [weight for *_, weight in EVENTS]
+    end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+    step = days * 86400 / lines
+    block = 100000
+    with open(path, "w", encoding="utf-8") as f:
+        for first in range(0, lines, block):
+            n = min(block, lines - first)
+            sources = rng.choices(ips, cum_weights=weights, k=n)
+            kinds = rng.choices(events, weights=event_weights, k=n)
+            out, stamp_second, stamp = [], None, ""
+            for i in range(n):
+                second = int((first + i) * step)
+                if rng.random() < 0.01:
+                    second = max(0, second - 1)  # пачки воркеров ложатся не строго по порядку
+                if second != stamp_second:
+                    stamp_second = second
+                    stamp = (start + timedelta(seconds=second)).strftime("%Y-%m-%d %H:%M:%S")
+                out.append(f"[{stamp}] {sources[i]:<15}{kinds[i]}")
+            f.write("".join(out))
+
+def naive(path, since):
+    """Как без инструмента: каждая строка разбирается split'ом"""
+    low = since.strftime("%Y-%m-%d %H:%M:%S")
+    actions, top = Counter(), Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            head, action, _ = line.split(" | ", 2)
+            stamp, ip = head[1:20], head[22:].split(" ", 1)[0]
+            action = action.rstrip()
+            actions[action] += 1
+            if action == "HONEYPOT_TRIGGER" and stamp >= low:
+                top[ip] += 1
+    return actions, top.most_common(10)
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<44} {elapsed:>8.3f} с")
+    return result, elapsed
+
+def bench_follow(path, count):
+    """Сколько от дописи count строк до того, как follow их выдал"""
+    seen, done = [0], threading.Event()
+    query = Query()
+
+    def consumer():
+        for rows in follow(path, query, interval=0.01):
+            seen[0] += len(rows)
+            if seen[0] >= count:
+                done.set()
+                return
+
+    threading.Thread(target=consumer, daemon=True).start()
+    time.sleep(0.2)  # follow встал на конец файла
+    stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tail = "".join(f"[{stamp}] 10.9.9.{i % 250:<8} -> :9001 | {'HONEYPOT_TRIGGER':<20} | Атака перехвачена\n"
+                   for i in range(count))
+    started = time.perf_counter()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(tail)
+    done.wait(30)
+    return time.perf_counter() - started, seen[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк аналитики журнала событий")
+    parser.add_argument("--lines", type=int, default=10_000_000)
+    parser.add_argument("--days", type=float, default=3, help="За сколько суток журнал")
+    parser.add_argument("--keep", metavar="PATH", help="Сохранить журнал здесь (и взять готовый, если есть)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Процессов для второй полной сводки")
+    parser.add_argument("--skip-naive", action="store_true", help="Без построчного разбора на Python")
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(), "security_events.log")
+    if not os.path.exists(path):
+        timed(f"генерация {args.lines} строк", generate, path, args.lines, args.days)
+    size = os.path.getsize(path)
+    print(f"журнал {path}: {size / 2 ** 20:.0f} МБ\n")
+    since = datetime.now() - timedelta(hours=1)
+
+    try:
+        out, _ = timed("grep -c HONEYPOT_TRIGGER", lambda: subprocess.run(
+            ["grep", "-c", "HONEYPOT_TRIGGER", path], capture_output=True, text=True).stdout.strip())
+        print(f"  {out} строк")
+    except OSError:
+        pass
+    if not args.skip_naive:
+        (actions, top), _ = timed("наивно: split по строкам", naive, path, since)
+        print(f"  всего {sum(actions.values())}, за час лидер {top[0] if top else None}")
+
+    reader, _ = timed("mmap + индекс времени", LogReader, path)
+    print(f"  точек индекса {len(reader.index.offsets)}")
+    reader.close()
+    summary, _ = timed("logquery: полная сводка", summarize, [path], Query())
+    print(f"  всего {summary.total}, действий {len(summary.actions)}, минут {len(summary.per_minute)}, "
+          f"погрешность top-k {summary.ips.error}")
+    if args.workers > 1:
+        summary, _ = timed(f"logquery: полная сводка, --workers {args.workers}", summarize, [path], Query(),
+                           1000, args.workers)
+    summary, _ = timed("logquery: --action HONEYPOT_TRIGGER", summarize, [path], Query(actions=["HONEYPOT_TRIGGER"]))
+    print(f"  {summary.total} событий")
+    summary, _ = timed("logquery: --ip 10.0.3.7", summarize, [path], Query(ips=["10.0.3.7"]))
+    print(f"  {summary.total} событий")
+    query = Query(since=since, actions=["HONEYPOT_TRIGGER"])
+    summary, _ = timed("logquery: HONEYPOT_TRIGGER --since 1h --top 10", summarize, [path], query)
+    print(f"  {summary.total} событий, лидер {summary.ips.most_common(1)}")
+
+    tracemalloc.start()
+    summarize([path], Query())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'пик памяти Python на полной сводке':<44} {peak / 2 ** 20:>8.1f} МБ")
+
+    elapsed, seen = bench_follow(path, 100000)
+    print(f"{'follow: подхват 100000 дописанных строк':<44} {elapsed:>8.3f} с ({seen} строк)")
+    if not args.keep:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
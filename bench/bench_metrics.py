@@ -0,0 +1,132 @@
+# bench_metrics.py
+# Цена метрик на один запрос: как было (labels() на каждый вызов), с заранее
+# разрешёнными дочерними метриками и с локальными ячейками потока
+# (proxy/fastmetrics.py; flush() каждые --flush-every секунд из другого потока,
+# его цена входит в замер). Запрос — те же три записи, что у honeypot-порта:
+# REQUESTS_TOTAL, BLOCKED_REQUESTS и REQUEST_DURATION. С --threads N то же из N
+# потоков сразу (толкотня за блокировки значений), с --multiprocess — значения
+# в mmap-файлах, как у воркеров. Последний столбец — одно из итоговых значений:
+# у всех вариантов оно должно совпасть.
+# Пример: python bench/bench_metrics.py 200000 --threads 1 8 --multiprocess
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "proxy"))
+
+PORTS = ("9000", "9001", "9002")
+ACTIONS = ("fake_banner_sent", "direct_proxy")
+
+def make_metrics(prefix):
+    from prometheus_client import CollectorRegistry, Counter, Histogram
+    registry = CollectorRegistry()
+    return registry, (
+        Counter(f"{prefix}_requests_total", "Total requests", ["port", "action"], registry=registry),
+        Counter(f"{prefix}_blocked_total", "Blocked requests", ["port"], registry=registry),
+        Histogram(f"{prefix}_request_duration_seconds", "Request duration", ["port"], registry=registry),
+    )
+
+def labels_each_time(metrics):
+    requests_total, blocked, duration = metrics
+
+    def handle(i):
+        port = PORTS[i % 3]
+        blocked.labels(port=port).inc()
+        requests_total.labels(port=port, action=ACTIONS[i & 1]).inc()
+        duration.labels(port=port).observe(0.0005)
+    return handle, None
+
+def cached_children(metrics):
+    requests_total, blocked, duration = metrics
+    req = {(p, a): requests_total.labels(port=p, action=a) for p in PORTS for a in ACTIONS}
+    blk = {p: blocked.labels(port=p) for p in PORTS}
+    dur = {p: duration.labels(port=p) for p in PORTS}
+
+    def handle(i):
+        port = PORTS[i % 3]
+        blk[port].inc()
+        req[port, ACTIONS[i & 1]].inc()
+        dur[port].observe(0.0005)
+    return handle, None
+
+def local_cells(metrics):
+    from fastmetrics import LocalMetrics
+    requests_total, blocked, duration = metrics
+    local = LocalMetrics()
+    req = {(p, a): local.counter(requests_total, port=p, action=a) for p in PORTS for a in ACTIONS}
+    blk = {p: local.counter(blocked, port=p) for p in PORTS}
+    dur = {p: local.histogram(duration, port=p) for p in PORTS}
+
+    def handle(i):
+        port = PORTS[i % 3]
+        blk[port].inc()
+        req[port, ACTIONS[i & 1]].inc()
+        dur[port].observe(0.0005)
+    return handle, local
+
+VARIANTS = {"labels()": labels_each_time, "кэш дочерних": cached_children, "локальные ячейки": local_cells}
+
+def run(variant, requests, threads, flush_every):
+    registry, metrics = make_metrics("bench_" + str(abs(hash((variant, threads))) % 10 ** 8))
+    handle, local = VARIANTS[variant](metrics)
+    per_thread = requests // threads
+    start = threading.Barrier(threads + 1)
+
+    def worker():
+        start.wait()
+        for i in range(per_thread):
+            handle(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    flusher_done = threading.Event()
+    flushes = [0]
+
+    def flusher():
+        # Как служебный цикл прокси: flush() параллельно с горячим путём
+        while not flusher_done.wait(flush_every):
+            local.flush()
+            flushes[0] += 1
+
+    if local is not None:
+        threading.Thread(target=flusher, daemon=True).start()
+    start.wait()
+    began = time.perf_counter()
+    for t in workers:
+        t.join()
+    if local is not None:
+        flusher_done.set()
+        local.flush()  # последний перенос — часть цены
+    elapsed = time.perf_counter() - began
+    total = registry.get_sample_value(metrics[0]._name + "_total", {"port": "9001", "action": "direct_proxy"}) or 0
+    return elapsed / (per_thread * threads) * 1e9, total, flushes[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Цена записи метрик на запрос: labels() против локальных ячеек")
+    parser.add_argument("requests", type=int, nargs="?", default=300000, help="Запросов на вариант")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8], help="Потоков, пишущих метрики")
+    parser.add_argument("--flush-every", type=float, default=0.1, help="Период flush() для локальных ячеек, сек")
+    parser.add_argument("--multiprocess", action="store_true",
+                        help="Значения в mmap-файлах (PROMETHEUS_MULTIPROC_DIR), как у воркеров")
+    args = parser.parse_args()
+    if args.multiprocess:
+        # До первого импорта prometheus_client: режим выбирается при импорте
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="bench-metrics-")
+
+    print(f"{args.requests} запросов по 3 записи, flush каждые {args.flush_every:g} с"
+          f"{', multiprocess' if args.multiprocess else ''}")
+    print(f"{'потоков':>7} {'вариант':<18} {'нс/запрос':>10} {'ускорение':>10} {'flush':>6}  9001/direct_proxy")
+    for threads in args.threads:
+        base = None
+        for variant in VARIANTS:
+            ns, total, flushes = run(variant, args.requests, threads, args.flush_every)
+            base = base or ns
+            print(f"{threads:>7} {variant:<18} {ns:>10.0f} {base / ns:>9.1f}x {flushes:>6}  {total:g}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# bench_relay.py
+# Пропускная способность passthrough-режима (порты 9001/9002) на объёмных передачах:
+# загрузка клиент -> приложение и выгрузка приложение -> клиент.
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+TRANSFER_MB = 256
+BLOCK = b"x" * 65536
+
+def stub_app(port):
+    """Первый байт задаёт режим: U — принять всё и ответить числом байт, D — отдать TRANSFER_MB"""
+    server = socket.create_server(("127.0.0.1", port), backlog=128, reuse_port=False)
+
+    def handle(conn):
+        with conn:
+            mode = conn.recv(1)
+            if mode == b"U":
+                total = 0
+                buf = bytearray(1 << 20)
+                while True:
+                    n = conn.recv_into(buf)
+                    if not n: break
+                    total += n
+                conn.sendall(str(total).encode())
+            elif mode == b"D":
+                for _ in range(TRANSFER_MB * 16):
+                    conn.sendall(BLOCK)
+
+    def loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=loop, daemon=True).start()
+
+def upload(port):
+    s = socket.create_connection(("127.0.0.1", port))
+    t0 = time.perf_counter()
+    s.sendall(b"U")
+    for _ in range(TRANSFER_MB * 16):
+        s.sendall(BLOCK)
+    s.shutdown(socket.SHUT_WR)  # half-close: ответ должен прийти после него
+    reply = s.recv(64)
+    elapsed = time.perf_counter() - t0
+    s.close()
+    assert int(reply) == TRANSFER_MB * 1024 * 1024, reply
+    return TRANSFER_MB / elapsed
+
+def download(port):
+    s = socket.create_connection(("127.0.0.1", port))
+    t0 = time.perf_counter()
+    s.sendall(b"D")
+    total = 0
+    buf = bytearray(1 << 20)
+    while True:
+        n = s.recv_into(buf)
+        if not n: break
+        total += n
+    elapsed = time.perf_counter() - t0
+    s.close()
+    assert total == TRANSFER_MB * 1024 * 1024, total
+    return TRANSFER_MB / elapsed
+
+def run(engine, splice):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000",
+               PROXY_IP_RATE="0", PROXY_RELAY_SPLICE="1" if splice else "0")
+    proc = subprocess.Popen([sys.executable, PROXY, "--engine", engine, "--passthrough", "9001,9002"],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(1.5)
+        return upload(9001), download(9002)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    stub_app(5001)
+    stub_app(5002)
+    print(f"transfer={TRANSFER_MB} MB")
+    print(f"{'mode':<22} {'upload MB/s':>12} {'download MB/s':>14}")
+    print(f"{'direct (no proxy)':<22} {upload(5001):>12.0f} {download(5002):>14.0f}")
+    for engine, splice in (("threaded", True), ("threaded", False), ("asyncio", False)):
+        up, down = run(engine, splice)
+        name = f"{engine}{' + splice' if splice else ''}"
+        print(f"{name:<22} {up:>12.0f} {down:>14.0f}")
+
+if __name__ == "__main__":
+    main()
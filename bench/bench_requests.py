@@ -0,0 +1,130 @@
+# bench_requests.py
+# Чтение запросов на 9000: (1) крупные POST (Content-Length и chunked) — MB/s до
+# приложения и пиковая память прокси; (2) «капельные» заголовки (по байту с паузой),
+# как у медленных клиентов и slowloris, — CPU прокси на запрос.
+# Заглушка приложения читает тело целиком и отвечает его длиной.
+# Аргументы: движок, путь к прокси (для сравнения с другой версией), размеры POST в МБ.
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+
+async def stub_app(reader, writer):
+    try:
+        while True:
+            head = (await reader.readuntil(b"\r\n\r\n")).lower()
+            received = 0
+            if b"transfer-encoding: chunked" in head:
+                while True:
+                    size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                    if not size:
+                        await reader.readuntil(b"\r\n")
+                        break
+                    received += len(await reader.readexactly(size))
+                    await reader.readexactly(2)
+            else:
+                for line in head.split(b"\r\n"):
+                    if line.startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                        while received < length:
+                            chunk = await reader.read(min(length - received, 1 << 20))
+                            if not chunk:
+                                return
+                            received += len(chunk)
+            body = b"%d" % received
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+def proc_stats(pid):
+    """(CPU-секунды, пиковый RSS в МБ) процесса"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/status") as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+    return cpu, peak / 1024
+
+async def upload(size, chunked):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 9000)
+    block = os.urandom(1 << 16)
+    if chunked:
+        writer.write(b"POST /up HTTP/1.1\r\nHost: bench\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+    else:
+        writer.write(b"POST /up HTTP/1.1\r\nHost: bench\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % size)
+    sent = 0
+    while sent < size:
+        piece = block[:size - sent]
+        writer.write(b"%x\r\n%s\r\n" % (len(piece), piece) if chunked else piece)
+        await writer.drain()
+        sent += len(piece)
+    if chunked:
+        writer.write(b"0\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    if b"chunked" in head.lower():
+        # Прокси переписывает ответы потоком и отдаёт их chunked
+        body = body.split(b"\r\n")[1] if body else b""
+    return int(body or 0)
+
+async def drip(header_size, delay):
+    """Заголовок по одному байту с паузой delay"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", 9000)
+    request = (b"GET / HTTP/1.1\r\nHost: bench\r\nX-Pad: " + b"a" * header_size +
+               b"\r\nConnection: close\r\n\r\n")
+    for i in range(len(request)):
+        writer.write(request[i:i + 1])
+        await writer.drain()
+        await asyncio.sleep(delay)
+    status = (await reader.read()).split(b"\r\n", 1)[0]
+    writer.close()
+    return status
+
+async def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else "asyncio"
+    proxy = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else PROXY
+    sizes = [int(n) for n in (sys.argv[3] if len(sys.argv) > 3 else "1,16,64").split(",")]
+    app = await asyncio.start_server(stub_app, "127.0.0.1", 5000, backlog=4096, reuse_address=True)
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000",
+               PROXY_IP_RATE="0")
+    proc = subprocess.Popen([sys.executable, proxy, "--engine", engine], cwd=os.path.dirname(proxy),
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with app:
+            await asyncio.sleep(1.5)
+            print(f"engine={engine}, proxy={proxy}")
+            print(f"{'upload':<16} {'MB':>5} {'received':>10} {'MB/s':>8} {'peak RSS MB':>12}")
+            for chunked in (False, True):
+                for mb in sizes:
+                    t0 = time.perf_counter()
+                    try:
+                        received = await upload(mb << 20, chunked)
+                    except (ConnectionError, ValueError, IndexError):
+                        received = -1  # прокси оборвал соединение или ответил не тем
+                    rate = mb / (time.perf_counter() - t0)
+                    print(f"{'chunked' if chunked else 'content-length':<16} {mb:>5} {received:>10} {rate:>8.1f} "
+                          f"{proc_stats(proc.pid)[1]:>12.1f}")
+
+            clients, header_size, delay = 50, 2000, 0.0005
+            cpu0 = proc_stats(proc.pid)[0]
+            t0 = time.perf_counter()
+            statuses = await asyncio.gather(*(drip(header_size, delay) for _ in range(clients)))
+            cpu = proc_stats(proc.pid)[0] - cpu0
+            ok = sum(s.endswith(b"200 OK") for s in statuses)
+            print(f"drip-fed: {clients} clients x {header_size + 60} B headers, byte by byte: "
+                  f"{ok} ok, {time.perf_counter() - t0:.1f} s, proxy CPU {cpu * 1000 / clients:.1f} ms/request")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# bench_restart.py
+# Нагрузка loadgen на 9000-9002 сквозь перезапуски прокси: сколько соединений
+# получили отказ (connect), обрыв (reset/empty) или таймаут. Способы перезапуска:
+# handoff — новый процесс с тем же --handoff забирает слушающие сокеты, старый
+# дорабатывает свои соединения и выходит сам; stop-start — SIGTERM, ожидание выхода
+# и запуск нового, как docker restart (порты закрыты, пока новый не привяжется).
+# Нужны свободные 5000-5002, 9000-9002 и --metrics-port.
+# Пример: python bench/bench_restart.py --restarts 5 --duration 10 --engine asyncio threaded
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+
+from bench_suite import start_app, stop, wait_ports
+from loadgen import print_summary, raise_fd_limit, run_load, summarize
+
+METHODS = ("handoff", "stop-start")
+
+def start_proxy(engine, handoff, metrics_port, log_dir):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=log_dir, METRICS_PORT=str(metrics_port),
+               PROXY_IP_RATE="0", PROXY_DETECT="0")
+    argv = [sys.executable, PROXY, "--engine", engine] + (["--handoff", handoff] if handoff else [])
+    return subprocess.Popen(argv, cwd=os.path.dirname(PROXY), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def restart(method, proxy, engine, handoff, metrics_port, log_dir):
+    """Сменить процесс прокси -> (новый процесс, код выхода старого, секунд до его выхода)"""
+    began = time.monotonic()
+    if method == "handoff":
+        new = start_proxy(engine, handoff, metrics_port, log_dir)
+        code = proxy.wait(60)  # старый отдаёт сокеты, дорабатывает и выходит сам
+    else:
+        proxy.terminate()
+        code = proxy.wait(60)
+        new = start_proxy(engine, None, metrics_port, log_dir)
+    return new, code, time.monotonic() - began
+
+def run(method, engine, restarts, options, metrics_port):
+    log_dir = tempfile.mkdtemp(prefix="bench-restart-")
+    handoff = os.path.join(log_dir, "handoff.sock") if method == "handoff" else None
+    proxy = start_proxy(engine, handoff, metrics_port, log_dir)
+    wait_ports([9000, 9001, 9002], 15)
+    result = {}
+    load = threading.Thread(target=lambda: result.update(out=asyncio.run(run_load(**options))))
+    load.start()
+    exits = []
+    try:
+        # Перезапуски — только внутри замера: ошибки прогрева loadgen не считает
+        time.sleep(options["warmup"])
+        interval = options["duration"] / (restarts + 1)
+        for _ in range(restarts):
+            time.sleep(interval)
+            proxy, code, took = restart(method, proxy, engine, handoff, metrics_port, log_dir)
+            exits.append((code, took))
+        load.join()
+    finally:
+        stop([proxy])
+    return summarize(*result["out"]), exits
+
+def main():
+    parser = argparse.ArgumentParser(description="Отказы и обрывы соединений при перезапуске прокси под нагрузкой")
+    parser.add_argument("--restarts", type=int, default=5, help="Перезапусков за замер")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность замера, сек")
+    parser.add_argument("--warmup", type=float, default=1, help="Прогрев перед замером, сек")
+    parser.add_argument("--method", choices=METHODS, nargs="+", default=list(METHODS))
+    parser.add_argument("--engine", choices=("asyncio", "threaded"), nargs="+", default=["asyncio"])
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=int, default=30, help="closed: соединений в полёте, всего")
+    parser.add_argument("--rate", type=float, default=600, help="open: запросов в секунду, всего")
+    parser.add_argument("--metrics-port", type=int, default=18000)
+    args = parser.parse_args()
+
+    raise_fd_limit(4096)
+    options = dict(mode=args.mode, concurrency=args.concurrency, rate=args.rate, duration=args.duration,
+                   warmup=args.warmup, timeout=5.0)
+    app = start_app([])
+    try:
+        for engine in args.engine:
+            for method in args.method:
+                print(f"\n== {engine}, {method}: {args.restarts} перезапусков за {args.duration:g}+{args.warmup:g} с")
+                summary, exits = run(method, engine, args.restarts, options, args.metrics_port)
+                print_summary(summary)
+                total = summary["total"]
+                print(f"отказов в подключении: {total['error_kinds'].get('connect', 0)}, "
+                      f"всего ошибок: {total['errors']} из {total['ok'] + total['errors']}")
+                print("старые процессы (код выхода, с до выхода): "
+                      + ", ".join(f"{code} {took:.1f}" for code, took in exits))
+    finally:
+        stop([app])
+
+if __name__ == "__main__":
+    main()
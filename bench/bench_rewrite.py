@@ -0,0 +1,102 @@
+# bench_rewrite.py
+# Регрессионные случаи потоковой переписки ответа: промежуточные ответы 1xx,
+# chunked для клиента HTTP/1.0, оборванное тело. Каждый ответ upstream подаётся
+# в ResponseRewriter целиком, по байту и кусками по 7 байт — проверка обязана
+# пройти при любой нарезке. Код выхода 1, если хоть один случай не прошёл.
+# Пример: python bench/bench_rewrite.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "proxy"))
+from rewrite import ChunkedDecoder, ResponseRewriter  # noqa: E402
+from rules import RuleSet  # noqa: E402
+
+RULES = RuleSet(headers=[{"name": "Server", "value": "nginx"}],
+                literals=[{"name": "erp", "match": "Warehouse ERP", "replace": "Portal"}])
+SPLITS = (None, 1, 7)
+
+OK_200 = (b"HTTP/1.1 200 OK\r\nServer: Warehouse-Internal-HTTPd/2.4\r\nContent-Length: 17\r\n\r\n"
+          b"Warehouse ERP 2.4")
+CHUNKED_GZIP = (b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nTransfer-Encoding: chunked\r\n\r\n"
+                b"5\r\n\x1f\x8b\x08\x00\x00\r\n3\r\nabc\r\n0\r\n\r\n")
+
+def run(upstream, split, closed=False, **options):
+    """-> (байты клиенту, переписчик) для ответа upstream, поданного кусками split"""
+    rewriter = ResponseRewriter(RULES.header_rules, RULES.replacer(), **options)
+    pieces = [upstream] if split is None else [upstream[i:i + split] for i in range(0, len(upstream), split)]
+    out = b""
+    for piece in pieces:
+        out += rewriter.feed(piece)
+    if closed and not rewriter.done:
+        out += rewriter.finish()
+    return out, rewriter
+
+def final_body(out):
+    """Тело окончательного (200) ответа клиенту, без chunked-разметки"""
+    head, _, body = out[out.index(b"HTTP/1.1 200 OK"):].partition(b"\r\n\r\n")
+    if b"transfer-encoding: chunked" in head.lower():
+        decoder = ChunkedDecoder()
+        body = decoder.feed(body)
+        return body if decoder.done else None
+    return body
+
+def interim_then_final(out, rw):
+    return (out.startswith(b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK\r\n")
+            and final_body(out) == b"Portal 2.4"
+            and rw.done and rw.client_reusable and not rw.leftover)
+
+def early_hints_rewritten(out, rw):
+    head, _, rest = out.partition(b"\r\n\r\n")
+    return (head == b"HTTP/1.1 103 Early Hints\r\nServer: nginx\r\nLink: </app.css>; rel=preload"
+            and rest.startswith(b"HTTP/1.1 200 OK\r\n") and final_body(rest) == b"Portal 2.4" and rw.done)
+
+def interim_dropped_for_http10(out, rw):
+    return (out.startswith(b"HTTP/1.1 200 OK\r\n") and b"100 Continue" not in out
+            and out.endswith(b"\r\n\r\nPortal 2.4") and rw.done)
+
+def dechunked_for_http10(out, rw):
+    head, _, body = out.partition(b"\r\n\r\n")
+    return (b"transfer-encoding" not in head.lower() and b"Connection: close" in head
+            and body == b"\x1f\x8b\x08\x00\x00abc" and rw.done and not rw.client_reusable)
+
+def chunked_kept_for_http11(out, rw):
+    return out.endswith(b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+                        b"5\r\n\x1f\x8b\x08\x00\x00\r\n3\r\nabc\r\n0\r\n\r\n") and rw.done
+
+def truncated_without_last_chunk(out, rw):
+    return rw.truncated and not out.endswith(b"0\r\n\r\n") and not rw.client_reusable
+
+def switching_protocols_final(out, rw):
+    return out.startswith(b"HTTP/1.1 101 Switching Protocols\r\n") and rw.done and rw.leftover == b"\x81\x00"
+
+CASES = [
+    ("100 Continue, затем 200", b"HTTP/1.1 100 Continue\r\n\r\n" + OK_200,
+     dict(keep_alive=True), interim_then_final),
+    ("103 Early Hints по правилам", b"HTTP/1.1 103 Early Hints\r\nServer: Warehouse-Internal-HTTPd/2.4\r\n"
+     b"Link: </app.css>; rel=preload\r\n\r\n" + OK_200, dict(keep_alive=True), early_hints_rewritten),
+    ("100 Continue клиенту HTTP/1.0", b"HTTP/1.1 100 Continue\r\n\r\n" + OK_200,
+     dict(chunked_ok=False), interim_dropped_for_http10),
+    ("gzip chunked клиенту HTTP/1.0", CHUNKED_GZIP, dict(chunked_ok=False, keep_alive=True), dechunked_for_http10),
+    ("gzip chunked клиенту HTTP/1.1", CHUNKED_GZIP, dict(), chunked_kept_for_http11),
+    ("оборванное chunked-тело", b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n20\r\nWarehouse ERP",
+     dict(closed=True, keep_alive=True), truncated_without_last_chunk),
+    ("101 Switching Protocols", b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n\r\n\x81\x00",
+     dict(), switching_protocols_final),
+]
+
+def main():
+    failed = 0
+    for name, upstream, options, check in CASES:
+        for split in SPLITS:
+            out, rw = run(upstream, split, **options)
+            if not check(out, rw):
+                failed += 1
+                print(f"FAIL {name}, " + (f"кусками по {split}" if split else "целиком") + f"\n     {out!r}")
+                break
+        else:
+            print(f"OK   {name}")
+    print(f"\n{len(CASES) - failed} из {len(CASES)} случаев")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
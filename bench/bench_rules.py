@@ -0,0 +1,66 @@
+# bench_rules.py
+# Пропускная способность движка правил (MB/s) в зависимости от числа правил.
+# Сравнение: автомат Ахо-Корасик (pyahocorasick), trie-шаблон re и отдельный re.sub на правило.
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "proxy"))
+import rules  # noqa: E402
+from rules import RuleSet  # noqa: E402
+
+BODY_MB = 8
+CHUNK = 65536
+RULE_COUNTS = [1, 10, 100, 1000, 5000]
+
+def random_word(rng):
+    return "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(6, 24)))
+
+def make_body(rng, words, size):
+    parts, total = [], 0
+    vocab = [random_word(rng) for _ in range(2000)]
+    while total < size:
+        # ~1% слов — совпадения с правилами
+        word = rng.choice(words) if words and rng.random() < 0.01 else rng.choice(vocab)
+        parts.append(word)
+        total += len(word) + 1
+    return " ".join(parts).encode()[:size]
+
+def bench_engine(rules, body):
+    replacer = rules.replacer()
+    t0 = time.perf_counter()
+    for i in range(0, len(body), CHUNK):
+        replacer.feed(body[i:i + CHUNK])
+    replacer.flush()
+    return len(body) / (time.perf_counter() - t0) / 1e6
+
+def bench_naive(literals, body):
+    compiled = [(re.compile(re.escape(l["match"].encode())), l["replace"].encode()) for l in literals]
+    t0 = time.perf_counter()
+    text = body
+    for pattern, repl in compiled:
+        text = pattern.sub(repl, text)
+    return len(body) / (time.perf_counter() - t0) / 1e6
+
+def main():
+    rng = random.Random(42)
+    print(f"body={BODY_MB} MB, chunk={CHUNK} B")
+    print(f"{'rules':>6} {'compile ms':>11} {'aho MB/s':>9} {'trie MB/s':>10} {'naive MB/s':>11}")
+    for count in RULE_COUNTS:
+        words = list({random_word(rng) for _ in range(count)})
+        literals = [{"name": f"r{i}", "match": w, "replace": "X" * len(w), "ignore_case": i % 2 == 1}
+                    for i, w in enumerate(words)]
+        body = make_body(rng, words, BODY_MB * 1024 * 1024)
+        t0 = time.perf_counter()
+        ruleset = RuleSet(literals=literals)
+        compile_ms = (time.perf_counter() - t0) * 1000
+        aho = bench_engine(ruleset, body) if rules.ahocorasick else float("nan")
+        trie = bench_engine(RuleSet(literals=literals, use_automaton=False), body) if count <= 1000 else float("nan")
+        naive = bench_naive(literals, body) if count <= 100 else float("nan")
+        print(f"{count:>6} {compile_ms:>11.1f} {aho:>9.1f} {trie:>10.1f} {naive:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# bench_scanner.py
+# Скорость сканера на локальном стенде: три заглушки сервисов (баннер SSH, HTTP,
+# молчащая консоль) на 127.0.0.1. Последовательный режим — на узком окне портов
+# (полный диапазон шёл бы часами), двухфазный (connect-обход + пробы открытых) —
+# на всём 1-65535.
+# Аргументы: concurrency проб, ширина окна для последовательного режима.
+import os
+import socket
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scanner"))
+
+from scanner import raise_fd_limit, scan_port, scan_ports_async
+
+BASE_PORT = 23000
+HTTP_RESPONSE = (b"HTTP/1.1 200 OK\r\nServer: Stand/1.0\r\nContent-Length: 12\r\n"
+                 b"Connection: close\r\n\r\nhello stand\n")
+
+def serve(port, handler):
+    server = socket.create_server(("127.0.0.1", port), backlog=512)
+
+    def loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handler, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=loop, daemon=True).start()
+
+def ssh(conn):
+    with conn:
+        conn.sendall(b"SSH-2.0-OpenSSH_8.9\r\n")
+        conn.settimeout(10)
+        try:
+            conn.recv(1024)
+        except OSError:
+            pass
+
+def http(conn):
+    with conn:
+        conn.settimeout(10)
+        try:
+            if conn.recv(1024):
+                conn.sendall(HTTP_RESPONSE)
+        except OSError:
+            pass
+
+def console(conn):
+    with conn:
+        conn.settimeout(10)
+        try:
+            if conn.recv(1024):
+                conn.sendall(b"Login: \nAccess Denied.\n")
+        except OSError:
+            pass
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    window = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    for offset, handler in enumerate((ssh, http, console)):
+        serve(BASE_PORT + offset, handler)
+    raise_fd_limit(concurrency + 64)
+
+    timings = []
+    for offset, name in enumerate(("ssh", "http", "console")):
+        t0 = time.perf_counter()
+        guess = scan_port("127.0.0.1", BASE_PORT + offset)["service_guess"]
+        timings.append(f"{name} {time.perf_counter() - t0:.2f} s ({guess})")
+    print("per port: " + ", ".join(timings))
+
+    ports = list(range(BASE_PORT, BASE_PORT + window))
+    t0 = time.perf_counter()
+    found = [p for p in ports if scan_port("127.0.0.1", p)["open"]]
+    elapsed = time.perf_counter() - t0
+    print(f"sync   {len(ports):>6} ports: {elapsed:7.1f} s  open={found}")
+
+    results = []
+    t0 = time.perf_counter()
+    phases = scan_ports_async("127.0.0.1", list(range(1, 65536)), results.append, concurrency=concurrency)
+    elapsed = time.perf_counter() - t0
+    found = sorted(r["port"] for r in results if r["open"] and BASE_PORT <= r["port"] < BASE_PORT + 3)
+    print(f"async   65535 ports: {elapsed:7.1f} s  ({65535 / elapsed:.0f} ports/s)  stand ports open={found}")
+    print(f"        sweep {phases['sweep_seconds']:.1f} s {phases['sweep']}, probe {phases['probe_seconds']:.1f} s "
+          f"({len(results)} open ports)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# bench_shard.py
+# Масштабирование многохостового сканирования по процессам: стенд — отдельный
+# процесс с слушающими сокетами на hosts адресах 127.0.1.x (по PORTS_PER_HOST
+# портов на адрес, баннер SSH). Сканируется 127.0.1.0/<маска> x диапазон портов
+# с --workers 1, 2, 4, ...; печатается проверок/с и найдено ли всё.
+# Аргументы: маска подсети (26 — 62 хоста), число портов, список workers через запятую.
+import asyncio
+import ipaddress
+import multiprocessing
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scanner"))
+
+from scanner import raise_fd_limit, scan_sharded, scan_targets  # noqa: E402
+from targets import expand_hosts, interleave  # noqa: E402
+
+BASE_PORT = 24000
+PORTS_PER_HOST = 4
+
+async def banner(reader, writer):
+    writer.write(b"SSH-2.0-OpenSSH_8.9\r\n")
+    try:
+        await writer.drain()
+        await asyncio.wait_for(reader.read(1024), 5)
+    except (OSError, asyncio.TimeoutError):
+        pass
+    writer.close()
+
+def stand(hosts, ready):
+    raise_fd_limit(len(hosts) * PORTS_PER_HOST + 4096)
+
+    async def run():
+        servers = [await asyncio.start_server(banner, host, BASE_PORT + i * 97, backlog=1024)
+                   for host in hosts for i in range(PORTS_PER_HOST)]
+        ready.set()
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+    asyncio.run(run())
+
+def main():
+    prefix = int(sys.argv[1]) if len(sys.argv) > 1 else 26
+    port_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    worker_counts = [int(n) for n in (sys.argv[3] if len(sys.argv) > 3 else "1,2,4").split(",")]
+    hosts = expand_hosts(str(ipaddress.ip_network(f"127.0.1.0/{prefix}")))
+    ports = list(range(BASE_PORT, BASE_PORT + port_count))
+    expected = len(hosts) * sum(1 for i in range(PORTS_PER_HOST) if BASE_PORT + i * 97 < BASE_PORT + port_count)
+
+    ready = multiprocessing.Event()
+    proc = multiprocessing.Process(target=stand, args=(hosts, ready), daemon=True)
+    proc.start()
+    ready.wait(30)
+    raise_fd_limit(8192)
+    total = len(hosts) * len(ports)
+    print(f"stand: {len(hosts)} hosts x {PORTS_PER_HOST} listeners; scan: {total} (host, port) pairs, "
+          f"{os.cpu_count()} CPU")
+    try:
+        for workers in worker_counts:
+            found = []
+            t0 = time.perf_counter()
+            if workers == 1:
+                phases = scan_targets(interleave(hosts, ports), lambda h, r: found.append(r["open"]))
+            else:
+                phases = scan_sharded(hosts, ports, workers, lambda h, r: found.append(r["open"]))
+            elapsed = time.perf_counter() - t0
+            print(f"workers={workers}: {elapsed:6.1f} s  {total / elapsed:8.0f} checks/s  "
+                  f"open {sum(found)}/{expected}  sweep {phases['sweep_seconds']:.1f} s, "
+                  f"probe {phases['probe_seconds']:.1f} s")
+    finally:
+        proc.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# bench_stages.py
+# Цена диагностики: (1) микро-замер — накладные расходы секундомера стадий на один
+# запрос, выключенного и включённого; (2) запросы/сек через 9000 (keep-alive) с
+# PROXY_STAGE_TIMING=0/1 и во время работы сэмплирующего профайлера.
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+sys.path.insert(0, os.path.join(ROOT, "proxy"))
+
+from prometheus_client import CollectorRegistry, Histogram
+from stages import new_clock
+from bench_keepalive import REQUEST, read_response, stub_app
+
+def one_request(enabled, histogram):
+    # Те же вызовы, что делает forward_http на ответ из одного куска
+    clock = new_clock(enabled)
+    clock.lap("upstream_connect")
+    clock.add("upstream_read", clock.lap("upstream_first_byte"))
+    clock.lap("rewrite")
+    clock.lap("client_write")
+    clock.lap("rewrite")
+    clock.lap("client_write")
+    clock.skip()
+    clock.lap("log_write")
+    clock.observe(histogram, "9000")
+
+def micro(n=100000):
+    histogram = Histogram("bench_stage_seconds", "bench", ["port", "stage"], registry=CollectorRegistry())
+    for enabled in (False, True):
+        seconds = timeit.timeit(lambda: one_request(enabled, histogram), number=n)
+        print(f"stage timing {'on ' if enabled else 'off'}: {seconds / n * 1e6:6.2f} us/request")
+
+async def client(deadline, counter):
+    reader, writer = await asyncio.open_connection("127.0.0.1", 9000)
+    try:
+        while time.perf_counter() < deadline:
+            writer.write(REQUEST)
+            await read_response(reader)
+            counter[0] += 1
+    except (OSError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+def profile(seconds):
+    urllib.request.urlopen(f"http://127.0.0.1:18000/debug/profile?seconds={seconds}", timeout=seconds + 10).read()
+
+async def end_to_end(label, env_extra, concurrency, duration, with_profile=False):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000",
+               PROXY_IP_RATE="0", PROXY_KEEPALIVE_MAX_REQUESTS="1000000", **env_extra)
+    proc = subprocess.Popen([sys.executable, PROXY], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.sleep(1.5)
+        counter = [0]
+        deadline = time.perf_counter() + duration
+        jobs = [client(deadline, counter) for _ in range(concurrency)]
+        if with_profile:
+            jobs.append(asyncio.to_thread(profile, duration))
+        await asyncio.gather(*jobs)
+        print(f"{label:<22} {counter[0] / duration:>8.0f} req/s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    micro()
+    app = await asyncio.start_server(stub_app, "127.0.0.1", 5000, backlog=4096, reuse_address=True)
+    async with app:
+        print(f"keep-alive clients={concurrency}, duration={duration}s")
+        await end_to_end("stage timing off", {"PROXY_STAGE_TIMING": "0"}, concurrency, duration)
+        await end_to_end("stage timing on", {"PROXY_STAGE_TIMING": "1"}, concurrency, duration)
+        await end_to_end("on + profiler running", {"PROXY_STAGE_TIMING": "1", "PROXY_PROFILER": "1"},
+                         concurrency, duration, with_profile=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+# bench_stream.py
+# Время до первого байта и пиковый RSS прокси на ответах в несколько мегабайт.
+# При потоковой переписке обе величины не должны расти с размером тела.
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+SIZES_MB = [1, 8, 32]
+BODY_SIZE = {"value": 0}
+
+LINE = b"<p>Warehouse ERP v2.4 | Powered by Python Legacy Backend</p>\n"
+
+async def stub_app(reader, writer):
+    try:
+        await reader.read(1024)
+        size = BODY_SIZE["value"]
+        writer.write(b"HTTP/1.1 200 OK\r\nServer: Warehouse-Internal-HTTPd/2.4\r\n"
+                     b"Content-Type: text/html\r\nContent-Length: %d\r\n\r\n" % size)
+        block = LINE * (65536 // len(LINE))
+        sent = 0
+        while sent < size:
+            part = block[:size - sent]
+            writer.write(part)
+            await writer.drain()
+            sent += len(part)
+    finally:
+        writer.close()
+
+def peak_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+async def fetch(port):
+    t0 = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET / HTTP/1.1\r\nHost: bench\r\n\r\n")
+    await writer.drain()
+    first = await reader.read(65536)
+    ttfb = time.perf_counter() - t0
+    total = len(first)
+    while True:
+        chunk = await reader.read(65536)
+        if not chunk: break
+        total += len(chunk)
+    writer.close()
+    return ttfb, time.perf_counter() - t0, total
+
+async def main():
+    engine = sys.argv[1] if len(sys.argv) > 1 else "asyncio"
+    app = await asyncio.start_server(stub_app, "127.0.0.1", 5000, reuse_address=True)
+    async with app:
+        print(f"engine={engine}")
+        print(f"{'body MB':>8} {'ttfb ms':>8} {'total s':>8} {'MB/s':>8} {'proxy peak RSS MB':>18}")
+        for size_mb in SIZES_MB:
+            BODY_SIZE["value"] = size_mb * 1024 * 1024
+            env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000",
+                       PROXY_IP_RATE="0")
+            proc = subprocess.Popen([sys.executable, PROXY, "--engine", engine],
+                                    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                await asyncio.sleep(1.5)
+                ttfb, total, nbytes = await fetch(9000)
+                rss = peak_rss_kb(proc.pid) / 1024
+                print(f"{size_mb:>8} {ttfb * 1000:>8.2f} {total:>8.2f} {nbytes / total / 1e6:>8.1f} {rss:>18.1f}")
+            finally:
+                proc.terminate()
+                proc.wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
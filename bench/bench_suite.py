@@ -0,0 +1,178 @@
+# bench_suite.py
+# Набор сценариев нагрузки на настоящем стенде: поднимает app/app.py и
+# proxy/security.py локально, прогоняет сценарии loadgen и записывает результаты
+# вместе с коммитом в JSON. --compare сравнивает с файлом прошлого прогона и
+# отмечает регрессии: пропускная способность ниже или p99 выше, чем допускает
+# --tolerance (код выхода 1). Нужны свободные 5000-5002, 9000-9002 и --metrics-port.
+# Сценарий может задать настройки приложения (app): большие тела, медленный upstream —
+# приложение тогда перезапускается с ними, прокси остаётся прежним.
+# Пример: python bench/bench_suite.py -o base.json; (изменения); python bench/bench_suite.py --compare base.json
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app", "app.py")
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+
+from loadgen import print_summary, raise_fd_limit, run_processes, summarize
+
+# Сценарии: имя -> параметры run_load (длительность и прогрев задаются общими)
+# и необязательные аргументы app/app.py в "app"
+SCENARIOS = {
+    "get_closed": dict(ports=[9000], mode="closed", concurrency=20, payload="get"),
+    "get_open": dict(ports=[9000], mode="open", rate=100, payload="get"),
+    "post_closed": dict(ports=[9000], mode="closed", concurrency=10, payload="post", body_size=16384),
+    "raw_closed": dict(ports=[9001, 9002], mode="closed", concurrency=10, payload="raw"),
+    "drip": dict(ports=[9000], mode="closed", concurrency=10, payload="drip", drip_delay=0.002),
+    "get_large": dict(ports=[9000], mode="closed", concurrency=10, payload="get",
+                      app=["--body-size", "1048576"]),
+    "get_slow_upstream": dict(ports=[9000], mode="open", rate=200, payload="get",
+                              app=["--latency-ms", "50", "--jitter-ms", "20"]),
+}
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+def wait_ports(ports, timeout):
+    deadline = time.monotonic() + timeout
+    for port in ports:
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Порт {port} не открылся за {timeout} сек")
+                time.sleep(0.1)
+
+def start_app(app_args):
+    app = subprocess.Popen([sys.executable, APP] + app_args, cwd=os.path.dirname(APP),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ports([5000, 5001, 5002], 15)
+    except RuntimeError:
+        stop([app])
+        raise
+    return app
+
+def start_proxy(args):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(),
+               METRICS_PORT=str(args.metrics_port), PROXY_IP_RATE="0")
+    proxy = subprocess.Popen([sys.executable, PROXY, "--engine", args.engine, "--workers", str(args.workers)],
+                             cwd=os.path.dirname(PROXY), env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ports([9000, 9001, 9002], 15)
+    except RuntimeError:
+        stop([proxy])
+        raise
+    return proxy
+
+def stop(procs):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+def compare(results, baseline, tolerance):
+    """Таблица изменений относительно baseline -> есть ли регрессии"""
+    print(f"\nСравнение с {baseline.get('commit', '?')} ({baseline.get('date', '?')}), допуск {tolerance:.0%}")
+    print(f"{'scenario':<18} {'req/s':>9} {'было':>9} {'Δ':>7} {'p99 ms':>9} {'было':>9} {'Δ':>7} {'errors':>7} {'было':>6}")
+    regressed = False
+    for name, scenario in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        new_total, old_total = scenario["ports"]["total"], old["ports"]["total"]
+        tp, old_tp = new_total["throughput"], old_total["throughput"]
+        p99, old_p99 = new_total["latency_ms"]["p99"], old_total["latency_ms"]["p99"]
+        tp_delta = (tp - old_tp) / old_tp if old_tp else 0.0
+        p99_delta = (p99 - old_p99) / old_p99 if old_p99 else 0.0
+        bad = tp_delta < -tolerance or p99_delta > tolerance
+        regressed |= bad
+        print(f"{name:<18} {tp:>9.1f} {old_tp:>9.1f} {tp_delta:>+7.1%} {p99:>9.2f} {old_p99:>9.2f} {p99_delta:>+7.1%} "
+              f"{new_total['errors']:>7} {old_total['errors']:>6}" + ("  РЕГРЕССИЯ" if bad else ""))
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Сценарии нагрузки на стенд app.py + security.py")
+    parser.add_argument("--duration", type=float, default=5, help="Длительность замера сценария, сек")
+    parser.add_argument("--warmup", type=float, default=1, help="Прогрев перед замером, сек")
+    parser.add_argument("--only", help="Только эти сценарии, через запятую: " + ",".join(SCENARIOS))
+    parser.add_argument("--engine", choices=("asyncio", "threaded"), default="asyncio")
+    parser.add_argument("--workers", type=int, default=1, help="--workers прокси")
+    parser.add_argument("--procs", type=int, default=1, help="Процессов генератора нагрузки")
+    parser.add_argument("--metrics-port", type=int, default=18000)
+    parser.add_argument("-o", "--output", default="bench_suite.json", help="Куда записать результаты")
+    parser.add_argument("--compare", metavar="FILE", help="Результаты прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допустимое ухудшение, доля (0.1 — 10%%)")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(unknown)}")
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    raise_fd_limit(4096)
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "engine": args.engine,
+        "workers": args.workers,
+        "procs": args.procs,
+        "duration": args.duration,
+        "scenarios": {},
+    }
+    print(f"commit {results['commit']}, engine={args.engine}, workers={args.workers}, "
+          f"{args.duration:g}+{args.warmup:g} s на сценарий")
+    app_args = []
+    app = start_app(app_args)
+    proxy = None
+    try:
+        proxy = start_proxy(args)
+        for name in names:
+            options = dict(SCENARIOS[name], duration=args.duration, warmup=args.warmup)
+            wanted = options.pop("app", [])
+            if wanted != app_args:
+                stop([app])
+                app_args = wanted
+                app = start_app(app_args)
+            print(f"\n== {name}: {', '.join(f'{k}={v}' for k, v in SCENARIOS[name].items())}")
+            summary = summarize(*run_processes(args.procs, **options))
+            print_summary(summary)
+            results["scenarios"][name] = {"options": SCENARIOS[name], "ports": summary}
+    finally:
+        stop([p for p in (proxy, app) if p is not None])
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n[+] Результаты записаны в {args.output}")
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench_workers.py
+# Масштабирование многопроцессного режима (--workers N): запросов/сек на 9000
+# при переписке тела ответа (упирается в CPU) для разного числа воркеров.
+# Заглушка приложения и клиенты работают в отдельных процессах, чтобы не делить
+# ядро с прокси. Линейный рост возможен только при свободных ядрах: на машине
+# с os.cpu_count() ядер прокси, заглушка и клиенты конкурируют между собой.
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, "proxy", "security.py")
+
+CHUNK = b"<p>Powered by Python Legacy Backend. Warehouse ERP v2.4 inventory row.</p>\n"
+BODY = CHUNK * (64 * 1024 // len(CHUNK))
+APP_RESPONSE = (b"HTTP/1.1 200 OK\r\nServer: Warehouse-Internal-HTTPd/2.4\r\nContent-Type: text/html\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(BODY) + BODY)
+REQUEST = b"GET / HTTP/1.1\r\nHost: bench\r\n\r\n"
+
+async def stub_app(reader, writer):
+    try:
+        while await reader.readuntil(b"\r\n\r\n"):
+            writer.write(APP_RESPONSE)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+def run_app():
+    async def main():
+        server = await asyncio.start_server(stub_app, "127.0.0.1", 5000, backlog=4096, reuse_address=True)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    if b"chunked" in head.lower():
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                return
+    length = [l for l in head.split(b"\r\n") if l.lower().startswith(b"content-length:")]
+    await reader.readexactly(int(length[0].split(b":")[1]))
+
+def run_clients(connections, duration):
+    """Процесс-клиент: keep-alive соединения, по запросу за раз. -> число ответов"""
+    async def one(deadline):
+        done = 0
+        while time.perf_counter() < deadline:
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", 9000)
+                while time.perf_counter() < deadline:
+                    writer.write(REQUEST)
+                    await read_response(reader)
+                    done += 1
+                writer.close()
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+        return done
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        return sum(await asyncio.gather(*(one(deadline) for _ in range(connections))))
+    return asyncio.run(main())
+
+def wait_ready(url, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+
+def run_workers(workers, clients, connections, duration):
+    env = dict(os.environ, TARGET_HOST="127.0.0.1", LOG_DIR=tempfile.mkdtemp(), METRICS_PORT="18000", PROXY_IP_RATE="0")
+    proc = subprocess.Popen([sys.executable, PROXY, "--workers", str(workers)],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready("http://127.0.0.1:18000/metrics")
+        time.sleep(1.0)
+        with multiprocessing.Pool(clients) as pool:
+            done = sum(pool.starmap(run_clients, [(connections, duration)] * clients))
+        return done / duration
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def main():
+    counts = [int(n) for n in (sys.argv[1] if len(sys.argv) > 1 else "1,2,4").split(",")]
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    clients = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    app = multiprocessing.Process(target=run_app, daemon=True)
+    app.start()
+    try:
+        print(f"cpu={os.cpu_count()}, body={len(BODY) // 1024} KB, clients={clients}x8, duration={duration}s")
+        print(f"{'workers':>7} {'req/s':>8} {'MB/s':>7} {'scale':>6}")
+        base = None
+        for n in counts:
+            rate = run_workers(n, clients, 8, duration)
+            base = base or rate
+            print(f"{n:>7} {rate:>8.0f} {rate * len(BODY) / 2 ** 20:>7.1f} {rate / base:>6.2f}")
+    finally:
+        app.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# loadgen.py
+# Генератор нагрузки на порты прокси (по умолчанию 9000-9002) вместо scanner/spam.py.
+# Режимы: closed — N соединений в полёте, новое сразу после завершения предыдущего;
+# open — заданный темп запросов в секунду независимо от ответов. В open-режиме
+# задержка считается от запланированного момента отправки, а не от фактического,
+# так что отставший генератор не прячет задержки сервера (coordinated omission).
+# Каждый запрос — отдельное соединение: connect, отправка, чтение до закрытия.
+# Нагрузки: get, post (тело --body-size), raw (байты из --raw), drip (GET по байту
+# с паузой, как медленный клиент), none (только баннер); auto — get на 9000, raw на
+# остальных. Задержки копятся в HDR-гистограмме: память не растёт с числом запросов.
+# Пример: python bench/loadgen.py --mode open --rate 2000 --duration 10 --ports 9000
+import argparse
+import asyncio
+import codecs
+import json
+import multiprocessing
+import resource
+import socket
+import struct
+from collections import Counter
+
+DEFAULT_PORTS = [9000, 9001, 9002]
+PAYLOADS = ("auto", "get", "post", "raw", "drip", "none")
+PERCENTILES = (50, 90, 99, 99.9)
+LINGER_RST = struct.pack("ii", 1, 0)  # для none: закрываем первыми, без TIME_WAIT у клиента
+
+class Histogram:
+    """Гистограмма задержек в стиле HdrHistogram: значение в микросекундах ложится в
+    логарифмическую корзину из 2048 линейных под-корзин, так что погрешность
+    не больше 0,1 %, а память не зависит от числа замеров."""
+    SUB_BITS = 11
+
+    def __init__(self, counts=None):
+        self.counts = Counter(counts or {})
+
+    def _index(self, value):
+        if value < 1 << self.SUB_BITS:
+            return value
+        shift = value.bit_length() - self.SUB_BITS
+        return (shift << (self.SUB_BITS - 1)) + (value >> shift)
+
+    def _highest(self, index):
+        """Наибольшее значение, попадающее в корзину index"""
+        if index < 1 << self.SUB_BITS:
+            return index
+        shift = (index >> (self.SUB_BITS - 1)) - 1
+        return ((index - (shift << (self.SUB_BITS - 1)) + 1) << shift) - 1
+
+    def record(self, seconds):
+        self.counts[self._index(max(int(seconds * 1e6), 0))] += 1
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def percentile(self, q):
+        """q-й перцентиль в секундах"""
+        total = self.total()
+        if not total:
+            return 0.0
+        rank = max(q / 100 * total, 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return self._highest(index) / 1e6
+        return self._highest(max(self.counts)) / 1e6
+
+    def mean(self):
+        total = self.total()
+        return sum(self._highest(i) * n for i, n in self.counts.items()) / total / 1e6 if total else 0.0
+
+class PortStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.ok = 0
+        self.dropped = 0          # open-режим: не отправлено — упёрлись в --max-in-flight
+        self.errors = Counter()   # connect | timeout | reset | empty
+        self.statuses = Counter()  # коды ответов HTTP
+        self.bytes_in = 0
+
+    def to_dict(self):
+        return {"ok": self.ok, "dropped": self.dropped, "errors": dict(self.errors),
+                "statuses": dict(self.statuses), "bytes_in": self.bytes_in,
+                "latency": dict(self.latency.counts)}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.ok, stats.dropped, stats.bytes_in = data["ok"], data["dropped"], data["bytes_in"]
+        stats.errors.update(data["errors"])
+        stats.statuses.update(data["statuses"])
+        stats.latency = Histogram(data["latency"])
+        return stats
+
+    def merge(self, other):
+        self.ok += other.ok
+        self.dropped += other.dropped
+        self.bytes_in += other.bytes_in
+        self.errors.update(other.errors)
+        self.statuses.update(other.statuses)
+        self.latency.merge(other.latency)
+
+def build_payload(kind, port, body_size=1024, raw=b"HELLO\n"):
+    if kind == "auto":
+        kind = "get" if port == 9000 else "raw"
+    if kind in ("get", "drip"):
+        return kind, b"GET / HTTP/1.1\r\nHost: loadgen\r\nUser-Agent: loadgen\r\nConnection: close\r\n\r\n"
+    if kind == "post":
+        return kind, (b"POST /submit HTTP/1.1\r\nHost: loadgen\r\nContent-Type: application/octet-stream\r\n"
+                      b"Content-Length: %d\r\nConnection: close\r\n\r\n" % body_size + b"x" * body_size)
+    if kind == "raw":
+        return kind, raw
+    return kind, b""
+
+async def exchange(loop, host, port, kind, payload, drip_delay, stats):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, (host, port))
+    except OSError:
+        sock.close()
+        stats.errors["connect"] += 1
+        return False
+    first = b""
+    received = 0
+    try:
+        if kind == "drip":
+            for i in range(len(payload)):
+                await loop.sock_sendall(sock, payload[i:i + 1])
+                await asyncio.sleep(drip_delay)
+        elif payload:
+            await loop.sock_sendall(sock, payload)
+        first = await loop.sock_recv(sock, 65536)
+        received = len(first)
+        if kind != "none":
+            while True:  # ответ — до закрытия соединения сервером
+                chunk = await loop.sock_recv(sock, 65536)
+                if not chunk:
+                    break
+                received += len(chunk)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+    except OSError:
+        # Сервис ответил и закрылся, не дочитав запрос (баннер-сервисы), — ответ получен
+        if not first:
+            stats.errors["reset"] += 1
+            return False
+    finally:
+        sock.close()
+    if not first:
+        stats.errors["empty"] += 1
+        return False
+    if first.startswith(b"HTTP/"):
+        stats.statuses[first[9:12].decode("latin-1")] += 1
+    stats.bytes_in += received
+    return True
+
+async def run_load(host="127.0.0.1", ports=DEFAULT_PORTS, mode="closed", concurrency=50, rate=1000.0,
+                   duration=10.0, warmup=1.0, payload="auto", body_size=1024, raw=b"HELLO\n",
+                   drip_delay=0.005, timeout=5.0, max_in_flight=10000):
+    """Нагрузка на ports; concurrency и rate — суммарно на все порты.
+    Замеры первых warmup секунд не учитываются. -> {порт: PortStats}, длительность замера
+    """
+    loop = asyncio.get_running_loop()
+    stats = {port: PortStats() for port in ports}
+    start = loop.time()
+    measure_from = start + warmup
+    end = measure_from + duration
+    in_flight = 0
+
+    async def one(port, kind, data, intended):
+        nonlocal in_flight
+        in_flight += 1
+        port_stats = stats[port] if intended >= measure_from else PortStats()
+        try:
+            ok = await asyncio.wait_for(exchange(loop, host, port, kind, data, drip_delay, port_stats), timeout)
+        except asyncio.TimeoutError:
+            port_stats.errors["timeout"] += 1
+            ok = False
+        finally:
+            in_flight -= 1
+        if ok:
+            port_stats.ok += 1
+            port_stats.latency.record(loop.time() - intended)
+
+    async def closed_worker(port):
+        kind, data = build_payload(payload, port, body_size, raw)
+        while loop.time() < end:
+            await one(port, kind, data, loop.time())
+
+    async def open_scheduler(port, port_rate):
+        kind, data = build_payload(payload, port, body_size, raw)
+        tasks = set()
+        n = 0
+        while True:
+            intended = start + n / port_rate
+            if intended >= end:
+                break
+            delay = intended - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            n += 1
+            if in_flight >= max_in_flight:
+                if intended >= measure_from:
+                    stats[port].dropped += 1
+                continue
+            task = asyncio.ensure_future(one(port, kind, data, intended))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.wait(tasks)
+
+    if mode == "closed":
+        workers = [closed_worker(ports[i % len(ports)]) for i in range(max(concurrency, len(ports)))]
+    else:
+        workers = [open_scheduler(port, rate / len(ports)) for port in ports]
+    await asyncio.gather(*workers)
+    return stats, duration
+
+def _process_main(options):
+    """Процесс-генератор для --procs: статистика в виде словарей"""
+    stats, duration = asyncio.run(run_load(**options))
+    return {port: s.to_dict() for port, s in stats.items()}, duration
+
+def run_processes(procs, **options):
+    """run_load в procs процессах (каждому — доля concurrency/rate) со сложенной статистикой"""
+    if procs <= 1:
+        return asyncio.run(run_load(**options))
+    share = dict(options)
+    share["concurrency"] = max(options.get("concurrency", 50) // procs, 1)
+    share["rate"] = options.get("rate", 1000.0) / procs
+    with multiprocessing.Pool(procs) as pool:
+        parts = pool.map(_process_main, [share] * procs)
+    stats = {}
+    for part, duration in parts:
+        for port, data in part.items():
+            stats.setdefault(port, PortStats()).merge(PortStats.from_dict(data))
+    return stats, duration
+
+def summarize(stats, duration):
+    """{порт: сводка} + "total" — то, что печатается и пишется в JSON"""
+    total = PortStats()
+    out = {}
+    for port, port_stats in list(stats.items()) + [("total", total)]:
+        if port != "total":
+            total.merge(port_stats)
+        latency = port_stats.latency
+        out[str(port)] = {
+            "ok": port_stats.ok,
+            "errors": sum(port_stats.errors.values()),
+            "error_kinds": dict(port_stats.errors),
+            "dropped": port_stats.dropped,
+            "statuses": dict(port_stats.statuses),
+            "throughput": round(port_stats.ok / duration, 1),
+            "mb_in_per_s": round(port_stats.bytes_in / duration / 1e6, 3),
+            "latency_ms": {
+                **{f"p{q:g}": round(latency.percentile(q) * 1000, 3) for q in PERCENTILES},
+                "mean": round(latency.mean() * 1000, 3),
+                "max": round(latency.percentile(100) * 1000, 3),
+            },
+        }
+    return out
+
+def print_summary(summary):
+    print(f"{'port':>6} {'ok':>8} {'errors':>7} {'dropped':>8} {'req/s':>9} "
+          + " ".join(f"{'p' + format(q, 'g') + ' ms':>9}" for q in PERCENTILES) + f" {'max ms':>9}")
+    for port, s in summary.items():
+        lat = s["latency_ms"]
+        print(f"{port:>6} {s['ok']:>8} {s['errors']:>7} {s['dropped']:>8} {s['throughput']:>9.1f} "
+              + " ".join(f"{lat['p' + format(q, 'g')]:>9.2f}" for q in PERCENTILES) + f" {lat['max']:>9.2f}")
+    for port, s in summary.items():
+        if s["error_kinds"] and port != "total":
+            print(f"  {port}: ошибки {s['error_kinds']}")
+
+def raise_fd_limit(needed):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard == resource.RLIM_INFINITY else min(needed, hard), hard))
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор нагрузки на порты прокси")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", default=",".join(map(str, DEFAULT_PORTS)), help="Порты через запятую")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed",
+                        help="closed — фиксированное число соединений, open — фиксированный темп")
+    parser.add_argument("--concurrency", type=int, default=50, help="closed: соединений в полёте, всего")
+    parser.add_argument("--rate", type=float, default=1000, help="open: запросов в секунду, всего")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность замера, сек")
+    parser.add_argument("--warmup", type=float, default=1, help="Прогрев перед замером, сек")
+    parser.add_argument("--payload", choices=PAYLOADS, default="auto")
+    parser.add_argument("--body-size", type=int, default=1024, help="post: размер тела, байт")
+    parser.add_argument("--raw", default="HELLO\\n", help="raw: что отправить (escape-последовательности \\n, \\x00)")
+    parser.add_argument("--drip-delay", type=float, default=0.005, help="drip: пауза между байтами, сек")
+    parser.add_argument("--timeout", type=float, default=5, help="Таймаут на весь запрос, сек")
+    parser.add_argument("--max-in-flight", type=int, default=10000,
+                        help="open: больше соединений не открывать, лишние запросы считаются dropped")
+    parser.add_argument("--procs", type=int, default=1, help="Сколько процессов генерируют нагрузку")
+    parser.add_argument("--json", metavar="FILE", help="Записать сводку в FILE")
+    args = parser.parse_args()
+
+    options = dict(host=args.host, ports=[int(p) for p in args.ports.split(",")], mode=args.mode,
+                   concurrency=args.concurrency, rate=args.rate, duration=args.duration, warmup=args.warmup,
+                   payload=args.payload, body_size=args.body_size,
+                   raw=codecs.escape_decode(args.raw.encode())[0], drip_delay=args.drip_delay,
+                   timeout=args.timeout, max_in_flight=args.max_in_flight)
+    raise_fd_limit(max(args.concurrency, args.max_in_flight) + 64)
+    load = f"concurrency={args.concurrency}" if args.mode == "closed" else f"rate={args.rate:g}/s"
+    print(f"{args.mode}-loop, {load}, payload={args.payload}, {args.duration:g}+{args.warmup:g} s, "
+          f"procs={args.procs}, ports={args.ports}")
+    summary = summarize(*run_processes(args.procs, **options))
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"options": {**vars(args)}, "ports": summary}, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
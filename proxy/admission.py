@@ -0,0 +1,99 @@
+# admission.py
+# Допуск соединений до создания потока/задачи: token bucket на IP источника
+# (в ограниченной LRU-таблице, чтобы поток поддельных адресов не раздувал память),
+# tarpit для отклонённых и сводный учёт отказов вместо строки лога на каждый.
+import collections
+import threading
+import time
+
+class TokenBuckets:
+    """Token bucket на ключ (IP): rate соединений/с, запас до burst.
+
+    Таблица ограничена max_sources записями; при переполнении вытесняется
+    давно не появлявшийся источник — вытесненный начинает с полным запасом,
+    так что флуд новыми адресами не может «выдавить» легитимных клиентов в отказ.
+    """
+    def __init__(self, rate, burst, max_sources=65536):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_sources = max_sources
+        self._buckets = collections.OrderedDict()  # ключ -> (токены, момент)
+        self._lock = threading.Lock()
+
+    def allow(self, key, now=None):
+        if self.rate <= 0:
+            return True  # ограничение выключено
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                tokens = self.burst
+                if len(self._buckets) >= self.max_sources:
+                    self._buckets.popitem(last=False)
+            else:
+                tokens = min(self.burst, entry[0] + (now - entry[1]) * self.rate)
+                self._buckets.move_to_end(key)
+            allowed = tokens >= 1.0
+            self._buckets[key] = (tokens - 1.0 if allowed else tokens, now)
+        return allowed
+
+    def __len__(self):
+        return len(self._buckets)
+
+class Tarpit:
+    """Держит отклонённые соединения открытыми hold секунд, не читая из них.
+
+    Сканер ждёт ответа вместо того, чтобы сразу бить дальше. Не больше
+    max_held одновременно — сверх этого соединение закрывается сразу.
+    """
+    def __init__(self, hold=10.0, max_held=1000):
+        self.hold = hold
+        self.max_held = max_held
+        self._held = collections.deque()  # (срок, функция закрытия) — по возрастанию срока
+        self._lock = threading.Lock()
+
+    def add(self, close):
+        """False — tarpit полон, вызывающий закрывает соединение сам"""
+        with self._lock:
+            if len(self._held) >= self.max_held:
+                return False
+            self._held.append((time.monotonic() + self.hold, close))
+            return True
+
+    def expire(self):
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            while self._held and self._held[0][0] <= now:
+                out.append(self._held.popleft()[1])
+        for close in out:
+            try: close()
+            except Exception: pass
+
+    def __len__(self):
+        return len(self._held)
+
+class RejectSummary:
+    """Счётчики отказов между сбросами сводки в лог (а не строка на каждый отказ)"""
+    def __init__(self, max_sources=1000):
+        self.max_sources = max_sources
+        self._reasons = collections.Counter()
+        self._sources = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, reason, source):
+        with self._lock:
+            self._reasons[reason] += 1
+            # Источники сверх лимита учитываются только в общем числе
+            if source in self._sources or len(self._sources) < self.max_sources:
+                self._sources[source] += 1
+
+    def drain(self, top=3):
+        """-> (отказов по причинам, число источников, самые частые) или None, если отказов не было"""
+        with self._lock:
+            if not self._reasons:
+                return None
+            reasons, sources = self._reasons, self._sources
+            self._reasons, self._sources = collections.Counter(), collections.Counter()
+        return dict(reasons), len(sources), sources.most_common(top)
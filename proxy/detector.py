@@ -0,0 +1,259 @@
+# detector.py
+# Обнаружение обхода портов и навязчивых источников по скользящему окну.
+# Каждое соединение (до допуска) отмечается за O(depth), без памяти на адрес:
+#   - число соединений — count-min скетч в кольце корзин (окно поделено на
+#     buckets частей; устаревшая корзина вычитается из суммы), с консервативным
+#     обновлением, чтобы коллизии меньше завышали оценку. Вычитание — проход по
+#     всей таблице, поэтому кольцо сдвигает advance() из служебного цикла раз в
+#     секунду, а не observe() на пути accept;
+#   - тронутые порты — таблица с отпечатком адреса в ячейке (depth вариантов
+#     места): маска портов и корзина, с которой началось окно источника. При
+#     нехватке места вытесняется ячейка с наименьшим числом портов.
+# Память фиксирована размерами таблиц и не зависит от числа адресов. Под флудом
+# уникальных адресов счётчики только завышаются, а маски портов теряются —
+# сработки по портам пропускаются, но не появляются у непричастных.
+# Сработки (обход портов, поток соединений, повторный нарушитель) копятся в
+# ограниченной очереди и забираются раз в секунду — в лог и метрики.
+# В режиме --workers у каждого воркера свой детектор: top() воркеры пишут в
+# файлы (save_top), супервизор складывает их при scrape (load_tops, merge_top).
+import array
+import collections
+import glob
+import json
+import os
+import threading
+import time
+from operator import sub
+
+Detection = collections.namedtuple("Detection", "kind ip port connections ports strikes")
+
+class SweepDetector:
+    """Порты и соединения на источник за окно window секунд.
+
+    kind сработки: "sweep" — за окно тронуто не меньше sweep_ports портов;
+    "rate" — соединений за окно не меньше rate_limit; "repeat" — у источника
+    набралось repeat_strikes сработок. Сработка одного вида для источника — не
+    чаще раза за окно; учёт повторов — в LRU на max_sources адресов.
+    Окно портов отсчитывается от первого соединения источника (до window секунд).
+    """
+    def __init__(self, window=60.0, buckets=12, width=16384, depth=4, sweep_ports=3, rate_limit=300,
+                 repeat_strikes=3, top_size=20, max_sources=4096, max_pending=1000):
+        self.window = window
+        self.buckets = buckets
+        self.bucket_seconds = window / buckets
+        self.width = width
+        self.depth = depth
+        self.sweep_ports = sweep_ports
+        self.rate_limit = rate_limit
+        self.repeat_strikes = repeat_strikes
+        self.top_size = top_size
+        self.max_sources = max_sources
+
+        size = width * depth
+        self._blank = array.array("I", bytes(4 * size))
+        self._counts = [array.array("I", self._blank) for _ in range(buckets)]
+        self._total = array.array("I", self._blank)  # сумма _counts по окну
+        self._owner = array.array("I", self._blank)  # отпечаток адреса в ячейке портов
+        self._ports = array.array("H", bytes(2 * size))
+        self._since = array.array("Q", bytes(8 * size))  # корзина начала окна источника
+        self._current = None   # номер корзины от начала отсчёта monotonic (с первого вызова)
+        self._port_bits = {}   # порт -> бит маски (15 портов, остальные делят последний бит)
+        self._top = {}         # кандидаты в top: ip -> [оценка, ячейки, отпечаток]
+        self._floor = 0        # наименьшая оценка в заполненном top
+        self._reported = collections.OrderedDict()  # ip -> {вид: момент сработки, "strikes": n}
+        self._pending = collections.deque(maxlen=max_pending)
+        self.detected = collections.Counter()  # сработки по видам за всё время
+        self.suppressed = 0    # сработки, вытесненные из переполненной очереди
+        self._lock = threading.Lock()
+
+    def _cells(self, ip):
+        """(ячейки по строкам таблиц, отпечаток) — из двух половин одного хэша"""
+        h = hash(ip)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32 & 0xFFFFFFFF) | 1
+        width = self.width
+        return tuple([row * width + (h1 + row * h2) % width for row in range(self.depth)]), h2
+
+    def _bit(self, port):
+        bit = self._port_bits.get(port)
+        if bit is None:
+            bit = self._port_bits[port] = 1 << min(len(self._port_bits), 15)
+        return bit
+
+    def _advance(self, bucket):
+        """Сдвинуть кольцо до корзины bucket: устаревшие вычитаются из суммы и обнуляются на месте"""
+        if self._current is None:
+            self._current = bucket
+        steps = bucket - self._current
+        if steps <= 0:
+            return
+        if steps >= self.buckets:
+            # Устарело всё окно (например, после простоя): обнулить, а не вычитать по корзине
+            self._total[:] = self._blank
+            for counts in self._counts:
+                counts[:] = self._blank
+        else:
+            for i in range(1, steps + 1):
+                counts = self._counts[(self._current + i) % self.buckets]
+                self._total[:] = array.array("I", map(sub, self._total, counts))
+                counts[:] = self._blank
+        self._current = bucket
+
+    def advance(self, now=None):
+        """Сдвинуть кольцо корзин к моменту now. Вызывается раз в секунду (и из top()):
+        до вызова соединения считаются в текущую корзину"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._advance(int(now / self.bucket_seconds))
+
+    def _mark_port(self, cells, fingerprint, bit, bucket):
+        """Отметить порт у источника -> маска его портов за окно, если порт в ней новый, иначе 0"""
+        owner, ports, since = self._owner, self._ports, self._since
+        oldest = bucket - self.buckets + 1
+        victim, fewest = cells[0], 17
+        for cell in cells:
+            if owner[cell] == fingerprint:
+                if since[cell] < oldest:
+                    ports[cell], since[cell] = bit, bucket  # окно источника истекло — начинаем новое
+                    return bit
+                if ports[cell] & bit:
+                    return 0
+                ports[cell] |= bit
+                return ports[cell]
+            used = ports[cell].bit_count() if owner[cell] and since[cell] >= oldest else 0
+            if used < fewest:
+                victim, fewest = cell, used
+        # Свободная или устаревшая ячейка, иначе источник с наименьшим числом портов:
+        # флуд адресов с одним портом не вытесняет тех, кто уже трогал несколько
+        owner[victim], ports[victim], since[victim] = fingerprint, bit, bucket
+        return bit
+
+    def _ports_of(self, cells, fingerprint):
+        oldest = self._current - self.buckets + 1
+        for cell in cells:
+            if self._owner[cell] == fingerprint:
+                return self._ports[cell] if self._since[cell] >= oldest else 0
+        return 0
+
+    def observe(self, ip, port, now=None):
+        """Отметить соединение ip -> port; сработки уходят в очередь для drain()"""
+        if now is None:
+            now = time.monotonic()
+        cells, fingerprint = self._cells(ip)
+        with self._lock:
+            bucket = int(now / self.bucket_seconds)
+            if self._current is None:
+                self._current = bucket
+            # Кольцо здесь не сдвигается (см. advance()): только O(depth) инкрементов
+            counts, total = self._counts[self._current % self.buckets], self._total
+            # Консервативное обновление: растут только ячейки, равные минимуму
+            estimate = min(map(total.__getitem__, cells)) + 1
+            for cell in cells:
+                if total[cell] < estimate:
+                    total[cell] += 1
+                    counts[cell] += 1
+            self._rank(ip, estimate, cells, fingerprint)
+            ports = self._mark_port(cells, fingerprint, self._bit(port), bucket)
+            if self.sweep_ports and ports.bit_count() >= self.sweep_ports:
+                self._detect("sweep", ip, port, estimate, ports, now)
+            if self.rate_limit and estimate >= self.rate_limit:
+                self._detect("rate", ip, port, estimate, self._ports_of(cells, fingerprint), now)
+
+    def _rank(self, ip, estimate, cells, fingerprint):
+        entry = self._top.get(ip)
+        if entry is not None:
+            entry[0] = estimate
+            return
+        if len(self._top) < self.top_size:
+            self._top[ip] = [estimate, cells, fingerprint]
+            self._floor = min(self._floor, estimate) if len(self._top) > 1 else estimate
+        elif estimate > self._floor:
+            del self._top[min(self._top, key=lambda key: self._top[key][0])]
+            self._top[ip] = [estimate, cells, fingerprint]
+            self._floor = min(value[0] for value in self._top.values())
+
+    def _detect(self, kind, ip, port, estimate, ports, now):
+        state = self._reported.get(ip)
+        if state is None:
+            state = self._reported[ip] = {"strikes": 0}
+            if len(self._reported) > self.max_sources:
+                self._reported.popitem(last=False)
+        else:
+            self._reported.move_to_end(ip)
+        last = state.get(kind)
+        if last is not None and now - last < self.window:
+            return  # этот вид уже сообщён в текущем окне
+        state[kind] = now
+        state["strikes"] += 1
+        found = [Detection(kind, ip, port, estimate, self._port_list(ports), state["strikes"])]
+        if state["strikes"] == self.repeat_strikes:
+            found.append(found[0]._replace(kind="repeat"))
+        for detection in found:
+            self.detected[detection.kind] += 1
+            if len(self._pending) == self._pending.maxlen:
+                self.suppressed += 1
+            self._pending.append(detection)
+
+    def _port_list(self, mask):
+        return sorted(port for port, bit in self._port_bits.items() if mask & bit)
+
+    def drain(self):
+        """Накопленные сработки (очередь освобождается)"""
+        with self._lock:
+            out = list(self._pending)
+            self._pending.clear()
+        return out
+
+    def top(self, n=None, now=None):
+        """Самые активные источники окна: [(ip, соединений, [порты])] по убыванию.
+        Заодно пересчитывает кандидатов: ушедшие из окна выбывают."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._advance(int(now / self.bucket_seconds))
+            out = []
+            for ip, entry in list(self._top.items()):
+                entry[0] = min(map(self._total.__getitem__, entry[1]))
+                if entry[0] <= 0:
+                    del self._top[ip]
+                    continue
+                out.append((ip, entry[0], self._port_list(self._ports_of(entry[1], entry[2]))))
+            self._floor = min((entry[0] for entry in self._top.values()), default=0)
+        out.sort(key=lambda item: -item[1])
+        return out[:n] if n else out
+
+    def memory_bytes(self):
+        """Память таблиц (не зависит от числа источников)"""
+        arrays = self._counts + [self._blank, self._total, self._owner, self._ports, self._since]
+        return sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+def save_top(path, top):
+    """Записать top() в файл целиком (замена, а не дописывание: читатель не видит половину)"""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(top, f)
+    os.replace(tmp, path)
+
+def load_tops(pattern):
+    """top() из всех файлов по шаблону; пропавшие и недописанные пропускаются"""
+    tops = []
+    for path in glob.glob(pattern):
+        try:
+            with open(path, encoding="utf-8") as f:
+                tops.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return tops
+
+def merge_top(tops, n):
+    """Общий top нескольких детекторов: соединения источника складываются
+    (SO_REUSEPORT раскидывает их по воркерам), порты объединяются"""
+    merged = {}
+    for top in tops:
+        for ip, count, ports in top:
+            entry = merged.setdefault(ip, [0, set()])
+            entry[0] += count
+            entry[1].update(ports)
+    out = [(ip, count, sorted(ports)) for ip, (count, ports) in merged.items()]
+    out.sort(key=lambda item: -item[1])
+    return out[:n]
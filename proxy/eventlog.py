@@ -0,0 +1,185 @@
+# eventlog.py
+# Асинхронный журнал событий: обработчики только кладут строку в ограниченную
+# очередь, отдельный поток пишет накопленное крупными блоками и ротирует файл.
+# Файл может делить несколько процессов (--workers): запись в режиме O_APPEND,
+# ротация — под flock, чужую ротацию писатель замечает по смене inode.
+import collections
+import fcntl
+import os
+import sys
+import threading
+import time
+
+class EventLog:
+    """Ограниченная очередь строк + поток-писатель.
+
+    policy="drop"  — при переполнении строка отбрасывается (обработчик не ждёт);
+    policy="block" — обработчик ждёт, пока писатель освободит место.
+    Ротация: по размеру (max_bytes) и/или по времени (rotate_seconds), backups копий.
+    stats_hook(log) вызывается писателем после каждого цикла — для выгрузки счётчиков.
+    """
+    def __init__(self, path, max_queue=10000, policy="drop", batch_size=1024, flush_interval=0.2,
+                 max_bytes=50 * 1024 * 1024, rotate_seconds=0, backups=5, echo=True, stats_hook=None):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Неизвестная политика переполнения: {policy}")
+        self.path = path
+        self.max_queue = max_queue
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backups = backups
+        self.echo = echo
+        self.stats_hook = stats_hook
+
+        self._queue = collections.deque()
+        self._wake = threading.Event()
+        self._not_full = threading.Condition()
+        self._closed = False
+        self._thread = None
+        self._file = None
+        self._inode = None
+        self._opened_at = 0.0
+
+        # written/write_errors меняет только писатель; dropped — под блокировкой
+        # (медленный путь переполнения), поэтому горячий путь обходится без блокировок
+        self.written = 0
+        self.write_errors = 0
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+        self._in_flight = 0
+
+    # === Сторона обработчиков ===
+
+    def write(self, line):
+        """Ставит строку в очередь. False — строка отброшена"""
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "drop" or self._closed:
+                with self._drop_lock:
+                    self.dropped += 1
+                return False
+            with self._not_full:
+                while len(self._queue) >= self.max_queue and not self._closed:
+                    self._wake.set()
+                    self._not_full.wait(self.flush_interval)
+        self._queue.append(line)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    @property
+    def enqueued(self):
+        """Всего принято в очередь"""
+        return self.written + self.write_errors + self._in_flight + len(self._queue)
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    # === Поток-писатель ===
+
+    def start(self):
+        self._open()
+        self._thread = threading.Thread(target=self._run, name="event-log-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "ab", buffering=0)
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._opened_at = time.time()
+
+    def _reopen_if_moved(self):
+        """True — файл ротировал другой процесс (или logrotate), открыт новый"""
+        try:
+            if os.stat(self.path).st_ino == self._inode:
+                return False
+        except FileNotFoundError:
+            pass
+        self._file.close()
+        self._open()
+        return True
+
+    def _rotate(self, incoming):
+        with open(self.path + ".lock", "ab") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Пока ждали блокировку, файл мог уже ротировать соседний процесс
+            if self._reopen_if_moved() or not self._need_rotation(incoming):
+                return
+            self._file.close()
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            if self.backups > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+            self._open()
+
+    def _need_rotation(self, incoming):
+        # Размер берём у файла, а не считаем сами: в него пишут и другие процессы
+        size = os.fstat(self._file.fileno()).st_size
+        if self.max_bytes and size and size + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _take_batch(self):
+        batch = []
+        popleft = self._queue.popleft
+        try:
+            for _ in range(self.batch_size):
+                batch.append(popleft())
+        except IndexError:
+            pass
+        return batch
+
+    def _flush_batch(self, batch):
+        data = ("\n".join(batch) + "\n").encode("utf-8")
+        try:
+            self._reopen_if_moved()
+            if self._need_rotation(len(data)):
+                self._rotate(len(data))
+            # Один write() на пачку: строки разных обработчиков (и процессов) не перемешиваются
+            self._file.write(data)
+            if self.echo:
+                # Для docker logs — тоже одним системным вызовом на пачку
+                sys.stdout.flush()
+                sys.stdout.buffer.write(data)
+                sys.stdout.flush()
+            self.written += len(batch)
+        except Exception:
+            self.write_errors += len(batch)  # Логирование не должно ломать работу прокси
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            while self._queue:
+                batch = self._take_batch()
+                self._in_flight = len(batch)
+                self._flush_batch(batch)
+                self._in_flight = 0
+                with self._not_full:
+                    self._not_full.notify_all()
+            if self.stats_hook is not None:
+                try: self.stats_hook(self)
+                except Exception: pass
+            if self._closed and not self._queue:
+                break
+        self._file.close()
+
+    def close(self, timeout=5.0):
+        """Дописывает очередь и останавливает писателя"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        with self._not_full:
+            self._not_full.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,171 @@
+# fastmetrics.py
+# Дешёвый учёт метрик на горячем пути. labels() на каждый запрос — сборка ключа
+# и поиск дочерней метрики под блокировкой, а inc()/observe() prometheus_client —
+# ещё по блокировке на значение (в многопроцессном режиме — запись в mmap).
+# Здесь дочерние метрики разрешаются один раз, а счёт идёт в ячейки своего
+# потока (у asyncio-движка — одни на весь event loop): сложение в списке, без
+# блокировок. В prometheus_client накопленное переносит flush() — перед scrape
+# и раз в секунду из служебного цикла (воркеры отдают метрики через файлы).
+# Ячейки завершившихся потоков после flush() достаются следующим потокам,
+# так что их число ограничено числом одновременно живых потоков.
+# Гистограммы flush() пишет прямо в корзины и сумму дочерней метрики (_buckets,
+# _sum, _upper_bounds) — это не публичный API, версия prometheus_client
+# зафиксирована в Dockerfile.proxy. Если этих полей нет, гистограммы считаются
+# обычным observe(), счётчики — по-прежнему локально.
+import threading
+from bisect import bisect_left
+
+_HISTOGRAM_FIELDS = ("_upper_bounds", "_buckets", "_sum")
+
+def _histogram_internals():
+    """Заполняет ли Histogram поля, в которые пишет flush(): проверка по коду
+    класса, без создания метрики (в многопроцессном режиме она попала бы в файлы)"""
+    try:
+        from prometheus_client import Histogram
+        names = set(Histogram._metric_init.__code__.co_names)
+    except (ImportError, AttributeError):
+        return False
+    return all(field in names for field in _HISTOGRAM_FIELDS)
+
+HISTOGRAM_INTERNALS = _histogram_internals()
+
+class _Shard:
+    """Ячейки одного потока и значения, уже перенесённые в prometheus_client"""
+    __slots__ = ("thread", "counts", "hists", "flushed_counts", "flushed_hists")
+
+    def __init__(self):
+        self.thread = None
+        self.counts, self.flushed_counts = [], []
+        self.hists, self.flushed_hists = [], []
+
+    def grow(self, counters, histograms):
+        for _ in range(len(self.counts), len(counters)):
+            self.counts.append(0)
+            self.flushed_counts.append(0)
+        for child, bounds in histograms[len(self.hists):]:
+            self.hists.append([0] * len(bounds) + [0.0])  # корзины и сумма
+            self.flushed_hists.append([0] * len(bounds) + [0.0])
+
+class LocalCounter:
+    __slots__ = ("_metrics", "_local", "_slot")
+
+    def __init__(self, metrics, slot):
+        self._metrics, self._local, self._slot = metrics, metrics._local, slot
+
+    def inc(self, amount=1):
+        try:
+            self._local.counts[self._slot] += amount
+        except (AttributeError, IndexError):
+            self._metrics._shard().counts[self._slot] += amount
+
+class LocalHistogram:
+    __slots__ = ("_metrics", "_local", "_slot", "_bounds")
+
+    def __init__(self, metrics, slot, bounds):
+        self._metrics, self._local, self._slot, self._bounds = metrics, metrics._local, slot, bounds
+
+    def observe(self, amount):
+        try:
+            cell = self._local.hists[self._slot]
+        except (AttributeError, IndexError):
+            cell = self._metrics._shard().hists[self._slot]
+        cell[bisect_left(self._bounds, amount)] += 1  # первая корзина с границей >= amount
+        cell[-1] += amount
+
+class LocalMetrics:
+    """Локальные по потокам счётчики и гистограммы поверх дочерних метрик.
+
+    counter()/histogram() разрешают дочернюю метрику и возвращают постоянный
+    объект с inc()/observe(); их стоит получить заранее и держать в словаре.
+    Значения видны в prometheus_client только после flush(). Без нужных полей
+    у Histogram histogram() возвращает саму дочернюю метрику.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()   # регистрация ячеек и flush()
+        self._counters = []             # слот -> дочерний Counter
+        self._histograms = []           # слот -> (дочерняя Histogram, верхние границы корзин)
+        self._handles = {}              # (метрика, метки) -> LocalCounter/LocalHistogram
+        self._shards = []
+        self._free = []                 # ячейки завершившихся потоков
+
+    def counter(self, metric, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        handle = self._handles.get(key)
+        if handle is None:
+            with self._lock:
+                handle = self._handles.get(key)
+                if handle is None:
+                    self._counters.append(metric.labels(**labels) if labels else metric)
+                    handle = self._handles[key] = LocalCounter(self, len(self._counters) - 1)
+        return handle
+
+    def histogram(self, metric, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        handle = self._handles.get(key)
+        if handle is None:
+            with self._lock:
+                handle = self._handles.get(key)
+                if handle is None:
+                    child = metric.labels(**labels) if labels else metric
+                    if HISTOGRAM_INTERNALS and all(hasattr(child, field) for field in _HISTOGRAM_FIELDS):
+                        bounds = tuple(child._upper_bounds)
+                        self._histograms.append((child, bounds))
+                        handle = LocalHistogram(self, len(self._histograms) - 1, bounds)
+                    else:
+                        handle = child  # публичный observe(): с блокировкой, зато без внутренностей
+                    self._handles[key] = handle
+        return handle
+
+    def _shard(self):
+        """Ячейки текущего потока: при первом обращении — свободные или новые,
+        после появления новых метрик — дорощенные"""
+        local = self._local
+        with self._lock:
+            shard = getattr(local, "shard", None)
+            if shard is None:
+                shard = self._free.pop() if self._free else None
+                if shard is None:
+                    shard = _Shard()
+                    self._shards.append(shard)
+                shard.thread = threading.current_thread()
+                local.shard = shard
+            shard.grow(self._counters, self._histograms)
+            local.counts, local.hists = shard.counts, shard.hists
+        return shard
+
+    def release(self):
+        """Поток больше не считает (конец соединения) — его ячейки сразу доступны следующему"""
+        local = self._local
+        shard = getattr(local, "shard", None)
+        if shard is None:
+            return
+        del local.shard, local.counts, local.hists
+        with self._lock:
+            shard.thread = None
+            self._free.append(shard)
+
+    def flush(self):
+        """Перенести накопленное с прошлого flush() в prometheus_client"""
+        with self._lock:
+            for shard in self._shards:
+                # Жив ли поток — до чтения: у завершившегося ячейки уже не меняются
+                dead = shard.thread is not None and not shard.thread.is_alive()
+                flushed = shard.flushed_counts
+                for slot, value in enumerate(shard.counts[:len(flushed)]):
+                    if value != flushed[slot]:
+                        self._counters[slot].inc(value - flushed[slot])
+                        flushed[slot] = value
+                for slot, cell in enumerate(shard.hists[:len(shard.flushed_hists)]):
+                    cell, done = cell[:], shard.flushed_hists[slot]
+                    if cell == done:
+                        continue
+                    child = self._histograms[slot][0]
+                    for i, value in enumerate(cell[:-1]):
+                        if value != done[i]:
+                            child._buckets[i].inc(value - done[i])
+                    child._sum.inc(cell[-1] - done[-1])
+                    shard.flushed_hists[slot] = cell
+                if dead:
+                    shard.thread = None
+                    self._free.append(shard)
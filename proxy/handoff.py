@@ -0,0 +1,111 @@
+# handoff.py
+# Перезапуск без закрытых портов: новый процесс прокси забирает слушающие сокеты
+# у работающего. Старый процесс слушает Unix-сокет (--handoff PATH); новый,
+# запущенный с тем же PATH, подключается к нему и получает дескрипторы (SCM_RIGHTS)
+# вместе со списком портов. Очередь accept у сокета общая, поэтому, пока оба
+# держат дескриптор, соединения принимает любой из них, и ни одно не получает
+# отказ. Когда новый начал принимать, он отвечает READY, старый закрывает свои
+# копии (без shutdown — это закрыло бы сокет и новому) и дорабатывает текущие
+# соединения. Если новый упал, не ответив, старый работает дальше как ни в чём не бывало.
+import json
+import os
+import socket
+import threading
+
+READY = b"ready"
+DONE = b"done"
+MAX_SOCKETS = 64
+
+class HandoffError(OSError):
+    pass
+
+def take(path, timeout=10.0):
+    """Забрать сокеты у процесса, слушающего path: ({ключ: сокет}, канал) или
+    ({}, None), если там никого нет (холодный старт). Ключи — порты и "metrics".
+    Канал нужно отдать в confirm(), когда приём на сокетах запущен"""
+    chan = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    chan.settimeout(timeout)
+    try:
+        chan.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        chan.close()
+        return {}, None
+    try:
+        msg, fds, _, _ = socket.recv_fds(chan, 65536, MAX_SOCKETS)
+    except OSError:
+        chan.close()
+        raise
+    sockets = [socket.socket(fileno=fd) for fd in fds]
+    try:
+        keys = json.loads(msg)["sockets"]
+        if len(keys) != len(sockets):
+            raise ValueError(f"дескрипторов {len(sockets)}, а ключей {len(keys)}")
+    except (ValueError, KeyError, TypeError) as e:
+        for sock in sockets:
+            sock.close()
+        chan.close()
+        raise HandoffError(f"{path}: непонятный ответ: {e}") from e
+    return dict(zip(keys, sockets)), chan
+
+def confirm(chan):
+    """Сказать старому процессу, что приём идёт, и дождаться, пока он освободит path"""
+    if chan is None:
+        return
+    try:
+        chan.sendall(READY)
+        chan.recv(len(DONE))  # пусто — старый ушёл раньше, тоже годится
+    except OSError:
+        pass
+    finally:
+        chan.close()
+
+class HandoffServer:
+    """Отдаёт сокеты следующему процессу по Unix-сокету path.
+
+    get_sockets() -> {ключ: сокет} вызывается в момент передачи, так что новый
+    процесс получает слушателей с учётом перечитанной конфигурации. on_handoff()
+    вызывается один раз, после READY нового процесса: пора перестать принимать.
+    """
+    def __init__(self, path, get_sockets, on_handoff, timeout=30.0):
+        self.path = path
+        self.get_sockets = get_sockets
+        self.on_handoff = on_handoff
+        self.timeout = timeout
+        self.sock = None
+
+    def start(self):
+        try:
+            os.unlink(self.path)  # остался от упавшего процесса или только что освобождён прежним
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(1)
+        threading.Thread(target=self._serve, name="handoff", daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                if self._hand_over(conn):
+                    # Слушающий Unix-сокет не удаляем: path уже может занять новый процесс
+                    self.sock.close()
+                    try:
+                        conn.sendall(DONE)
+                    except OSError:
+                        pass
+                    break
+        self.on_handoff()
+
+    def _hand_over(self, conn):
+        conn.settimeout(self.timeout)
+        sockets = self.get_sockets()
+        try:
+            socket.send_fds(conn, [json.dumps({"sockets": list(sockets), "pid": os.getpid()}).encode()],
+                            [sock.fileno() for sock in sockets.values()])
+            return conn.recv(len(READY)) == READY
+        except OSError:
+            return False  # новый процесс не поднялся — продолжаем принимать сами
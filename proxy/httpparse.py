@@ -0,0 +1,240 @@
+# httpparse.py
+# Инкрементальный разбор HTTP-запросов клиента: границы сообщения (для keep-alive
+# и pipelining), тело по Content-Length или chunked (отдаётся кусками, без
+# накопления целиком), hop-by-hop заголовки и быстрый отказ с 4xx на мусор.
+
+MAX_REQUEST_HEADER = 8192
+MAX_HEADER_COUNT = 100
+MAX_CHUNK_LINE = 1024
+HOP_BY_HOP = (b"connection", b"keep-alive", b"proxy-connection")
+TOKEN_CHARS = b"!#$%&'*+-.^_`|~0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+HEX_DIGITS = b"0123456789abcdefABCDEF"
+
+REASONS = {
+    400: "Bad Request",
+    408: "Request Timeout",
+    431: "Request Header Fields Too Large",
+    501: "Not Implemented",
+    505: "HTTP Version Not Supported",
+}
+
+class HttpError(Exception):
+    """Запрос отвергнут: status уходит клиенту, соединение закрывается"""
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+    def response(self):
+        return (f"HTTP/1.1 {self.status} {REASONS[self.status]}\r\n"
+                f"Connection: close\r\nContent-Length: 0\r\n\r\n").encode()
+
+class RequestInfo:
+    """Разобранная строка запроса и важные для проксирования заголовки"""
+    def __init__(self, method, version, headers):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        connection = b""
+        lengths = set()
+        encodings = []
+        self.expect_continue = False
+        for name, value in headers:
+            if name == b"connection":
+                connection += value.lower() + b","
+            elif name == b"content-length":
+                lengths.update(v.strip() for v in value.split(b","))
+            elif name == b"transfer-encoding":
+                encodings += [v.strip().lower() for v in value.split(b",")]
+            elif name == b"expect":
+                self.expect_continue = value.lower() == b"100-continue"
+
+        self.chunked = bool(encodings)
+        if encodings:
+            # Иначе тело не ограничить; CL вместе с TE — классический request smuggling
+            if encodings[-1] != b"chunked":
+                raise HttpError(501, "Transfer-Encoding без chunked")
+            if lengths:
+                raise HttpError(400, "Content-Length вместе с Transfer-Encoding")
+        if len(lengths) > 1:
+            raise HttpError(400, "Несколько разных Content-Length")
+        length = lengths.pop() if lengths else b"0"
+        if not length.isdigit() or len(length) > 18:
+            raise HttpError(400, "Некорректный Content-Length")
+        self.content_length = int(length)
+
+        if version == b"HTTP/1.1":
+            self.keep_alive = b"close" not in connection
+        else:
+            self.keep_alive = b"keep-alive" in connection
+
+    @property
+    def has_body(self):
+        return self.chunked or self.content_length > 0
+
+def _check_request_line(line):
+    parts = line.split(b" ")
+    if len(parts) != 3 or not parts[0] or parts[0].translate(None, TOKEN_CHARS) or not parts[1]:
+        raise HttpError(400, "Некорректная строка запроса")
+    if not parts[2].startswith(b"HTTP/"):
+        raise HttpError(400, "Некорректная версия протокола")
+    if parts[2] not in (b"HTTP/1.0", b"HTTP/1.1"):
+        raise HttpError(505, "Неподдерживаемая версия протокола")
+    return parts
+
+def parse_head(head):
+    """Заголовок запроса (без пустой строки в конце) -> RequestInfo"""
+    lines = head.split(b"\n")
+    parts = _check_request_line(lines[0].rstrip(b"\r"))
+    if len(lines) - 1 > MAX_HEADER_COUNT:
+        raise HttpError(431, "Слишком много заголовков")
+    headers = []
+    for line in lines[1:]:
+        line = line.rstrip(b"\r")
+        name, sep, value = line.partition(b":")
+        if not sep or not name or name.translate(None, TOKEN_CHARS):
+            # Пробел перед двоеточием и продолжение строк (obs-fold) запрещены RFC 9112
+            raise HttpError(400, "Некорректная строка заголовка")
+        headers.append((name.lower(), value.strip()))
+    return RequestInfo(parts[0], parts[2], headers)
+
+class _ChunkedBody:
+    """Границы chunked-тела без декодирования: тело пересылается как есть"""
+    def __init__(self):
+        self._state = "size"
+        self._remaining = 0
+        self.done = False
+
+    def consume(self, buf):
+        """Сколько байт с начала buf принадлежат телу (0 — нужны ещё данные)"""
+        pos = 0
+        n = len(buf)
+        while not self.done and pos < n:
+            if self._state == "data":
+                take = min(self._remaining, n - pos)
+                pos += take
+                self._remaining -= take
+                if not self._remaining:
+                    self._state = "crlf"
+                continue
+            end = buf.find(b"\n", pos, pos + MAX_CHUNK_LINE)
+            if end < 0:
+                if n - pos >= MAX_CHUNK_LINE:
+                    raise HttpError(400, "Слишком длинная строка chunked-тела")
+                break
+            line = bytes(buf[pos:end]).rstrip(b"\r")
+            pos = end + 1
+            if self._state == "size":
+                size = line.split(b";", 1)[0].strip()
+                if not size or len(size) > 16 or size.translate(None, HEX_DIGITS):
+                    raise HttpError(400, "Некорректный размер куска")
+                self._remaining = int(size, 16)
+                self._state = "data" if self._remaining else "trailer"
+            elif self._state == "crlf":
+                if line:
+                    raise HttpError(400, "Нет CRLF после куска")
+                self._state = "size"
+            elif not line:  # trailer: строки до пустой
+                self.done = True
+        return pos
+
+class RequestParser:
+    """Поток запросов одного клиентского соединения.
+
+    feed() дописывает данные в bytearray; next_head() ищет конец заголовка только
+    в новых байтах и возвращает (заголовок, RequestInfo); затем body() отдаёт
+    уже пришедшие куски тела, пока body_done не станет True.
+    """
+    def __init__(self, max_header=MAX_REQUEST_HEADER):
+        self.max_header = max_header
+        self.buf = bytearray()
+        self._scan = 0            # до этой позиции конца заголовка точно нет
+        self._line_checked = False
+        self._remaining = 0       # остаток тела по Content-Length
+        self._chunked = None
+        self.body_done = True
+
+    def feed(self, data):
+        self.buf += data
+
+    def _find_end(self):
+        """(позиция, длина разделителя) конца заголовка; ищется только в новых байтах"""
+        start = max(self._scan - 3, 0)
+        crlf = self.buf.find(b"\r\n\r\n", start)
+        # Голые LF (netcat, самописные клиенты) — ищем не дальше найденного CRLF, чтобы не сканировать тело
+        lf = self.buf.find(b"\n\n", start, crlf + 4 if crlf >= 0 else len(self.buf))
+        if lf >= 0 and (crlf < 0 or lf < crlf):
+            return lf, 2
+        return (crlf, 4) if crlf >= 0 else None
+
+    def next_head(self):
+        """(сырой заголовок, RequestInfo) следующего запроса или None, если данных мало"""
+        if not self.body_done:
+            raise RuntimeError("тело предыдущего запроса не дочитано")
+        # Пустые строки перед запросом допускаются (RFC 9112, 2.2)
+        while self.buf[:2] == b"\r\n" or self.buf[:1] == b"\n":
+            del self.buf[:2 if self.buf[:1] == b"\r" else 1]
+            self._scan = 0
+        if not self._line_checked:
+            # Мусор отвергаем по первой строке, не дожидаясь конца заголовка
+            eol = self.buf.find(b"\n", self._scan, self.max_header)
+            if eol >= 0:
+                _check_request_line(bytes(self.buf[:eol]).rstrip(b"\r"))
+                self._line_checked = True
+        found = self._find_end()
+        if found is None:
+            if len(self.buf) > self.max_header:
+                raise HttpError(431, "Слишком длинный заголовок")
+            self._scan = len(self.buf)
+            return None
+        idx, sep = found
+        if idx > self.max_header:
+            raise HttpError(431, "Слишком длинный заголовок")
+        head = bytes(self.buf[:idx + sep])
+        del self.buf[:idx + sep]
+        self._scan = 0
+        self._line_checked = False
+        info = parse_head(head[:idx])
+        if info.chunked:
+            self._chunked = _ChunkedBody()
+        else:
+            self._chunked = None
+            self._remaining = info.content_length
+        self.body_done = not info.has_body
+        return head, info
+
+    def body(self):
+        """Следующий кусок тела из буфера (b"" — нужно дочитать из сокета)"""
+        if self.body_done or not self.buf:
+            return b""
+        if self._chunked is not None:
+            n = self._chunked.consume(self.buf)
+            self.body_done = self._chunked.done
+        else:
+            n = min(self._remaining, len(self.buf))
+            self._remaining -= n
+            self.body_done = not self._remaining
+        piece = bytes(self.buf[:n])
+        del self.buf[:n]
+        return piece
+
+    def buffered_body(self):
+        """Всё тело, если оно уже целиком в буфере (для повтора на другом соединении), иначе None"""
+        if self.body_done:
+            return b""
+        if self._chunked is None and len(self.buf) >= self._remaining:
+            return self.body()
+        return None
+
+def upstream_head(head, info):
+    """Заголовок для переиспользуемого upstream-соединения: без hop-by-hop заголовков клиента.
+
+    Expect: 100-continue прокси обрабатывает сам, upstream его не видит.
+    """
+    if info.version != b"HTTP/1.1":
+        return head
+    lines = head.rstrip(b"\r\n").split(b"\n")
+    drop = HOP_BY_HOP + (b"expect",) if info.expect_continue else HOP_BY_HOP
+    kept = [lines[0].rstrip(b"\r")] + [line.rstrip(b"\r") for line in lines[1:]
+                                       if line.partition(b":")[0].strip().lower() not in drop]
+    return b"\r\n".join(kept) + b"\r\n\r\n"
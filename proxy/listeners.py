@@ -0,0 +1,142 @@
+# listeners.py
+# Слушатели прокси из файла конфигурации (listeners.json): порт, режим, адрес
+# приложения, баннер, таймауты и правила маскировки. Режимы:
+#   http        — HTTP через переписку ответа по правилам маскировки;
+#   passthrough — прямая пересылка байтов в приложение;
+#   honeypot    — фейковый баннер и запись атаки в журнал, без приложения.
+# load_config() проверяет файл целиком и компилирует правила, поэтому при любой
+# ошибке (ConfigError) можно остаться на прежней конфигурации. Баннеры кодируются
+# в байты здесь, а не на каждое соединение. Неизменённый файл правил не
+# компилируется заново: тот же RuleSet, и конфигурации слушателя равны.
+import collections
+import json
+import os
+
+from rules import RuleSet
+
+MODES = ("http", "passthrough", "honeypot")
+
+# Значения по умолчанию; файл переопределяет их в "defaults", слушатель — у себя
+DEFAULTS = {
+    "target_host": "app",
+    "rules": "rules.json",
+    "header_timeout": 10.0,         # на весь заголовок с первого байта
+    "first_request_timeout": 5.0,   # ожидание первого запроса на новом соединении
+    "body_idle_timeout": 5.0,       # простой посреди тела запроса
+    "keepalive_timeout": 5.0,
+    "keepalive_max_requests": 100,
+    "upstream_timeout": 5.0,        # подключение и ответ приложения
+    "idle_timeout": 300.0,          # простой passthrough-соединения
+}
+_NUMBERS = {"header_timeout", "first_request_timeout", "body_idle_timeout", "keepalive_timeout",
+            "upstream_timeout", "idle_timeout"}
+
+ListenerConfig = collections.namedtuple("ListenerConfig", [
+    "port", "mode", "target_host", "target_port", "banner", "rules_file", "rules",
+    "header_timeout", "first_request_timeout", "body_idle_timeout", "keepalive_timeout",
+    "keepalive_max_requests", "upstream_timeout", "idle_timeout",
+])
+
+class ConfigError(ValueError):
+    pass
+
+_rule_cache = {}  # путь -> ((mtime, размер), RuleSet)
+
+def _load_rules(path):
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _rule_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    rules = RuleSet.load(path)
+    _rule_cache[path] = (key, rules)
+    return rules
+
+def describe(config):
+    """Короткое описание слушателя для вывода при старте и перечитывании"""
+    if config.mode == "honeypot":
+        return f"honeypot, баннер {config.banner.decode(errors='replace').strip()!r}"
+    target = f"{config.target_host}:{config.target_port}"
+    if config.mode == "http":
+        return f"http -> {target}, правил {len(config.rules)} ({os.path.basename(config.rules_file)})"
+    return f"passthrough -> {target}"
+
+def _number(where, key, value, integer=False):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or (integer and not isinstance(value, int)):
+        raise ConfigError(f"{where}: {key} должен быть {'целым ' if integer else ''}числом")
+    if value <= 0:
+        raise ConfigError(f"{where}: {key} должен быть больше нуля")
+    return value
+
+def _listener(entry, defaults, base_dir):
+    if not isinstance(entry, dict):
+        raise ConfigError("listeners: каждый слушатель — объект")
+    port = entry.get("port")
+    where = f"слушатель {port}"
+    if isinstance(port, bool) or not isinstance(port, int) or not 0 < port < 65536:
+        raise ConfigError(f"{where}: port должен быть целым от 1 до 65535")
+    unknown = set(entry) - set(DEFAULTS) - {"port", "mode", "target_port", "banner"}
+    if unknown:
+        raise ConfigError(f"{where}: неизвестные параметры {', '.join(sorted(unknown))}")
+    values = dict(defaults, **entry)
+    mode = values.get("mode")
+    if mode not in MODES:
+        raise ConfigError(f"{where}: mode должен быть одним из {', '.join(MODES)}")
+    for key in _NUMBERS:
+        values[key] = float(_number(where, key, values[key]))
+    _number(where, "keepalive_max_requests", values["keepalive_max_requests"], integer=True)
+
+    target_port = values.get("target_port")
+    if mode != "honeypot":
+        if isinstance(target_port, bool) or not isinstance(target_port, int) or not 0 < target_port < 65536:
+            raise ConfigError(f"{where}: для режима {mode} нужен target_port от 1 до 65535")
+        if not isinstance(values["target_host"], str) or not values["target_host"]:
+            raise ConfigError(f"{where}: target_host должен быть непустой строкой")
+
+    banner = None
+    if mode == "honeypot":
+        if not isinstance(values.get("banner"), str):
+            raise ConfigError(f"{where}: для режима honeypot нужен banner (строка)")
+        banner = values["banner"].encode() + b"\n"
+
+    rules_file, rules = None, None
+    if mode == "http":
+        rules_file = os.path.join(base_dir, values["rules"])
+        try:
+            rules = _load_rules(rules_file)
+        except (OSError, ValueError) as e:  # RuleError и ошибки JSON — тоже ValueError
+            raise ConfigError(f"{where}: правила {rules_file}: {e}") from e
+
+    return ListenerConfig(port, mode, values["target_host"], target_port, banner, rules_file, rules,
+                          *(values[key] for key in ListenerConfig._fields[7:]))
+
+def parse_config(data, defaults=None, base_dir="."):
+    """dict из файла -> {порт: ListenerConfig} в порядке файла"""
+    if not isinstance(data, dict) or not isinstance(data.get("listeners"), list):
+        raise ConfigError('ожидается объект со списком "listeners"')
+    overrides = data.get("defaults", {})
+    if not isinstance(overrides, dict):
+        raise ConfigError('"defaults" должен быть объектом')
+    unknown = set(overrides) - set(DEFAULTS)
+    if unknown:
+        raise ConfigError(f"defaults: неизвестные параметры {', '.join(sorted(unknown))}")
+    merged = {**DEFAULTS, **(defaults or {}), **overrides}
+    out = {}
+    for entry in data["listeners"]:
+        config = _listener(entry, merged, base_dir)
+        if config.port in out:
+            raise ConfigError(f"слушатель {config.port}: порт указан дважды")
+        out[config.port] = config
+    if not out:
+        raise ConfigError("не задано ни одного слушателя")
+    return out
+
+def load_config(path, defaults=None):
+    """Файл конфигурации -> {порт: ListenerConfig}. defaults — значения до "defaults" файла
+    (например, из переменных окружения); пути правил — относительно файла"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"{path}: {e}") from e
+    return parse_config(data, defaults, os.path.dirname(os.path.abspath(path)))
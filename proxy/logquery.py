@@ -0,0 +1,492 @@
+# logquery.py
+# Аналитика журнала событий прокси (строки write_log фиксированного формата):
+#   [2026-01-17 15:01:12] 172.22.0.1      -> :9001 | HONEYPOT_TRIGGER     | детали
+# Файл отображается в память (mmap) и разбирается одним скомпилированным
+# регулярным выражением по крупным кускам — цикл по строкам идёт в C. Фильтры по
+# действию, порту и IP вшиваются в само выражение, а разбор идёт от найденной
+# подстроки фильтра — строки без неё не разбираются. Разреженный индекс времени
+# (точка на каждые INDEX_STEP байт, строится за доли секунды без чтения файла
+# целиком) позволяет запросу за интервал сразу перейти к нужным смещениям.
+# Агрегаты копятся потоково: счётчики по действиям и портам, приближённый top-k
+# источников (не больше 2*capacity ключей), гистограмма по минутам; с --workers
+# файл делится на диапазоны строк между процессами, сводки складываются. --follow
+# дочитывает растущий файл и переживает ротацию EventLog.
+# Примеры:
+#   python logquery.py proxy_logs/security_events.log --since 1h --action HONEYPOT_TRIGGER --top 10
+#   python logquery.py logs/security_events.log.1 logs/security_events.log --histogram --bucket 5
+#   python logquery.py logs/security_events.log --follow --lines --port 9001,9002
+import argparse
+import bisect
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from operator import itemgetter
+
+LOG_FILE = os.path.join(os.environ.get("LOG_DIR", "logs"), "security_events.log")
+INDEX_STEP = 1024 * 1024  # байт между точками индекса
+CHUNK_SIZE = 4 * 1024 * 1024  # кусок разбора: столько строк сразу живут в памяти
+# Воркеры пишут в общий файл пачками, поэтому время в файле растёт почти, но не
+# строго монотонно: границы интервала по индексу расширяются на этот запас
+ORDER_SLACK = timedelta(seconds=60)
+STAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Строка: (минута, секунды, ip, порт, действие[, детали])
+MINUTE, SECOND, IP, PORT, ACTION, DETAILS = range(6)
+_minute, _ip, _port, _action = itemgetter(MINUTE), itemgetter(IP), itemgetter(PORT), itemgetter(ACTION)
+_STAMP = re.compile(rb"\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] ")
+_RELATIVE = re.compile(r"(\d+(?:\.\d+)?)([smhd])")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_time(text, now=None):
+    """'15m', '1h', '2d' — назад от now; иначе 'ГГГГ-ММ-ДД ЧЧ:ММ[:СС]' -> datetime"""
+    match = _RELATIVE.fullmatch(text.strip())
+    if match:
+        return (now or datetime.now()) - timedelta(seconds=float(match.group(1)) * _UNITS[match.group(2)])
+    for fmt in (STAMP_FORMAT, "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text.strip(), fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Не понимаю время: {text!r} (ожидается 15m/1h/2d или ГГГГ-ММ-ДД ЧЧ:ММ[:СС])")
+
+def _stamp(moment):
+    return moment.strftime(STAMP_FORMAT).encode()
+
+def _alternatives(values, default):
+    if not values:
+        return default
+    return b"|".join(re.escape(str(v).encode()) for v in values)
+
+class Query:
+    """Условия выборки; фильтры по действию, порту и IP становятся частью выражения.
+
+    С фильтром разбор идёт от якоря: быстрый поиск подстроки фильтра (самого
+    избирательного — IP, затем порт, затем действие), и полное выражение
+    применяется только к строкам, где она нашлась. Без фильтра — один findall.
+    """
+    def __init__(self, since=None, until=None, actions=None, ports=None, ips=None, details=False):
+        self.since, self.until = since, until
+        self.details = details
+        pattern = (rb"^\[(\d{4}-\d\d-\d\d \d\d:\d\d):(\d\d)\] (" + _alternatives(ips, rb"\S+") +
+                   rb") *-> :(" + _alternatives(ports, rb"\d+") + rb") \| (" + _alternatives(actions, rb"\S+") +
+                   rb") *\| " + (rb"([^\n]*)\n" if details else rb"[^\n]*\n"))
+        self.pattern = re.compile(pattern, re.MULTILINE)
+        if ips:
+            anchor = rb"\] (?:" + _alternatives(ips, None) + rb") "
+        elif ports:
+            anchor = rb"-> :(?:" + _alternatives(ports, None) + rb") \|"
+        elif actions:
+            anchor = rb"\| (?:" + _alternatives(actions, None) + rb") "
+        else:
+            anchor = None
+        self.anchor = re.compile(anchor) if anchor else None
+        # Границы как кортежи (минута, секунды) — сравниваются со строками без разбора дат
+        self._low = self._key(since)
+        self._high = self._key(until)
+
+    @staticmethod
+    def _key(moment):
+        if moment is None:
+            return None
+        stamp = _stamp(moment)
+        return stamp[:16], stamp[17:]
+
+    def parse(self, data, pos=0, endpos=sys.maxsize):
+        """Подходящие строки из data[pos:endpos] (кусок начинается с начала строки)"""
+        if self.anchor is None:
+            rows = self.pattern.findall(data, pos, endpos)
+        else:
+            rows = self._anchored(data, pos, min(endpos, len(data)))
+        if rows and (self._low or self._high):
+            low, high = self._low, self._high
+            # Проверка по строкам — только если кусок задевает границу интервала
+            if (low and min(rows)[:2] < low) or (high and max(rows)[:2] > high):
+                rows = [row for row in rows
+                        if (not low or row[:2] >= low) and (not high or row[:2] <= high)]
+        return rows
+
+    def _anchored(self, data, pos, endpos):
+        rows = []
+        append, rfind, match = rows.append, data.rfind, self.pattern.match
+        done = pos  # конец последней разобранной строки: повторные якоря в ней пропускаются
+        for hit in self.anchor.finditer(data, pos, endpos):
+            start = hit.start()
+            if start < done:
+                continue
+            start = rfind(b"\n", pos, start) + 1 or pos
+            line = match(data, start, endpos)
+            if line:
+                append(line.groups())
+                done = line.end()
+        return rows
+
+class TimeIndex:
+    """Разреженный индекс: время первой строки после каждых step байт и её смещение.
+
+    Для поиска хранятся бегущий максимум времени слева и минимум справа — так
+    бинарный поиск корректен и при небольшом беспорядке строк между воркерами.
+    """
+    def __init__(self, step=INDEX_STEP):
+        self.step = step
+        self.offsets = []
+        self.stamps = []
+        self.end = 0  # до какого места файла индекс построен
+
+    def extend(self, buf, size):
+        """Дописать точки для выросшей части файла [end, size)"""
+        pos = self.end
+        while pos < size:
+            start = 0 if pos == 0 else buf.find(b"\n", pos - 1, size) + 1
+            if start <= 0 and pos:
+                break  # дальше нет целой строки
+            match = None
+            while start < size:
+                match = _STAMP.match(buf, start)
+                if match:
+                    break
+                start = buf.find(b"\n", start, size) + 1  # мусорная строка — берём следующую
+                if start <= 0:
+                    break
+            if match:
+                if not self.offsets or start > self.offsets[-1]:
+                    self.offsets.append(start)
+                    self.stamps.append(match.group(1))
+            pos = max(start, pos) + self.step
+        self.end = pos
+
+    def span(self, since, until, size):
+        """(начало, конец) части файла, где могут быть строки из [since, until]"""
+        if not self.offsets:
+            return 0, size
+        start, end = 0, size
+        if since is not None:
+            low = _stamp(since - ORDER_SLACK)
+            running, maxima = b"", []
+            for stamp in self.stamps:
+                running = max(running, stamp)
+                maxima.append(running)
+            point = bisect.bisect_left(maxima, low) - 1
+            start = self.offsets[point] if point >= 0 else 0
+        if until is not None:
+            high = _stamp(until + ORDER_SLACK)
+            running, minima = b"\xff", []
+            for stamp in reversed(self.stamps):
+                running = min(running, stamp)
+                minima.append(running)
+            minima.reverse()
+            point = bisect.bisect_right(minima, high)
+            end = self.offsets[point] if point < len(self.offsets) else size
+        return start, max(start, end)
+
+class TopK:
+    """Приближённый top-k: хранится не больше 2*capacity ключей.
+
+    При переполнении остаются capacity крупнейших, а счётчик отброшенного порога
+    копится в error: истинное значение ключа не больше показанного + error.
+    """
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.error = 0
+
+    def update(self, counts):
+        self.counts.update(counts)
+        if len(self.counts) > 2 * self.capacity:
+            kept = self.counts.most_common(self.capacity + 1)
+            self.error += kept.pop()[1]
+            self.counts = Counter(dict(kept))
+
+    def merge(self, other):
+        self.update(other.counts)
+        self.error += other.error
+
+    def most_common(self, n):
+        return self.counts.most_common(n)
+
+class Summary:
+    """Потоковые агрегаты по разобранным строкам"""
+    def __init__(self, top_capacity=1000):
+        self.total = 0
+        self.actions = Counter()
+        self.ports = Counter()
+        self.ips = TopK(top_capacity)
+        self.per_minute = Counter()  # растёт с числом минут интервала, а не строк
+        self.first = None
+        self.last = None
+
+    def add(self, rows):
+        if not rows:
+            return
+        self.total += len(rows)
+        self.actions.update(map(_action, rows))
+        self.ports.update(map(_port, rows))
+        self.per_minute.update(map(_minute, rows))
+        self.ips.update(Counter(map(_ip, rows)))
+        first, last = min(rows)[:2], max(rows)[:2]
+        self.first = min(self.first, first) if self.first else first
+        self.last = max(self.last, last) if self.last else last
+
+    def merge(self, other):
+        self.total += other.total
+        self.actions.update(other.actions)
+        self.ports.update(other.ports)
+        self.per_minute.update(other.per_minute)
+        self.ips.merge(other.ips)
+        for bound in (other.first, other.last):
+            if bound:
+                self.first = min(self.first, bound) if self.first else bound
+                self.last = max(self.last, bound) if self.last else bound
+
+    def histogram(self, bucket=1):
+        """[(начало корзины 'ГГГГ-ММ-ДД ЧЧ:ММ', событий)] по возрастанию времени"""
+        if bucket <= 1:
+            return [(minute.decode(), count) for minute, count in sorted(self.per_minute.items())]
+        buckets = Counter()
+        for minute, count in self.per_minute.items():
+            moment = datetime.strptime(minute.decode(), "%Y-%m-%d %H:%M")
+            moment -= timedelta(minutes=(moment.hour * 60 + moment.minute) % bucket)
+            buckets[moment.strftime("%Y-%m-%d %H:%M")] += count
+        return sorted(buckets.items())
+
+    def to_dict(self, top=10, bucket=None):
+        stamp = lambda key: (key[0] + b":" + key[1]).decode() if key else None
+        data = {
+            "total": self.total,
+            "first": stamp(self.first),
+            "last": stamp(self.last),
+            "actions": {a.decode(): n for a, n in self.actions.most_common()},
+            "ports": {int(p): n for p, n in self.ports.most_common()},
+            "top_ips": [{"ip": ip.decode(), "count": n} for ip, n in self.ips.most_common(top)],
+            "top_ips_error": self.ips.error,
+        }
+        if bucket:
+            data["histogram"] = [{"minute": m, "count": n} for m, n in self.histogram(bucket)]
+        return data
+
+class LogReader:
+    """Один файл журнала, отображённый в память, с разреженным индексом времени"""
+    def __init__(self, path, step=INDEX_STEP, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        # Пустой файл отобразить нельзя — тогда читать нечего
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        if self.size and hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self.index = TimeIndex(step)
+        self.index.extend(self._map, self.size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.size:
+            self._map.close()
+        self._file.close()
+
+    def chunks(self, query, start=None, end=None):
+        """Списки подходящих строк по кускам файла: из части, выбранной индексом,
+        или из явно заданной [start, end) — доли файла одного процесса"""
+        if start is None:
+            start, end = self.index.span(query.since, query.until, self.size)
+        pos, buf = start, self._map
+        while pos < end:
+            stop = min(pos + self.chunk_size, end)
+            if stop < end:
+                stop = buf.rfind(b"\n", pos, stop) + 1 or buf.find(b"\n", stop, end) + 1 or end
+            rows = query.parse(buf, pos, stop)
+            if rows:
+                yield rows
+            pos = stop
+
+    def split(self, query, parts):
+        """Часть файла для запроса, поделённая на parts диапазонов по границам строк"""
+        start, end = self.index.span(query.since, query.until, self.size)
+        bounds = [start]
+        for i in range(1, parts):
+            cut = start + (end - start) * i // parts
+            cut = self._map.find(b"\n", max(cut - 1, bounds[-1]), end) + 1 or end
+            bounds.append(max(cut, bounds[-1]))
+        bounds.append(end)
+        return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+    def summarize(self, query, top_capacity=1000, summary=None, start=None, end=None):
+        summary = summary or Summary(top_capacity)
+        for rows in self.chunks(query, start, end):
+            summary.add(rows)
+        return summary
+
+def _summarize_part(path, query, top_capacity, start, end):
+    with LogReader(path) as reader:
+        return reader.summarize(query, top_capacity, start=start, end=end)
+
+def summarize(paths, query, top_capacity=1000, workers=1):
+    """Общая сводка по нескольким файлам (например, ротированным копиям и текущему).
+    workers > 1 — файлы делятся на диапазоны строк и разбираются в процессах."""
+    summary = Summary(top_capacity)
+    if workers <= 1:
+        for path in paths:
+            with LogReader(path) as reader:
+                reader.summarize(query, summary=summary)
+        return summary
+    tasks = []
+    for path in paths:
+        with LogReader(path) as reader:
+            tasks += [(path, query, top_capacity, start, end) for start, end in reader.split(query, workers)]
+    with multiprocessing.Pool(workers) as pool:
+        for part in pool.starmap(_summarize_part, tasks):
+            summary.merge(part)
+    return summary
+
+def follow(path, query, interval=1.0, from_start=False, chunk_size=CHUNK_SIZE):
+    """Бесконечный генератор списков новых строк растущего файла.
+
+    Ротацию (смена inode) и усечение замечает по stat: старый файл дочитывается
+    до конца, новый читается с начала. Незавершённая строка ждёт следующего чтения.
+    """
+    f, inode, pending = None, None, b""
+    while True:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if f is not None and (st is None or st.st_ino != inode or st.st_size < f.tell()):
+            rotated = st is None or st.st_ino != inode
+            while rotated:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                rows, pending = _complete(query, pending + data)
+                if rows:
+                    yield rows
+            f.close()
+            f, pending = None, b""
+        if f is None and st is None:
+            from_start = True  # файла ещё нет — появившийся читаем с начала
+        if f is None and st is not None:
+            f = open(path, "rb")
+            inode = os.fstat(f.fileno()).st_ino
+            if not from_start:
+                f.seek(0, os.SEEK_END)
+            from_start = True  # после ротации новый файл читается целиком
+        data = f.read(chunk_size) if f is not None else b""
+        if not data:
+            time.sleep(interval)
+            continue
+        rows, pending = _complete(query, pending + data)
+        if rows:
+            yield rows
+
+def _complete(query, data):
+    cut = data.rfind(b"\n") + 1
+    return query.parse(data[:cut]) if cut else [], data[cut:]
+
+def _split(value):
+    return [item for item in value.split(",") if item] if value else None
+
+def format_row(row):
+    line = f"[{row[MINUTE].decode()}:{row[SECOND].decode()}] {row[IP].decode():<15} -> :{row[PORT].decode()} | {row[ACTION].decode():<20}"
+    return line + (f" | {row[DETAILS].decode('utf-8', 'replace')}" if len(row) > DETAILS else "")
+
+def print_summary(summary, top, bucket):
+    if not summary.total:
+        print("Подходящих событий нет")
+        return
+    data = summary.to_dict(top, bucket)
+    print(f"Событий: {data['total']}  ({data['first']} — {data['last']})")
+    print("\nПо действиям:")
+    for action, count in data["actions"].items():
+        print(f"  {action:<20} {count:>10}")
+    print("\nПо портам:")
+    for port, count in data["ports"].items():
+        print(f"  :{port:<19} {count:>10}")
+    error = f" (оценка снизу, погрешность до {data['top_ips_error']})" if data["top_ips_error"] else ""
+    print(f"\nTop-{top} источников{error}:")
+    for item in data["top_ips"]:
+        print(f"  {item['ip']:<20} {item['count']:>10}")
+    if bucket:
+        print(f"\nГистограмма, корзина {bucket} мин:")
+        peak = max(item["count"] for item in data["histogram"])
+        for item in data["histogram"]:
+            print(f"  {item['minute']}  {item['count']:>8}  {'#' * max(1, round(40 * item['count'] / peak))}")
+
+def run_follow(args, query):
+    summary = Summary(args.top_capacity)
+    batch = Summary(args.top_capacity)
+    last_report = time.monotonic()
+    try:
+        for rows in follow(args.paths[-1], query, interval=min(args.interval, 0.5), from_start=args.from_start):
+            summary.add(rows)
+            if args.lines:
+                for row in rows:
+                    print(format_row(row))
+                continue
+            batch.add(rows)
+            if time.monotonic() - last_report >= args.interval:
+                counts = ", ".join(f"{a.decode()} {n}" for a, n in batch.actions.most_common())
+                print(f"[{datetime.now():%H:%M:%S}] +{batch.total}: {counts}", flush=True)
+                batch, last_report = Summary(args.top_capacity), time.monotonic()
+    except KeyboardInterrupt:
+        print()
+        print_summary(summary, args.top, args.bucket if args.histogram else None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Аналитика журнала событий прокси (security_events.log)")
+    parser.add_argument("paths", nargs="*", default=[LOG_FILE],
+                        help="Файлы журнала по порядку (ротированные копии, затем текущий)")
+    parser.add_argument("--since", help="Начало интервала: 15m, 1h, 2d или 'ГГГГ-ММ-ДД ЧЧ:ММ[:СС]'")
+    parser.add_argument("--until", help="Конец интервала, в том же формате")
+    parser.add_argument("--action", help="Только эти действия, через запятую (HONEYPOT_TRIGGER,...)")
+    parser.add_argument("--port", help="Только эти порты, через запятую")
+    parser.add_argument("--ip", help="Только эти IP, через запятую")
+    parser.add_argument("--top", type=int, default=10, help="Сколько источников показать")
+    parser.add_argument("--top-capacity", type=int, default=1000,
+                        help="Ключей в приближённом top-k (память ограничена 2*N)")
+    parser.add_argument("--workers", type=int, default=1, help="Процессов для разбора (делят файл по строкам)")
+    parser.add_argument("--histogram", action="store_true", help="Гистограмма событий по времени")
+    parser.add_argument("--bucket", type=int, default=1, help="Корзина гистограммы, минут")
+    parser.add_argument("--json", action="store_true", help="Сводка в JSON")
+    parser.add_argument("--follow", action="store_true", help="Следить за ростом последнего файла")
+    parser.add_argument("--from-start", action="store_true", help="--follow: сначала прочитать файл целиком")
+    parser.add_argument("--lines", action="store_true", help="--follow: печатать подходящие строки")
+    parser.add_argument("--interval", type=float, default=5, help="--follow: период сводки, сек")
+    args = parser.parse_args()
+
+    try:
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until) if args.until else None
+    except ValueError as e:
+        parser.error(str(e))
+    ports = _split(args.port)
+    if ports and not all(p.isdigit() for p in ports):
+        parser.error("--port: ожидаются номера портов через запятую")
+    query = Query(since, until, _split(args.action), ports, _split(args.ip), details=args.follow and args.lines)
+    if args.follow:
+        run_follow(args, query)
+        return
+
+    started = time.perf_counter()
+    try:
+        summary = summarize(args.paths, query, args.top_capacity, args.workers)
+    except OSError as e:
+        sys.exit(f"[ERROR] {e}")
+    bucket = args.bucket if args.histogram else None
+    if args.json:
+        json.dump(summary.to_dict(args.top, bucket), sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+    print_summary(summary, args.top, bucket)
+    print(f"\n[{time.perf_counter() - started:.3f} с]")
+
+if __name__ == "__main__":
+    main()
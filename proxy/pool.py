@@ -0,0 +1,167 @@
+# pool.py
+# Ограниченный пул простаивающих соединений к upstream с проверкой живости
+# и вытеснением по времени простоя. Версии для threaded- и asyncio-движков.
+import asyncio
+import collections
+import socket
+import threading
+import time
+
+class _IdleSet:
+    """Стек простаивающих соединений: берём самое свежее, вытесняем самые старые"""
+    def __init__(self, max_idle, idle_timeout):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def pop(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            return None
+
+    def push(self, conn):
+        """False — пул полон, выключен или закрыт, соединение нужно закрыть"""
+        with self._lock:
+            if self.closed or len(self._idle) >= self.max_idle:
+                return False
+            self._idle.append((time.monotonic(), conn))
+            return True
+
+    def expired(self):
+        deadline = time.monotonic() - self.idle_timeout
+        out = []
+        with self._lock:
+            while self._idle and self._idle[0][0] < deadline:
+                out.append(self._idle.popleft()[1])
+        return out
+
+    def drain(self, close=False):
+        """Забрать все простаивающие; close=True — и больше не принимать (пул закрыт)"""
+        with self._lock:
+            self.closed = self.closed or close
+            out = [conn for _, conn in self._idle]
+            self._idle.clear()
+        return out
+
+    def __len__(self):
+        return len(self._idle)
+
+def _socket_alive(sock):
+    """Простаивающее соединение живо, если в нём нет ни EOF, ни неожиданных данных"""
+    timeout = sock.gettimeout()
+    # В режиме с таймаутом recv сначала ждёт готовности сокета — проверяем без ожидания
+    sock.setblocking(False)
+    try:
+        sock.recv(1, socket.MSG_PEEK)
+        return False
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+class UpstreamPool:
+    """Пул сокетов к upstream для threaded-движка. max_idle=0 — пул выключен"""
+    def __init__(self, host, port, max_idle=32, idle_timeout=30.0, connect_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._idle = _IdleSet(max_idle, idle_timeout)
+
+    def acquire(self, fresh=False):
+        """-> (сокет, reused). fresh=True — новое соединение мимо пула (запрос не повторить)"""
+        while not fresh:
+            item = self._idle.pop()
+            if item is None:
+                break
+            stamp, sock = item
+            if time.monotonic() - stamp < self._idle.idle_timeout and _socket_alive(sock):
+                return sock, True
+            sock.close()
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock, False
+
+    def release(self, sock):
+        if not self._idle.push(sock):
+            sock.close()
+
+    def discard(self, sock):
+        try: sock.close()
+        except OSError: pass
+
+    def evict_idle(self):
+        for sock in self._idle.expired():
+            sock.close()
+
+    def start_reaper(self):
+        def loop():
+            while not self._idle.closed:
+                time.sleep(max(self._idle.idle_timeout / 2, 0.5))
+                self.evict_idle()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def close(self):
+        """Закрыть простаивающие; занятые соединения закроются при release()"""
+        for sock in self._idle.drain(close=True):
+            sock.close()
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+class AsyncUpstreamPool:
+    """Пул (reader, writer) к upstream для asyncio-движка. max_idle=0 — пул выключен"""
+    def __init__(self, host, port, max_idle=32, idle_timeout=30.0, connect_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._idle = _IdleSet(max_idle, idle_timeout)
+
+    @staticmethod
+    def _alive(conn):
+        reader, writer = conn
+        return not writer.is_closing() and not reader.at_eof() and not reader._buffer
+
+    async def acquire(self, fresh=False):
+        """-> ((reader, writer), reused). fresh=True — новое соединение мимо пула"""
+        while not fresh:
+            item = self._idle.pop()
+            if item is None:
+                break
+            stamp, conn = item
+            if time.monotonic() - stamp < self._idle.idle_timeout and self._alive(conn):
+                return conn, True
+            conn[1].close()
+        async with asyncio.timeout(self.connect_timeout):
+            conn = await asyncio.open_connection(self.host, self.port)
+        return conn, False
+
+    def release(self, conn):
+        if not self._idle.push(conn):
+            conn[1].close()
+
+    def discard(self, conn):
+        conn[1].close()
+
+    def evict_idle(self):
+        for _, writer in self._idle.expired():
+            writer.close()
+
+    async def reaper(self):
+        while not self._idle.closed:
+            await asyncio.sleep(max(self._idle.idle_timeout / 2, 0.5))
+            self.evict_idle()
+
+    def close(self):
+        """Закрыть простаивающие; занятые соединения закроются при release()"""
+        for _, writer in self._idle.drain(close=True):
+            writer.close()
+
+    @property
+    def idle(self):
+        return len(self._idle)
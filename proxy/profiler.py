@@ -0,0 +1,106 @@
+# profiler.py
+# Сэмплирующий профайлер по запросу: отдельный поток снимает стеки всех потоков
+# через sys._current_frames() и считает одинаковые стеки. Результат — формат
+# folded stacks ("поток;файл:функция;... число"), его принимают flamegraph.pl,
+# speedscope и inferno. Плюс сервер метрик с необязательным /debug/profile.
+import collections
+import os
+import socketserver
+import sys
+import threading
+import time
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from prometheus_client import make_wsgi_app
+
+MAX_PROFILE_SECONDS = 60.0
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def sample_stacks(seconds, interval=0.005):
+    """Сэмплирует стеки всех потоков seconds секунд. -> (Counter стеков, число снимков)"""
+    own = threading.get_ident()
+    names = {}
+    stacks = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if ident not in names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)).replace(";", "_"))
+            stacks[";".join(reversed(labels))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+def folded(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass  # scrape каждые несколько секунд — не засоряем вывод
+
+def metrics_app(registry, profiling=False, on_scrape=None):
+    """WSGI-приложение: метрики, а при profiling=True ещё /debug/profile?seconds=N.
+    on_scrape() вызывается перед каждой выдачей метрик (перенос локальных счётчиков)"""
+    metrics = make_wsgi_app(registry)
+    busy = threading.Lock()
+
+    def app(environ, start_response):
+        if not profiling or environ.get("PATH_INFO") != "/debug/profile":
+            if on_scrape is not None:
+                on_scrape()
+            return metrics(environ, start_response)
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        try:
+            seconds = min(float(query.get("seconds", ["10"])[0]), MAX_PROFILE_SECONDS)
+            interval = max(float(query.get("interval", ["0.005"])[0]), 0.001)
+        except ValueError:
+            start_response("400 Bad Request", [("Content-Type", "text/plain")])
+            return [b"seconds/interval must be numbers\n"]
+        if not busy.acquire(blocking=False):
+            start_response("409 Conflict", [("Content-Type", "text/plain")])
+            return [b"profile already running\n"]
+        try:
+            stacks, samples = sample_stacks(seconds, interval)
+        finally:
+            busy.release()
+        body = folded(stacks).encode()
+        start_response("200 OK", [("Content-Type", "text/plain; charset=utf-8"),
+                                  ("X-Profile-Samples", str(samples))])
+        return [body]
+
+    return app
+
+def serve_metrics(port, registry, profiling=False, addr="0.0.0.0", on_scrape=None, sock=None):
+    """Аналог prometheus_client.start_http_server с необязательным профайлером.
+    sock — уже слушающий сокет (полученный от прежнего процесса) вместо привязки к port"""
+    app = metrics_app(registry, profiling, on_scrape)
+    if sock is None:
+        httpd = make_server(addr, port, app, _ThreadingWSGIServer, handler_class=_QuietHandler)
+    else:
+        httpd = _ThreadingWSGIServer(sock.getsockname(), _QuietHandler, bind_and_activate=False)
+        httpd.socket.close()
+        httpd.socket = sock
+        httpd.server_name, httpd.server_port = sock.getsockname()[:2]
+        httpd.setup_environ()
+        httpd.set_app(app)
+    # Сокет может быть общим с другим процессом: без O_NONBLOCK accept() после
+    # select() зависнет, если соединение забрал тот
+    httpd.socket.setblocking(False)
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
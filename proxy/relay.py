@@ -0,0 +1,219 @@
+# relay.py
+# Двунаправленная пересылка байт между клиентом и upstream (passthrough-режим).
+# Оба направления качаются одновременно до закрытия, half-close передаётся
+# через shutdown(SHUT_WR)/write_eof, по простою соединение закрывается.
+# Threaded-движок: один poll-цикл на соединение; на Linux данные идут через
+# os.splice (ядро, без копирования в Python), иначе — recv_into в заранее
+# выделенный буфер.
+import asyncio
+import errno
+import os
+import select
+import socket
+import sys
+import time
+
+RELAY_BUFFER = 65536
+SPLICE_AVAILABLE = hasattr(os, "splice") and sys.platform.startswith("linux")
+
+_DISCONNECT = (errno.ECONNRESET, errno.EPIPE, errno.ENOTCONN, errno.ESHUTDOWN, errno.ETIMEDOUT)
+
+class _Direction:
+    """Одно направление src -> dst: данные, ещё не отданные в dst, лежат в pipe или буфере"""
+    def __init__(self, src, dst, use_splice, buffer_size):
+        self.src = src
+        self.dst = dst
+        self.src_fd = src.fileno()
+        self.dst_fd = dst.fileno()
+        self.use_splice = use_splice
+        self.pending = 0
+        self.eof = False
+        self.shut = False
+        self.transferred = 0
+        if use_splice:
+            self.pipe_r, self.pipe_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+            self.flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+            self.chunk = buffer_size
+        else:
+            self.view = memoryview(bytearray(buffer_size))
+            self.offset = 0
+
+    @property
+    def want_read(self):
+        return not self.eof and not self.pending
+
+    @property
+    def finished(self):
+        return self.eof and not self.pending
+
+    def pump_in(self):
+        try:
+            if self.use_splice:
+                n = os.splice(self.src_fd, self.pipe_w, self.chunk, flags=self.flags)
+            else:
+                n = self.src.recv_into(self.view)
+                self.offset = 0
+        except BlockingIOError:
+            return
+        if n == 0:
+            self.eof = True
+        self.pending = n
+
+    def pump_out(self):
+        try:
+            if self.use_splice:
+                n = os.splice(self.pipe_r, self.dst_fd, self.pending, flags=self.flags)
+            else:
+                n = self.dst.send(self.view[self.offset:self.offset + self.pending])
+                self.offset += n
+        except BlockingIOError:
+            return
+        self.pending -= n
+        self.transferred += n
+
+    def close_pipe(self):
+        if self.use_splice:
+            os.close(self.pipe_r)
+            os.close(self.pipe_w)
+
+def relay_sockets(client, upstream, idle_timeout=300.0, use_splice=None, buffer_size=RELAY_BUFFER):
+    """Пересылает данные в обе стороны до закрытия обеих или простоя idle_timeout.
+
+    Возвращает (байт клиент->upstream, байт upstream->клиент).
+    """
+    if use_splice is None:
+        use_splice = SPLICE_AVAILABLE
+    client.setblocking(False)
+    upstream.setblocking(False)
+    up = _Direction(client, upstream, use_splice, buffer_size)
+    down = _Direction(upstream, client, use_splice, buffer_size)
+    poller = select.poll()
+    registered = set()
+    timeout_ms = int(idle_timeout * 1000)
+    try:
+        while not (up.finished and down.finished):
+            for direction in (up, down):
+                if direction.want_read:
+                    direction.pump_in()
+                if direction.pending:
+                    direction.pump_out()
+                if direction.finished and not direction.shut:
+                    # Half-close: источник закончил, сообщаем об этом второй стороне
+                    direction.shut = True
+                    try: direction.dst.shutdown(socket.SHUT_WR)
+                    except OSError: pass
+            if up.finished and down.finished:
+                break
+
+            for sock, reader, writer in ((client, up, down), (upstream, down, up)):
+                mask = (select.POLLIN if reader.want_read else 0) | (select.POLLOUT if writer.pending else 0)
+                if mask:
+                    poller.register(sock, mask)
+                    registered.add(sock)
+                elif sock in registered:
+                    # С маской 0 poll всё равно отдаёт POLLERR/POLLHUP — и крутится вхолостую
+                    poller.unregister(sock)
+                    registered.discard(sock)
+            # На сокете с ненулевой маской ошибка всплывёт из recv/send как _DISCONNECT
+            if not poller.poll(timeout_ms):
+                break  # простой
+    except OSError as e:
+        if e.errno not in _DISCONNECT:
+            raise
+    finally:
+        up.close_pipe()
+        down.close_pipe()
+    return up.transferred, down.transferred
+
+# === asyncio ===
+
+class _RelayProtocol(asyncio.Protocol):
+    """Сторона пары: принятые данные сразу уходят в транспорт соседа"""
+    def __init__(self, relay):
+        self.relay = relay
+        self.transport = None
+        self.peer = None
+        self.eof = False
+        self.transferred = 0
+        self.stream_protocol = None  # прежний протокол транспорта (StreamReaderProtocol)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.relay.last_activity = time.monotonic()
+        self.transferred += len(data)
+        self.peer.transport.write(data)
+
+    def eof_received(self):
+        self.eof = True
+        if self.peer.transport.can_write_eof():
+            self.peer.transport.write_eof()
+        if self.peer.eof:
+            self.relay.close()
+        return True  # оставляем соединение полуоткрытым
+
+    def pause_writing(self):
+        # Сосед пишет быстрее, чем мы успеваем отдавать — притормаживаем его чтение
+        self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        self.peer.transport.resume_reading()
+
+    def connection_lost(self, exc):
+        if self.stream_protocol is not None:
+            # Иначе StreamWriter.wait_closed() у обработчика не дождётся закрытия
+            self.stream_protocol.connection_lost(exc)
+        self.relay.close()
+
+class AsyncRelay:
+    """Пара протоколов клиент <-> upstream поверх транспортов asyncio"""
+    def __init__(self, idle_timeout=300.0):
+        self.idle_timeout = idle_timeout
+        self.last_activity = time.monotonic()
+        self.client = _RelayProtocol(self)
+        self.upstream = _RelayProtocol(self)
+        self.client.peer = self.upstream
+        self.upstream.peer = self.client
+        self._done = None
+
+    def close(self):
+        for side in (self.client, self.upstream):
+            if side.transport is not None:
+                side.transport.close()
+        if self._done is not None and not self._done.done():
+            self._done.set_result(None)
+
+    def _watchdog(self):
+        idle = time.monotonic() - self.last_activity
+        if idle >= self.idle_timeout:
+            self.close()
+        elif not self._done.done():
+            asyncio.get_running_loop().call_later(self.idle_timeout - idle, self._watchdog)
+
+    async def run(self, reader, writer, host, port, connect_timeout=5.0):
+        """Пересаживает клиентский транспорт со StreamReader на relay и ждёт конца сессии.
+
+        Возвращает (байт клиент->upstream, байт upstream->клиент).
+        """
+        loop = asyncio.get_running_loop()
+        self._done = loop.create_future()
+        async with asyncio.timeout(connect_timeout):
+            await loop.create_connection(lambda: self.upstream, host, port)
+
+        transport = writer.transport
+        self.client.stream_protocol = transport.get_protocol()
+        transport.set_protocol(self.client)
+        self.client.connection_made(transport)
+        if transport.is_closing():
+            self.close()
+        # Что клиент успел прислать до пересадки, осталось в StreamReader
+        reader.feed_eof()
+        early = await reader.read()
+        if early:
+            self.client.data_received(early)
+        transport.resume_reading()
+
+        loop.call_later(self.idle_timeout, self._watchdog)
+        await self._done
+        return self.client.transferred, self.upstream.transferred
@@ -0,0 +1,326 @@
+# rewrite.py
+# Потоковая переписка HTTP-ответов: заголовки отдаются сразу после разбора,
+# тело переписывается по кускам без буферизации всего ответа.
+import re
+
+MAX_HEADER_SIZE = 65536
+
+def encode_chunk(data):
+    """Один кусок Transfer-Encoding: chunked"""
+    if not data:
+        return b""
+    return b"%x\r\n" % len(data) + data + b"\r\n"
+
+LAST_CHUNK = b"0\r\n\r\n"
+
+class ChunkedDecoder:
+    """Инкрементальный декодер Transfer-Encoding: chunked"""
+    def __init__(self):
+        self._buf = b""
+        self._remaining = 0
+        self._state = "size"
+        self.done = False
+        self.leftover = b""  # байты после завершающего куска (следующее сообщение)
+
+    def feed(self, data):
+        buf = self._buf + data
+        out = []
+        pos = 0
+        while not self.done:
+            if self._state == "size":
+                end = buf.find(b"\r\n", pos)
+                if end < 0: break
+                size = buf[pos:end].split(b";", 1)[0].strip()
+                self._remaining = int(size, 16)
+                pos = end + 2
+                self._state = "data" if self._remaining else "trailer"
+            elif self._state == "data":
+                take = min(self._remaining, len(buf) - pos)
+                if not take: break
+                out.append(buf[pos:pos + take])
+                pos += take
+                self._remaining -= take
+                if not self._remaining:
+                    self._state = "crlf"
+            elif self._state == "crlf":
+                if len(buf) - pos < 2: break
+                pos += 2
+                self._state = "size"
+            else:  # trailer: строки до пустой
+                end = buf.find(b"\r\n", pos)
+                if end < 0: break
+                line = buf[pos:end]
+                pos = end + 2
+                if not line:
+                    self.done = True
+        if self.done:
+            self.leftover = buf[pos:]
+            self._buf = b""
+        else:
+            self._buf = buf[pos:]
+        return b"".join(out)
+
+class StreamingReplacer:
+    """Замена совпадений на потоке байт.
+
+    Совпадения, попавшие на границу кусков, не теряются: последние
+    max_match - 1 байт удерживаются до прихода следующего куска.
+    matcher(buf) -> [(start, end, имя правила, замена)] по возрастанию, без перекрытий.
+    """
+    def __init__(self, matcher, max_match):
+        self.matcher = matcher
+        self.hold = max(max_match - 1, 0)
+        self.fired = {}
+        self._carry = b""
+
+    def _sub(self, buf, limit):
+        out = []
+        pos = 0
+        for start, end, name, replacement in self.matcher(buf):
+            if start >= limit:
+                break
+            out.append(buf[pos:start])
+            out.append(replacement)
+            self.fired[name] = self.fired.get(name, 0) + 1
+            pos = end
+        cut = max(pos, limit)
+        out.append(buf[pos:cut])
+        return b"".join(out), buf[cut:]
+
+    def feed(self, data):
+        buf = self._carry + data if self._carry else data
+        out, self._carry = self._sub(buf, len(buf) - self.hold)
+        return out
+
+    def flush(self):
+        buf, self._carry = self._carry, b""
+        out, _ = self._sub(buf, len(buf))
+        return out
+
+class ResponseRewriter:
+    """Конечный автомат: заголовки -> тело -> конец.
+
+    header_rules: {имя заголовка в нижнем регистре: новое значение или None (удалить)}
+    replacer: StreamingReplacer для тела или None
+    chunked_ok: клиент говорит на HTTP/1.1 и понимает chunked
+    keep_alive: клиент хочет оставить соединение открытым
+    """
+    HOP_BY_HOP = (b"connection", b"keep-alive", b"proxy-connection")
+
+    def __init__(self, header_rules, replacer=None, head_request=False, chunked_ok=True, keep_alive=False):
+        self.header_rules = header_rules
+        self.replacer = replacer
+        self.head_request = head_request
+        self.chunked_ok = chunked_ok
+        self.keep_alive = keep_alive
+        self.fired = {}
+        self.done = False
+        self.raw = False          # заголовки не разобраны — пересылаем как есть
+        self.truncated = False    # upstream закрылся раньше конца тела
+        self.leftover = b""
+        self._upstream_framed = False
+        self._upstream_close = True
+        self._state = "headers"
+        self._buf = b""
+        self._body_left = None    # остаток по Content-Length
+        self._decoder = None      # ChunkedDecoder для chunked-ответа
+        self._rewrite_body = False
+        self._out_chunked = False
+        self._dechunk = False     # chunked от upstream клиенту HTTP/1.0 — тело без разметки
+
+    @property
+    def headers_sent(self):
+        return self._state != "headers"
+
+    @property
+    def client_reusable(self):
+        """Ответ отдан целиком и корректно ограничен — клиентское соединение можно продолжать"""
+        return self.keep_alive and self.done and not self.raw and not self.truncated
+
+    @property
+    def upstream_reusable(self):
+        """Upstream-соединение можно вернуть в пул"""
+        return (self.done and not self.raw and not self.truncated and not self.leftover
+                and self._upstream_framed and not self._upstream_close)
+
+    def _parse_head(self, head):
+        """-> (строка статуса, версия, код, [(имя, имя в нижнем регистре, значение)]) с применёнными правилами"""
+        lines = head.split(b"\r\n")
+        status = lines[0]
+        parts = status.split(b" ", 2)
+        version = parts[0]
+        code = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 200
+
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(b":")
+            if not sep:
+                continue
+            key = name.strip().lower()
+            if key in self.header_rules:
+                new = self.header_rules[key]
+                if new is None:
+                    self.fired[key.decode()] = self.fired.get(key.decode(), 0) + 1
+                    continue
+                if value.strip() != new:
+                    self.fired[key.decode()] = self.fired.get(key.decode(), 0) + 1
+                value = b" " + new
+            headers.append((name, key, value))
+        return status, version, code, headers
+
+    @staticmethod
+    def _build_head(status, headers):
+        out = [status]
+        out.extend(name + b":" + value for name, _, value in headers)
+        return b"\r\n".join(out) + b"\r\n\r\n"
+
+    def _rewrite_headers(self, status, version, code, headers):
+        fields = {key: value.strip().lower() for _, key, value in headers}
+        # Connection относится к отдельному hop'у: upstream и клиент договариваются независимо
+        headers = [h for h in headers if h[1] not in self.HOP_BY_HOP]
+        self._upstream_close = (b"close" in fields.get(b"connection", b"")
+                                or (version != b"HTTP/1.1" and b"keep-alive" not in fields.get(b"connection", b"")))
+
+        no_body = self.head_request or code in (204, 304, 101)
+        if no_body:
+            self._body_left = 0
+        elif b"chunked" in fields.get(b"transfer-encoding", b""):
+            self._decoder = ChunkedDecoder()
+        elif b"content-length" in fields:
+            self._body_left = int(fields[b"content-length"])
+        self._upstream_framed = no_body or self._decoder is not None or self._body_left is not None
+
+        encoding = fields.get(b"content-encoding", b"identity")
+        self._rewrite_body = (not no_body and self.replacer is not None
+                              and encoding in (b"", b"identity"))
+        if self._rewrite_body:
+            # Длина тела после замены неизвестна заранее: убираем Content-Length,
+            # для HTTP/1.1 переходим на chunked, для HTTP/1.0 — ответ до закрытия соединения
+            headers = [h for h in headers if h[1] not in (b"content-length", b"transfer-encoding")]
+            if version == b"HTTP/1.1" and self.chunked_ok:
+                self._out_chunked = True
+                headers.append((b"Transfer-Encoding", b"transfer-encoding", b" chunked"))
+            client_framed = no_body or self._out_chunked
+        elif self._decoder is not None and not self.chunked_ok:
+            # Клиент HTTP/1.0 не разберёт chunked: снимаем разметку, тело — до закрытия соединения
+            self._dechunk = True
+            headers = [h for h in headers if h[1] != b"transfer-encoding"]
+            client_framed = False
+        else:
+            client_framed = self._upstream_framed
+
+        # Ответ «до закрытия» не даёт клиенту найти конец сообщения — keep-alive невозможен
+        self.keep_alive = self.keep_alive and client_framed
+        if not self.keep_alive:
+            headers.append((b"Connection", b"connection", b" close"))
+        elif not self.chunked_ok:
+            headers.append((b"Connection", b"connection", b" keep-alive"))
+
+        return self._build_head(status, headers)
+
+    def _emit_body(self, body, final=False, terminate=True):
+        out = b""
+        if self._rewrite_body:
+            out = self.replacer.feed(body) if body else b""
+            if final:
+                out += self.replacer.flush()
+            if self._out_chunked:
+                out = encode_chunk(out) + (LAST_CHUNK if final and terminate else b"")
+        return out
+
+    def _finish_body(self):
+        self.done = True
+        if self.replacer is not None:
+            for name, count in self.replacer.fired.items():
+                self.fired[name] = self.fired.get(name, 0) + count
+
+    def _feed_body(self, data):
+        if self._decoder is not None:
+            payload = self._decoder.feed(data)
+            if self._decoder.done:
+                self.leftover = self._decoder.leftover
+                raw = data[:len(data) - len(self.leftover)] if self.leftover else data
+                if self._rewrite_body:
+                    out = self._emit_body(payload, final=True)
+                else:
+                    out = payload if self._dechunk else raw
+                self._finish_body()
+                return out
+            if self._rewrite_body:
+                return self._emit_body(payload)
+            return payload if self._dechunk else data
+
+        if self._body_left is not None:
+            body, self.leftover = data[:self._body_left], data[self._body_left:]
+            self._body_left -= len(body)
+            if not self._body_left:
+                out = self._emit_body(body, final=True) if self._rewrite_body else body
+                self._finish_body()
+                return out
+            return self._emit_body(body) if self._rewrite_body else body
+
+        # Тело до закрытия соединения
+        return self._emit_body(data) if self._rewrite_body else data
+
+    def feed(self, data):
+        """Принимает очередной кусок от upstream, возвращает байты для клиента"""
+        if self.done:
+            self.leftover += data
+            return b""
+        if self.raw:
+            return data
+        if self._state == "headers":
+            return self._feed_headers(data)
+        return self._feed_body(data)
+
+    def _feed_headers(self, data):
+        # Поиск с места прошлого куска (минус 3 байта на разрыв разделителя), а не с начала
+        start = max(len(self._buf) - 3, 0)
+        self._buf += data
+        interim = b""
+        while True:
+            idx = self._buf.find(b"\r\n\r\n", start)
+            if idx < 0:
+                if len(self._buf) > MAX_HEADER_SIZE:
+                    self.raw = True
+                    out, self._buf = self._buf, b""
+                    return interim + out
+                return interim
+            head, rest = self._buf[:idx], self._buf[idx + 4:]
+            self._buf = b""
+            try:
+                status, version, code, headers = self._parse_head(head)
+                if 100 <= code < 200 and code != 101:
+                    # Промежуточный ответ (100 Continue, 103 Early Hints): окончательный ещё впереди.
+                    # Клиенту HTTP/1.0 промежуточные ответы не отправляются
+                    if self.chunked_ok:
+                        interim += self._build_head(status, [h for h in headers if h[1] not in self.HOP_BY_HOP])
+                    self._buf, start = rest, 0
+                    continue
+                out = interim + self._rewrite_headers(status, version, code, headers)
+            except ValueError:
+                self.raw = True
+                return interim + head + b"\r\n\r\n" + rest
+            self._state = "body"
+            if self._body_left == 0:
+                self._finish_body()
+                self.leftover = rest
+                return out
+            return out + (self._feed_body(rest) if rest else b"")
+
+    def finish(self):
+        """Upstream закрыл соединение: дописываем удержанный хвост. Если тело с известной
+        границей оборвалось (truncated), завершающий chunk не отправляется — клиент
+        должен увидеть обрыв, а не целый ответ; соединение с ним нужно оборвать"""
+        if self.done:
+            return b""
+        if self._state == "headers":
+            self.raw = True
+            out, self._buf = self._buf, b""
+            return out
+        if self.raw:
+            return b""
+        self.truncated = self._upstream_framed
+        out = self._emit_body(b"", final=True, terminate=not self.truncated)
+        self._finish_body()
+        return out
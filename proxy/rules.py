@@ -0,0 +1,178 @@
+# rules.py
+# Таблица правил маскировки из файла: заголовки, литеральные замены и regex-правила.
+# Литералы ищутся одним проходом независимо от их числа: автоматом Ахо-Корасик
+# (pyahocorasick), а без него — одним trie-шаблоном re.
+import json
+import re
+
+from rewrite import StreamingReplacer
+
+try:
+    import ahocorasick
+except ImportError:  # C-расширение не установлено — работаем на trie-регулярке
+    ahocorasick = None
+
+DEFAULT_REGEX_MAX_LEN = 256
+
+class RuleError(ValueError):
+    pass
+
+def trie_regex(words):
+    """Регулярное выражение-префиксное дерево для набора литералов.
+
+    На каждой позиции движок re идёт по дереву не глубже длины самого длинного
+    литерала, а не перебирает все правила. Более длинный литерал побеждает.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for byte in word:
+            node = node.setdefault(byte, {})
+        node[None] = True
+
+    def build(node):
+        terminal = None in node
+        alts = [re.escape(bytes([k])) + build(node[k]) for k in sorted(k for k in node if k is not None)]
+        if not alts:
+            return b""
+        if len(alts) == 1 and not terminal:
+            return alts[0]
+        group = b"(?:" + b"|".join(alts) + b")"
+        return group + b"?" if terminal else group
+
+    return build(trie)
+
+def _leftmost_longest(candidates):
+    """Жадный выбор непересекающихся совпадений: самое левое, при равенстве — самое длинное"""
+    candidates.sort(key=lambda c: (c[0], c[0] - c[1]))
+    selected = []
+    pos = 0
+    for cand in candidates:
+        if cand[0] >= pos:
+            selected.append(cand)
+            pos = cand[1]
+    return selected
+
+class RuleSet:
+    """Скомпилированный набор правил маскировки"""
+    def __init__(self, headers=(), literals=(), regex=(), use_automaton=True):
+        self.header_rules = {}
+        for rule in headers:
+            name = rule["name"].encode().strip().lower()
+            self.header_rules[name] = None if rule.get("remove") else rule["value"].encode()
+
+        self.literals = {}       # точное совпадение -> (имя, замена)
+        self.literals_ci = {}    # нижний регистр -> (имя, замена)
+        for rule in literals:
+            needle = rule["match"].encode()
+            if not needle:
+                raise RuleError(f"Пустой литерал в правиле {rule.get('name')}")
+            entry = (rule.get("name", rule["match"]), rule["replace"].encode())
+            if rule.get("ignore_case"):
+                self.literals_ci[needle.lower()] = entry
+            else:
+                self.literals[needle] = entry
+
+        self.regex = []          # (имя, скомпилированный шаблон, замена)
+        max_len = max((len(w) for w in list(self.literals) + list(self.literals_ci)), default=0)
+        alternatives = []
+
+        self.automaton = None
+        if (self.literals or self.literals_ci) and use_automaton and ahocorasick is not None:
+            self.automaton = self._build_automaton()
+        else:
+            if self.literals:
+                alternatives.append(b"(?P<lit>" + trie_regex(self.literals) + b")")
+            if self.literals_ci:
+                alternatives.append(b"(?P<ilit>(?i:" + trie_regex(self.literals_ci) + b"))")
+
+        for i, rule in enumerate(regex):
+            flags = re.IGNORECASE if rule.get("ignore_case") else 0
+            pattern = rule["pattern"].encode()
+            compiled = re.compile(pattern, flags)
+            if compiled.match(b""):
+                raise RuleError(f"Regex-правило {rule.get('name')} совпадает с пустой строкой")
+            self.regex.append((rule.get("name", rule["pattern"]), compiled, rule["replace"].encode()))
+            inline = b"(?i:" + pattern + b")" if flags else b"(?:" + pattern + b")"
+            alternatives.append(b"(?P<r%d>" % i + inline + b")")
+            # Regex-совпадение длиннее max_len на стыке кусков может быть пропущено
+            max_len = max(max_len, int(rule.get("max_len", DEFAULT_REGEX_MAX_LEN)))
+
+        self.max_len = max_len
+        self.pattern = re.compile(b"|".join(alternatives)) if alternatives else None
+
+    def _build_automaton(self):
+        # Один автомат по тексту в нижнем регистре; регистрозависимые литералы
+        # проверяются точным сравнением уже после срабатывания.
+        entries = {}
+        for needle, (name, repl) in self.literals.items():
+            entries.setdefault(needle.lower(), []).append((needle, name, repl))
+        for needle, (name, repl) in self.literals_ci.items():
+            entries.setdefault(needle, []).append((None, name, repl))
+        automaton = ahocorasick.Automaton()
+        for key, candidates in entries.items():
+            word = key.decode("latin-1") if ahocorasick.unicode else key
+            automaton.add_word(word, (len(key), candidates))
+        automaton.make_automaton()
+        return automaton
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("headers", ()), data.get("literals", ()), data.get("regex", ()))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def _resolve(self, m):
+        group = m.lastgroup
+        if group == "lit":
+            return self.literals[m.group()]
+        if group == "ilit":
+            return self.literals_ci[m.group().lower()]
+        name, compiled, replace = self.regex[int(group[1:])]
+        return name, compiled.sub(replace, m.group(), count=1)
+
+    def _automaton_matches(self, buf):
+        lowered = buf.lower()
+        text = lowered.decode("latin-1") if ahocorasick.unicode else lowered
+        found = []
+        for end, (length, candidates) in self.automaton.iter(text):
+            start = end - length + 1
+            for needle, name, repl in candidates:
+                if needle is None or buf[start:end + 1] == needle:
+                    found.append((start, end + 1, name, repl))
+                    break
+        return found
+
+    def matches(self, buf):
+        """Все совпадения правил тела в buf: [(start, end, имя, замена)]"""
+        if self.automaton is None:
+            out = []
+            for m in self.pattern.finditer(buf):
+                name, repl = self._resolve(m)
+                out.append((m.start(), m.end(), name, repl))
+            return out
+        found = self._automaton_matches(buf)
+        if self.pattern is not None:
+            for m in self.pattern.finditer(buf):
+                name, repl = self._resolve(m)
+                found.append((m.start(), m.end(), name, repl))
+        return _leftmost_longest(found) if found else found
+
+    def replacer(self):
+        """Новый потоковый заменитель для одного ответа (None, если правил тела нет)"""
+        if self.pattern is None and self.automaton is None:
+            return None
+        return StreamingReplacer(self.matches, self.max_len)
+
+    def names(self):
+        """Имена всех правил — так, как они попадают в fired у переписчика"""
+        names = {name.decode() for name in self.header_rules}
+        names.update(name for name, _ in list(self.literals.values()) + list(self.literals_ci.values()))
+        names.update(name for name, _, _ in self.regex)
+        return names
+
+    def __len__(self):
+        return len(self.header_rules) + len(self.literals) + len(self.literals_ci) + len(self.regex)
@@ -1,204 +1,1232 @@
 import socket
 import threading
 import time
-import re
 import os
+import asyncio
+import argparse
+import atexit
+import signal
+import struct
+import sys
 from datetime import datetime
-from prometheus_client import Counter, Histogram, start_http_server
+import functools
+import json
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from rewrite import ResponseRewriter
+from httpparse import RequestParser, HttpError, upstream_head
+from pool import UpstreamPool, AsyncUpstreamPool
+from listeners import ConfigError, describe, load_config
+from eventlog import EventLog
+from relay import relay_sockets, AsyncRelay, SPLICE_AVAILABLE
+from workers import MULTIPROC_ENV, OFFENDERS_FILE, Supervisor, prepare_multiproc_dir, worker_id
+from admission import TokenBuckets, Tarpit, RejectSummary
+from detector import SweepDetector, load_tops, merge_top, save_top
+from stages import new_clock, observe_stage
+from fastmetrics import LocalMetrics
+from profiler import serve_metrics
+from handoff import HandoffServer, take as take_sockets, confirm as confirm_handoff
 
 # === МЕТРИКИ PROMETHEUS ===
 REQUESTS_TOTAL = Counter('security_proxy_requests_total', 'Total requests', ['port', 'action'])
 BLOCKED_REQUESTS = Counter('security_proxy_blocked_total', 'Blocked or faked requests', ['port'])
 REQUEST_DURATION = Histogram('security_proxy_request_duration_seconds', 'Request duration', ['port'])
+REWRITE_RULES = Counter('security_proxy_rewrite_rules_total', 'Obfuscation rule hits', ['rule'])
+UPSTREAM_CONNECTIONS = Counter('security_proxy_upstream_connections_total', 'Upstream connections by origin', ['result'])
+LOG_EVENTS = Counter('security_proxy_log_events_total', 'Security log events by state', ['state'])
+ADMISSION_REJECTED = Counter('security_proxy_admission_rejected_total', 'Connections rejected before dispatch',
+                             ['port', 'reason'])
+TARPIT_HELD = Gauge('security_proxy_tarpit_connections', 'Rejected connections held in tarpit',
+                    multiprocess_mode='livesum')
+ADMISSION_SOURCES = Gauge('security_proxy_admission_sources', 'Source IPs tracked by the rate limiter',
+                          multiprocess_mode='livesum')
+STAGE_DURATION = Histogram('security_proxy_stage_duration_seconds', 'Time per processing stage of a request',
+                           ['port', 'stage'],
+                           buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+IN_FLIGHT = Gauge('security_proxy_in_flight_connections', 'Connections being handled', ['port'],
+                  multiprocess_mode='livesum')
+RUNTIME_THREADS = Gauge('security_proxy_threads', 'Live Python threads', multiprocess_mode='livesum')
+RUNTIME_TASKS = Gauge('security_proxy_tasks', 'Live asyncio tasks', multiprocess_mode='livesum')
+LOG_QUEUE_DEPTH = Gauge('security_proxy_log_queue_depth', 'Security log lines waiting for the writer',
+                        multiprocess_mode='livesum')
+DETECTIONS = Counter('security_proxy_detections_total', 'Port sweep and offender detections', ['kind'])
+
+# Горячий путь пишет в ячейки своего потока через заранее разрешённые дочерние
+# метрики (порта — в Listener, общие — в init_metrics); в коллекторы — по flush()
+# перед scrape и раз в секунду
+LOCAL_METRICS = LocalMetrics()
+UPSTREAM = {}   # результат -> UPSTREAM_CONNECTIONS
+WEB_ACTIONS = ("none", "empty_request", "bad_request", "raw_forward", "allowed_with_filtering")
+TCP_ACTIONS = ("none", "fake_banner_sent", "direct_proxy")
 
 # === КОНФИГУРАЦИЯ ===
-PROXY_PORT_WEB = 9000
-PROXY_PORT_DB = 9001
-PROXY_PORT_ADMIN = 9002
+# Слушатели (порт, режим, приложение, баннер, таймауты, правила) — в файле, SIGHUP перечитывает его.
+# Переменные окружения ниже — значения по умолчанию для того, что файл не задаёт.
+CONFIG_FILE = os.environ.get("PROXY_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "listeners.json"))
+TARGET_HOST = os.environ.get("TARGET_HOST", "app")
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "8000"))
+
+# Движок обработки соединений: asyncio (один event loop) или threaded (поток на соединение)
+ENGINE = os.environ.get("PROXY_ENGINE", "asyncio")
+LISTEN_BACKLOG = int(os.environ.get("PROXY_BACKLOG", "1024"))
+MAX_CONNECTIONS = int(os.environ.get("PROXY_MAX_CONNECTIONS", "2000"))
+WORKERS = int(os.environ.get("PROXY_WORKERS", "1"))  # >1 — процессы с SO_REUSEPORT под супервизором
+WORKER_ID = worker_id()
+
+# === ОСТАНОВКА И ПЕРЕЗАПУСК ===
+# SIGTERM: приём закрывается, текущие соединения дорабатывают до PROXY_DRAIN_TIMEOUT секунд.
+# PROXY_HANDOFF — Unix-сокет, через который следующий процесс заберёт слушающие сокеты.
+DRAIN_TIMEOUT = float(os.environ.get("PROXY_DRAIN_TIMEOUT", "30"))
+HANDOFF_PATH = os.environ.get("PROXY_HANDOFF") or None
+
+# === ДОПУСК СОЕДИНЕНИЙ (до создания потока/задачи) ===
+# По умолчанию без лимита на IP: за NAT или docker-сетью все клиенты приходят с одного адреса
+IP_RATE = float(os.environ.get("PROXY_IP_RATE", "0"))            # соединений/с с одного IP, 0 — без ограничения
+IP_BURST = float(os.environ.get("PROXY_IP_BURST") or 2 * IP_RATE)
+IP_TABLE_SIZE = int(os.environ.get("PROXY_IP_TABLE_SIZE", "65536"))
+REJECT_POLICY = os.environ.get("PROXY_REJECT_POLICY", "close")   # close | tarpit
+TARPIT_SECONDS = float(os.environ.get("PROXY_TARPIT_SECONDS", "10"))
+TARPIT_MAX = int(os.environ.get("PROXY_TARPIT_MAX", "1000"))
+REJECT_LOG_INTERVAL = float(os.environ.get("PROXY_REJECT_LOG_INTERVAL", "10"))
+
+# === ОБНАРУЖЕНИЕ ОБХОДА ПОРТОВ (скользящее окно по всем соединениям, до допуска) ===
+DETECT = os.environ.get("PROXY_DETECT", "1") != "0"
+DETECT_WINDOW = float(os.environ.get("PROXY_DETECT_WINDOW", "60"))          # окно, сек
+DETECT_SWEEP_PORTS = int(os.environ.get("PROXY_DETECT_SWEEP_PORTS", "3"))   # портов за окно для сработки, 0 — выкл
+DETECT_RATE = int(os.environ.get("PROXY_DETECT_RATE", "300"))               # соединений за окно, 0 — выкл
+DETECT_REPEAT = int(os.environ.get("PROXY_DETECT_REPEAT", "3"))             # сработок до REPEAT_OFFENDER
+DETECT_WIDTH = int(os.environ.get("PROXY_DETECT_WIDTH", "16384"))           # ширина скетчей: точность и память
+DETECT_TOP = int(os.environ.get("PROXY_DETECT_TOP", "20"))                  # источников в метриках
+DETECT_LOG_MAX = 20                                                          # строк сработок в лог за секунду
 
-TARGET_HOST = "app"
-TARGET_PORT_WEB = 5000
-TARGET_PORT_DB = 5001
-TARGET_PORT_ADMIN = 5002
+# === ДИАГНОСТИКА ===
+STAGE_TIMING = os.environ.get("PROXY_STAGE_TIMING", "0") == "1"  # гистограммы по стадиям запроса
+PROFILER = os.environ.get("PROXY_PROFILER", "0") == "1"          # /debug/profile на сервере метрик
+
+# === ПРАВИЛА МАСКИРОВКИ (http-слушатели) ===
+RULES_FILE = os.environ.get("PROXY_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+UPSTREAM_CHUNK = 65536
+CLIENT_CHUNK = 65536
+
+# === ЧТЕНИЕ ЗАПРОСОВ (http-слушатели) ===
+HEADER_TIMEOUT = float(os.environ.get("PROXY_HEADER_TIMEOUT", "10"))        # на весь заголовок с первого байта
+BODY_IDLE_TIMEOUT = float(os.environ.get("PROXY_BODY_IDLE_TIMEOUT", "5"))   # простой посреди тела запроса
+CONTINUE_RESPONSE = b"HTTP/1.1 100 Continue\r\n\r\n"
+LINGER_RST = struct.pack("ii", 1, 0)  # close() отправляет RST
+
+# === KEEP-ALIVE И ПУЛ UPSTREAM-СОЕДИНЕНИЙ ===
+KEEPALIVE_TIMEOUT = float(os.environ.get("PROXY_KEEPALIVE_TIMEOUT", "5"))
+KEEPALIVE_MAX_REQUESTS = int(os.environ.get("PROXY_KEEPALIVE_MAX_REQUESTS", "100"))
+POOL_SIZE = int(os.environ.get("PROXY_POOL_SIZE", "32"))         # 0 — пул выключен
+POOL_IDLE_TIMEOUT = float(os.environ.get("PROXY_POOL_IDLE_TIMEOUT", "30"))
+
+# === PASSTHROUGH-РЕЖИМ (прямой прокси вместо фейкового баннера) ===
+RELAY_IDLE_TIMEOUT = float(os.environ.get("PROXY_RELAY_IDLE_TIMEOUT", "300"))
+RELAY_SPLICE = SPLICE_AVAILABLE and os.environ.get("PROXY_RELAY_SPLICE", "1") != "0"
+
+LISTENER_DEFAULTS = {
+    "target_host": TARGET_HOST,
+    "rules": RULES_FILE,
+    "header_timeout": HEADER_TIMEOUT,
+    "body_idle_timeout": BODY_IDLE_TIMEOUT,
+    "keepalive_timeout": KEEPALIVE_TIMEOUT,
+    "keepalive_max_requests": KEEPALIVE_MAX_REQUESTS,
+    "idle_timeout": RELAY_IDLE_TIMEOUT,
+}
 
 # Настройка папки для логов
-LOG_DIR = "logs"
+LOG_DIR = os.environ.get("LOG_DIR", "logs")
 if not os.path.exists(LOG_DIR):
     try: os.makedirs(LOG_DIR)
     except: pass
 LOG_FILE = os.path.join(LOG_DIR, "security_events.log")
 
+_log_stats_seen = {"queued": 0, "dropped": 0, "written": 0, "failed": 0}
+
+def publish_log_stats(log):
+    """Переносит счётчики журнала в метрики (из потока-писателя).
+
+    Обычные Counter, а не снимок при scrape: в многопроцессном режиме
+    prometheus_client сам суммирует их по воркерам.
+    """
+    current = {"queued": log.enqueued, "dropped": log.dropped, "written": log.written, "failed": log.write_errors}
+    for state, value in current.items():
+        delta = value - _log_stats_seen[state]
+        if delta > 0:
+            LOG_EVENTS.labels(state=state).inc(delta)
+            _log_stats_seen[state] = value
+    LOG_QUEUE_DEPTH.set(log.depth)
+
+# Асинхронный журнал: обработчики не ждут диск, писатель пишет пачками
+EVENT_LOG = EventLog(
+    LOG_FILE,
+    max_queue=int(os.environ.get("PROXY_LOG_QUEUE", "10000")),
+    policy=os.environ.get("PROXY_LOG_POLICY", "drop"),            # drop | block
+    max_bytes=int(os.environ.get("PROXY_LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+    rotate_seconds=int(os.environ.get("PROXY_LOG_ROTATE_SECONDS", "0")),
+    backups=int(os.environ.get("PROXY_LOG_BACKUPS", "5")),
+    stats_hook=publish_log_stats,
+)
+
+_timestamp_cache = [0, ""]
+
 def write_log(client_ip, port, action, details):
-    """Пишет лог в консоль и в файл"""
+    """Ставит строку лога в очередь (консоль и файл пишет поток EVENT_LOG)"""
     try:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_line = f"[{timestamp}] {client_ip:<15} -> :{port} | {action:<20} | {details}"
-        
-        # 1. В консоль (для docker logs)
-        print(log_line, flush=True)
-        
-        # 2. В файл
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(log_line + "\n")
+        now = int(time.time())
+        if now != _timestamp_cache[0]:
+            _timestamp_cache[:] = [now, datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")]
+        log_line = f"[{_timestamp_cache[1]}] {client_ip:<15} -> :{port} | {action:<20} | {details}"
+        EVENT_LOG.write(log_line)
     except Exception:
         pass # Логирование не должно ломать работу прокси
 
 def init_metrics():
     """Инициализация метрик нулями"""
     print(">>> Инициализация метрик Prometheus...", flush=True)
-    ports = [str(PROXY_PORT_WEB), str(PROXY_PORT_DB), str(PROXY_PORT_ADMIN)]
-    for p in ports:
-        REQUESTS_TOTAL.labels(port=p, action="none").inc(0)
-        BLOCKED_REQUESTS.labels(port=p).inc(0)
+    for result in ("new", "reused", "stale"):
+        UPSTREAM[result] = LOCAL_METRICS.counter(UPSTREAM_CONNECTIONS, result=result)
+    for state in _log_stats_seen:
+        LOG_EVENTS.labels(state=state).inc(0)
+    for kind in DETECT_ACTIONS:
+        DETECTIONS.labels(kind=kind).inc(0)
 
-def proxy_http(client_sock, client_addr):
-    start = time.time()
-    port_label = str(PROXY_PORT_WEB)
-    client_ip = client_addr[0]
-    
-    try:
-        client_sock.settimeout(5.0)
-        request = b""
-        while True:
-            try:
-                chunk = client_sock.recv(4096)
-                if not chunk: break
-                request += chunk
-                if b"\r\n\r\n" in request or len(request) > 8192: break
-            except socket.timeout:
-                break
+class ConnectionLimiter:
+    """Ограничение числа одновременно обслуживаемых соединений"""
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
 
-        if not request:
-            # 1. Метрика
-            REQUESTS_TOTAL.labels(port=port_label, action="empty_request").inc()
-            # 2. Лог
-            write_log(client_ip, PROXY_PORT_WEB, "DROP_EMPTY", "Пустой запрос (Scan)")
-            # 3. Сеть
-            client_sock.sendall(b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n")
-            return
+    def acquire(self):
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+# Общие для всех портов: флуд по 9001 расходует тот же запас источника, что и по 9000
+IP_BUCKETS = TokenBuckets(IP_RATE, IP_BURST, IP_TABLE_SIZE)
+TARPIT = Tarpit(TARPIT_SECONDS, TARPIT_MAX)
+REJECTS = {}  # порт -> RejectSummary
+DETECTOR = SweepDetector(DETECT_WINDOW, width=DETECT_WIDTH, sweep_ports=DETECT_SWEEP_PORTS, rate_limit=DETECT_RATE,
+                         repeat_strikes=DETECT_REPEAT, top_size=DETECT_TOP) if DETECT else None
+DETECT_ACTIONS = {"sweep": "PORT_SWEEP", "rate": "RATE_OFFENDER", "repeat": "REPEAT_OFFENDER"}
+# Воркер отдаёт лидеров супервизору через файл: OffenderCollector в его реестре супервизор не видит
+OFFENDERS_PATH = (os.path.join(os.environ[MULTIPROC_ENV], OFFENDERS_FILE.format(pid=os.getpid()))
+                  if DETECT and WORKER_ID is not None else None)
+
+def admit(listener, client_ip, limiter):
+    """Проверка до обработчика: None — принять (слот limiter занят), иначе причина отказа"""
+    port = listener.port
+    if DETECTOR is not None:
+        DETECTOR.observe(client_ip, port)  # и отклонённые: сканер под лимитом тоже обходит порты
+    if not IP_BUCKETS.allow(client_ip):
+        reason = "rate"
+    elif not limiter.acquire():
+        reason = "overload"
+    else:
+        return None
+    listener.rejected[reason].inc()
+    listener.rejects.add(reason, client_ip)
+    return reason
+
+def reject(close, pause=None):
+    """Отказ по политике: закрыть сразу или подержать в tarpit"""
+    if REJECT_POLICY == "tarpit" and TARPIT.add(close):
+        if pause is not None:
+            pause()
+        return
+    close()
+
+_last_reject_flush = [time.monotonic()]
+_detections_suppressed = [0]
+
+def detection_tick():
+    """Сработки детектора -> счётчики и строки лога с JSON в деталях (не больше DETECT_LOG_MAX за раз)"""
+    found = DETECTOR.drain()
+    for detection in found:
+        DETECTIONS.labels(kind=detection.kind).inc()
+    for detection in found[:DETECT_LOG_MAX]:
+        write_log(detection.ip, detection.port, DETECT_ACTIONS[detection.kind], json.dumps({
+            "kind": detection.kind, "ports": detection.ports, "connections": detection.connections,
+            "window": DETECT_WINDOW, "strikes": detection.strikes}))
+    lost = DETECTOR.suppressed - _detections_suppressed[0]
+    _detections_suppressed[0] = DETECTOR.suppressed
+    skipped = len(found) - DETECT_LOG_MAX + lost
+    if skipped > 0:
+        write_log(found[-1].ip, found[-1].port, "DETECT_SUMMARY", f"Ещё сработок без отдельной строки: {skipped}")
+
+class OffenderCollector:
+    """Top источников детектора на момент scrape: серии только текущих лидеров,
+    ушедшие адреса не копятся в реестре. source() -> [(ip, соединений, [порты])]:
+    свой детектор или, у супервизора, сумма файлов воркеров"""
+    def __init__(self, source):
+        self.source = source
+
+    def collect(self):
+        connections = GaugeMetricFamily('security_proxy_offender_connections',
+                                        'Connections in the detection window by top source IP', labels=['ip'])
+        ports = GaugeMetricFamily('security_proxy_offender_ports',
+                                  'Distinct ports touched in the detection window by top source IP', labels=['ip'])
+        for ip, count, touched in self.source():
+            connections.add_metric([ip], count)
+            ports.add_metric([ip], len(touched))
+        yield connections
+        yield ports
+
+def admission_tick():
+    """Раз в секунду: освободить tarpit, обновить метрики, по интервалу — сводка отказов в лог"""
+    if DETECTOR is not None:
+        DETECTOR.advance()  # сдвиг кольца — здесь, а не в observe() на пути accept
+        detection_tick()
+        if OFFENDERS_PATH is not None:
+            save_top(OFFENDERS_PATH, DETECTOR.top(DETECT_TOP))
+    TARPIT.expire()
+    TARPIT_HELD.set(len(TARPIT))
+    ADMISSION_SOURCES.set(len(IP_BUCKETS))
+    if time.monotonic() - _last_reject_flush[0] < REJECT_LOG_INTERVAL:
+        return
+    _last_reject_flush[0] = time.monotonic()
+    for port, summary in list(REJECTS.items()):
+        drained = summary.drain()
+        if drained is None:
+            continue
+        reasons, sources, top = drained
+        by_reason = ", ".join(f"{reason}: {n}" for reason, n in sorted(reasons.items()))
+        leaders = ", ".join(f"{ip} ({n})" for ip, n in top)
+        write_log(top[0][0], port, "ADMISSION_REJECT",
+                  f"Отклонено {sum(reasons.values())} ({by_reason}), источников: {sources}, чаще всего: {leaders}")
+
+def housekeeping_loop():
+    while True:
+        time.sleep(1.0)
+        admission_tick()
+        LOCAL_METRICS.flush()
+        RUNTIME_THREADS.set(threading.active_count())
+
+async def housekeeping_loop_async():
+    while True:
+        await asyncio.sleep(1.0)
+        admission_tick()
+        LOCAL_METRICS.flush()
+        RUNTIME_THREADS.set(threading.active_count())
+        RUNTIME_TASKS.set(len(asyncio.all_tasks()))
+
+def new_rewriter(info, keep_alive, rules):
+    """Потоковый переписчик ответа для одного запроса"""
+    return ResponseRewriter(rules.header_rules, rules.replacer(),
+                            head_request=info.method == b"HEAD",
+                            chunked_ok=info.version == b"HTTP/1.1",
+                            keep_alive=keep_alive)
+
+def drop_empty(client_ip, listener):
+    listener.requests["empty_request"].inc()
+    write_log(client_ip, listener.port, "DROP_EMPTY", "Пустой запрос (Scan)")
+    return b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n"
+
+def reject_request(client_ip, error, listener):
+    """Ответ 4xx/5xx на некорректный запрос (в upstream он не уходит)"""
+    listener.requests["bad_request"].inc()
+    write_log(client_ip, listener.port, "BAD_REQUEST", f"{error.status}: {error.detail}")
+    return error.response()
+
+def _header_timeout(parser, deadline, idle_timeout, header_timeout):
+    """-> (срок заголовка, таймаут следующего чтения). Срок отсчитывается с первого байта"""
+    if parser.buf and deadline is None:
+        deadline = time.monotonic() + header_timeout
+    if deadline is None:
+        return None, idle_timeout
+    timeout = deadline - time.monotonic()
+    if timeout <= 0:
+        raise HttpError(408, "Заголовок не получен вовремя")
+    return deadline, timeout
 
-        # Подключение к приложению
-        target = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        target.settimeout(5.0)
+def _no_more_data(parser, timed_out):
+    """Клиент замолчал или закрыл соединение: None, если запроса не начинали, иначе ошибка"""
+    if not parser.buf:
+        return None
+    if timed_out:
+        raise HttpError(408, "Заголовок не получен вовремя")
+    raise HttpError(400, "Соединение закрыто посреди заголовка")
+
+def report_rewrite(client_ip, rewriter, listener):
+    """Лог и метрика по итогам переписки ответа (общие для обоих движков)"""
+    if rewriter.fired:
+        for rule, hits in rewriter.fired.items():
+            listener.rule_hits[rule].inc(hits)
+        write_log(client_ip, listener.port, "OBFUSCATION", f"Сработали правила: {', '.join(sorted(rewriter.fired))}")
+    else:
+        write_log(client_ip, listener.port, "FORWARD", "Пропущен")
+    listener.requests["raw_forward" if rewriter.raw else "allowed_with_filtering"].inc()
+
+# === СЛУШАТЕЛИ ===
+
+class Listener:
+    """Слушатель во время работы: настройки из файла, пул к приложению и метрики порта.
+
+    Соединение держит свой Listener до конца, поэтому перечитанная конфигурация
+    касается только новых соединений, а снятый слушатель дорабатывает прежние.
+    """
+    def __init__(self, config, pool=None):
+        self.config = config
+        self.port = config.port
+        self.label = str(config.port)
+        self.pool = pool
+        self.handler, self.handler_async = HANDLERS[config.mode]
+        actions = WEB_ACTIONS if config.mode == "http" else TCP_ACTIONS
+        self.requests = {action: LOCAL_METRICS.counter(REQUESTS_TOTAL, port=self.label, action=action)
+                         for action in actions}
+        self.blocked = LOCAL_METRICS.counter(BLOCKED_REQUESTS, port=self.label)
+        self.duration = LOCAL_METRICS.histogram(REQUEST_DURATION, port=self.label)
+        # Счётчики правил — один раз на загрузку правил, а не на каждый ответ
+        self.rule_hits = {rule: LOCAL_METRICS.counter(REWRITE_RULES, rule=rule)
+                          for rule in (config.rules.names() if config.rules is not None else ())}
+        self.rejected = {reason: LOCAL_METRICS.counter(ADMISSION_REJECTED, port=self.label, reason=reason)
+                         for reason in ("rate", "overload")}
+        # Сводка отказов общая для порта и переживает перечитывание; на пути отказа — без setdefault
+        self.rejects = REJECTS.setdefault(self.port, RejectSummary())
+        self.in_flight = IN_FLIGHT.labels(port=self.label)
+        self.draining = False
+        self.removed = False
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.active += 1
+        self.in_flight.inc()
+
+    def leave(self):
+        self.in_flight.dec()
+        with self._lock:
+            self.active -= 1
+            drained = self.removed and self.active == 0
+        if drained:
+            print(f">>> Слушатель :{self.port} снят, его соединения завершены", flush=True)
+
+    def retire(self, successor):
+        """Новых соединений больше не будет: successor — слушатель с новыми настройками, который
+        принимает их вместо этого (None — порт снят). Keep-alive соединения закрываются после
+        текущего запроса; пул закрывается, если преемник не взял его себе."""
+        self.draining = True
+        self.removed = successor is None
+        if self.pool is not None and (successor is None or successor.pool is not self.pool):
+            self.pool.close()
+
+class Binding:
+    """Слушающий сокет порта и текущий Listener. Сокет переживает перечитывание
+    конфигурации, меняется только binding.listener"""
+    def __init__(self, sock, listener, backlog):
+        self.sock = sock
+        self.listener = listener
+        self.backlog = backlog
+        self.server = None   # asyncio.Server поверх sock (asyncio-движок)
+        self.closed = False
+        self.stopped = threading.Event()  # поток serve() вышел: новых соединений не будет
+
+    def close(self, release=False):
+        """Перестать принимать. release=True — закрыть только свою копию сокета, без
+        shutdown(): его может держать процесс, которому сокет передан. Поток serve()
+        тогда замечает closed по таймауту accept() и закрывает сокет сам"""
+        self.closed = True
+        if self.server is not None:
+            self.server.close()
+            return
+        if release:
+            return
         try:
-            target.connect((TARGET_HOST, TARGET_PORT_WEB))
-            target.sendall(request)
+            self.sock.shutdown(socket.SHUT_RDWR)  # будит accept() в потоке serve()
         except OSError:
-            write_log(client_ip, PROXY_PORT_WEB, "ERROR", "App недоступен")
-            return
+            pass
+        self.sock.close()
 
-        response = b""
-        while True:
-            try:
-                chunk = target.recv(4096)
-                if not chunk: break
-                response += chunk
-            except socket.timeout:
-                break
-        target.close()
+def bind_socket(port, backlog, reuse_port=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Несколько воркеров на одном порту: ядро распределяет соединения между ними
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("0.0.0.0", port))
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+# === THREADED-ДВИЖОК (поток на соединение) ===
+
+def read_head(client_sock, parser, idle_timeout, header_timeout):
+    """Заголовок следующего запроса: (заголовок, info) или None, если клиент ушёл/молчит.
 
-        # Фильтрация
+    HttpError — мусор, слишком длинный заголовок или не уложился в header_timeout.
+    """
+    deadline = None
+    while True:
+        parsed = parser.next_head()
+        if parsed:
+            return parsed
+        deadline, timeout = _header_timeout(parser, deadline, idle_timeout, header_timeout)
+        client_sock.settimeout(timeout)
         try:
-            resp_str = response.decode('utf-8', errors='ignore')
-            
-            # Лог действий
-            if "Warehouse" in resp_str:
-                write_log(client_ip, PROXY_PORT_WEB, "OBFUSCATION", "Скрыты заголовки")
+            chunk = client_sock.recv(CLIENT_CHUNK)
+        except socket.timeout:
+            return _no_more_data(parser, True)
+        if not chunk:
+            return _no_more_data(parser, False)
+        parser.feed(chunk)
+
+def send_body(client_sock, parser, target):
+    """Пересылает тело запроса в upstream по мере прихода от клиента"""
+    while not parser.body_done:
+        piece = parser.body()
+        if piece:
+            target.sendall(piece)
+            continue
+        chunk = client_sock.recv(CLIENT_CHUNK)
+        if not chunk:
+            raise ConnectionError("клиент закрыл соединение посреди тела")
+        parser.feed(chunk)
+
+def forward_http(client_sock, client_ip, parser, head, info, keep_alive, clock, listener):
+    """Один запрос через upstream. True — клиентское соединение можно продолжать"""
+    config, pool = listener.config, listener.pool
+    # Тело, пришедшее целиком вместе с заголовком, можно повторить на другом соединении.
+    # Большое или chunked тело идёт потоком — только по свежему соединению, без повтора.
+    body = parser.buffered_body()
+    # После заголовка сокет мог остаться с почти истёкшим сроком header_timeout
+    client_sock.settimeout(config.body_idle_timeout)
+    if body is None and info.expect_continue:
+        client_sock.sendall(CONTINUE_RESPONSE)
+    for attempt in (1, 2):
+        try:
+            target, reused = pool.acquire(fresh=body is None)
+        except OSError:
+            write_log(client_ip, listener.port, "ERROR", "App недоступен")
+            return False
+        UPSTREAM["reused" if reused else "new"].inc()
+        target.settimeout(config.upstream_timeout)
+        clock.lap("upstream_connect")
+
+        # Потоковая фильтрация: заголовки уходят клиенту сразу, тело — по кускам
+        rewriter = new_rewriter(info, keep_alive, config.rules)
+        received = False
+        released = False  # upstream возвращён в пул; иначе finally его закрывает
+        try:
+            if body is None:
+                target.sendall(upstream_head(head, info))
+                send_body(client_sock, parser, target)
+                clock.skip()
             else:
-                write_log(client_ip, PROXY_PORT_WEB, "FORWARD", "Пропущен")
+                target.sendall(upstream_head(head, info) + body)
+            while not rewriter.done:
+                try:
+                    chunk = target.recv(UPSTREAM_CHUNK)
+                except socket.timeout:
+                    break
+                if not chunk: break
+                if received:
+                    clock.lap("upstream_read")
+                else:
+                    # Ожидание первого байта — тоже часть полного чтения ответа
+                    clock.add("upstream_read", clock.lap("upstream_first_byte"))
+                    received = True
+                out = rewriter.feed(chunk)
+                clock.lap("rewrite")
+                if out: client_sock.sendall(out)
+                clock.lap("client_write")
+            if reused and not received:
+                # Соединение из пула закрыто upstream'ом — повторяем на новом
+                UPSTREAM["stale"].inc()
+                continue
 
-            # Подмена заголовков
-            resp_str = re.sub(r'^Server:.*$', 'Server: Apache/2.4.52', resp_str, flags=re.MULTILINE)
-            resp_str = re.sub(r'Warehouse ERP v2\.4', 'Internal Portal', resp_str, flags=re.IGNORECASE)
-            resp_str = re.sub(r'Powered by Python Legacy Backend', 'Powered by Secure Sys', resp_str) 
-            
-            # 1. Метрика (До отправки!)
-            REQUESTS_TOTAL.labels(port=port_label, action="allowed_with_filtering").inc()
-            
-            # 2. Отправка
-            client_sock.sendall(resp_str.encode('utf-8'))
-            
-        except Exception:
-            REQUESTS_TOTAL.labels(port=port_label, action="raw_forward").inc()
-            client_sock.sendall(response)
+            out = rewriter.finish()
+            clock.lap("rewrite")
+            if out: client_sock.sendall(out)
+            clock.lap("client_write")
+            if rewriter.truncated:
+                # Тело оборвалось: RST вместо FIN, чтобы клиент не принял обрезанный ответ за целый
+                client_sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+            if rewriter.upstream_reusable:
+                pool.release(target)
+                released = True
+            clock.skip()
+            report_rewrite(client_ip, rewriter, listener)
+            clock.lap("log_write")
+            return rewriter.client_reusable
+        # ValueError — испорченный chunked-ответ upstream'а (размер куска не число)
+        except (OSError, HttpError, ValueError) as e:
+            if isinstance(e, OSError) and reused and not received:
+                UPSTREAM["stale"].inc()
+                continue
+            raise
+        finally:
+            if not released:
+                pool.discard(target)
+    return False
+
+def proxy_http(client_sock, client_addr, listener):
+    config = listener.config
+    client_ip = client_addr[0]
+    parser = RequestParser()
+    served = 0
+    start = time.time()
+
+    try:
+        while True:
+            try:
+                idle = config.first_request_timeout if not served else config.keepalive_timeout
+                parsed = read_head(client_sock, parser, idle, config.header_timeout)
+                if parsed is None:
+                    if not served:
+                        client_sock.sendall(drop_empty(client_ip, listener))
+                    break
+                head, info = parsed
+                served += 1
+                # Снятый с конфигурации слушатель дорабатывает запрос и закрывает соединение
+                keep_alive = info.keep_alive and served < config.keepalive_max_requests and not listener.draining
+                clock = new_clock(STAGE_TIMING)
+                reusable = forward_http(client_sock, client_ip, parser, head, info, keep_alive, clock, listener)
+            except HttpError as e:
+                client_sock.sendall(reject_request(client_ip, e, listener))
+                break
+            clock.observe(STAGE_DURATION, listener.label)
+            listener.duration.observe(time.time() - start)
+            start = time.time()
+            if not reusable:
+                break
 
     except Exception:
         pass
     finally:
-        duration = time.time() - start
-        REQUEST_DURATION.labels(port=port_label).observe(duration)
+        if not served:
+            listener.duration.observe(time.time() - start)
         try: client_sock.close()
         except: pass
 
-def proxy_tcp_generic(client_sock, client_addr, target_port, fake_banner=None, proxy_port=None):
+def proxy_tcp_generic(client_sock, client_addr, listener):
     start = time.time()
-    port_label = str(proxy_port)
+    config = listener.config
     client_ip = client_addr[0]
     
     try:
-        if fake_banner:
+        if config.banner:
+            clock = new_clock(STAGE_TIMING)
             # 1. Метрики (Сразу!)
-            BLOCKED_REQUESTS.labels(port=port_label).inc()
-            REQUESTS_TOTAL.labels(port=port_label, action="fake_banner_sent").inc()
+            listener.blocked.inc()
+            listener.requests["fake_banner_sent"].inc()
             
             # 2. Лог
-            write_log(client_ip, proxy_port, "HONEYPOT_TRIGGER", f"Атака перехвачена")
+            write_log(client_ip, listener.port, "HONEYPOT_TRIGGER", f"Атака перехвачена")
+            clock.lap("log_write")
             
-            # 3. Сеть
-            client_sock.sendall(fake_banner.encode() + b"\n")
+            # 3. Сеть (баннер уже в байтах — закодирован при загрузке конфигурации)
+            client_sock.sendall(config.banner)
+            clock.lap("client_write")
+            clock.observe(STAGE_DURATION, listener.label)
         else:
-            # Прямой прокси
-            target = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            target.connect((TARGET_HOST, target_port))
-            data = client_sock.recv(1024)
-            if data:
-                target.sendall(data)
-                resp = target.recv(4096)
-                client_sock.sendall(resp)
-            target.close()
-            REQUESTS_TOTAL.labels(port=port_label, action="direct_proxy").inc()
+            # Прямой прокси: обе стороны качаются одновременно до закрытия или простоя
+            target = socket.create_connection((config.target_host, config.target_port), timeout=config.upstream_timeout)
+            try:
+                relay_sockets(client_sock, target, config.idle_timeout, RELAY_SPLICE)
+            finally:
+                target.close()
+            listener.requests["direct_proxy"].inc()
 
     except Exception:
         pass
     finally:
         duration = time.time() - start
-        REQUEST_DURATION.labels(port=port_label).observe(duration)
+        listener.duration.observe(duration)
         try: client_sock.close()
         except: pass
 
-def serve(port, func, **kwargs):
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+def _run_limited(listener, limiter, client, addr, accepted):
+    if STAGE_TIMING:
+        observe_stage(STAGE_DURATION, listener.label, "accept", time.perf_counter() - accepted)
+    listener.enter()
     try:
-        server.bind(("0.0.0.0", port))
-        server.listen(10)
-        print(f"🛡️ Proxy запущен на порту {port}", flush=True)
-    except Exception as e:
-        print(f"Ошибка запуска на порту {port}: {e}")
-        return
+        listener.handler(client, addr, listener)
+    finally:
+        listener.leave()
+        limiter.release()
+        LOCAL_METRICS.release()  # поток соединения завершается — ячейки следующему
+
+def serve(binding, limiter):
+    """Цикл accept на сокете слушателя; каждое соединение берёт текущий binding.listener"""
+    server = binding.sock
+    # С таймаутом сокет неблокирующий: accept() не зависает, если соединение, о котором
+    # сообщил poll, забрал другой процесс с тем же сокетом, а closed проверяется раз в секунду
+    server.settimeout(1.0)
+    try:
+        while not binding.closed:
+            try:
+                client, addr = server.accept()
+                accepted = time.perf_counter()
+                listener = binding.listener
+                if admit(listener, addr[0], limiter):
+                    # Флуд или перегрузка: отказ до создания потока
+                    reject(client.close)
+                    continue
+                # Как и asyncio-транспорт: без Nagle, иначе мелкие куски ответа ждут ACK
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(target=_run_limited, args=(listener, limiter, client, addr, accepted),
+                                 daemon=True).start()
+            except Exception:
+                pass  # и socket.timeout: снова проверить closed
+    finally:
+        server.close()
+        binding.stopped.set()
+
+# === ASYNCIO-ДВИЖОК (один event loop, неблокирующие корутины) ===
+
+async def _read_with_timeout(reader, size, timeout):
+    try:
+        async with asyncio.timeout(timeout):
+            return await reader.read(size)
+    except TimeoutError:
+        return None
+
+async def _close_writer(writer):
+    try:
+        writer.close()
+        await writer.wait_closed()
+    except Exception:
+        pass
 
+async def read_head_async(reader, parser, idle_timeout, header_timeout):
+    """Заголовок следующего запроса: (заголовок, info) или None, если клиент ушёл/молчит"""
+    deadline = None
     while True:
+        parsed = parser.next_head()
+        if parsed:
+            return parsed
+        deadline, timeout = _header_timeout(parser, deadline, idle_timeout, header_timeout)
+        chunk = await _read_with_timeout(reader, CLIENT_CHUNK, timeout)
+        if not chunk:
+            return _no_more_data(parser, chunk is None)
+        parser.feed(chunk)
+
+async def send_body_async(reader, parser, t_writer, idle_timeout):
+    """Пересылает тело запроса в upstream по мере прихода от клиента"""
+    while not parser.body_done:
+        piece = parser.body()
+        if piece:
+            t_writer.write(piece)
+            await t_writer.drain()
+            continue
+        chunk = await _read_with_timeout(reader, CLIENT_CHUNK, idle_timeout)
+        if not chunk:
+            raise ConnectionError("клиент закрыл соединение или замолчал посреди тела")
+        parser.feed(chunk)
+
+async def forward_http_async(reader, writer, client_ip, parser, head, info, keep_alive, clock, listener):
+    """Один запрос через upstream. True — клиентское соединение можно продолжать"""
+    config, pool = listener.config, listener.pool
+    body = parser.buffered_body()
+    if body is None and info.expect_continue:
+        writer.write(CONTINUE_RESPONSE)
+    for attempt in (1, 2):
+        try:
+            conn, reused = await pool.acquire(fresh=body is None)
+        except (OSError, TimeoutError):
+            write_log(client_ip, listener.port, "ERROR", "App недоступен")
+            return False
+        UPSTREAM["reused" if reused else "new"].inc()
+        t_reader, t_writer = conn
+        clock.lap("upstream_connect")
+
+        rewriter = new_rewriter(info, keep_alive, config.rules)
+        received = False
+        released = False  # upstream возвращён в пул; иначе finally его закрывает
         try:
-            client, addr = server.accept()
-            threading.Thread(target=func, args=(client, addr), kwargs=kwargs, daemon=True).start()
-        except Exception:
+            if body is None:
+                t_writer.write(upstream_head(head, info))
+                await send_body_async(reader, parser, t_writer, config.body_idle_timeout)
+                clock.skip()
+            else:
+                t_writer.write(upstream_head(head, info) + body)
+                await t_writer.drain()
+            while not rewriter.done:
+                chunk = await _read_with_timeout(t_reader, UPSTREAM_CHUNK, config.upstream_timeout)
+                if not chunk: break
+                if received:
+                    clock.lap("upstream_read")
+                else:
+                    clock.add("upstream_read", clock.lap("upstream_first_byte"))
+                    received = True
+                out = rewriter.feed(chunk)
+                clock.lap("rewrite")
+                if out:
+                    writer.write(out)
+                    await writer.drain()
+                clock.lap("client_write")
+            if reused and not received:
+                UPSTREAM["stale"].inc()
+                continue
+
+            out = rewriter.finish()
+            clock.lap("rewrite")
+            if out:
+                writer.write(out)
+                await writer.drain()
+            clock.lap("client_write")
+            if rewriter.truncated:
+                # Обрыв тела — RST, а не корректное завершение ответа (abort() сам по себе шлёт FIN)
+                writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+                writer.transport.abort()
+            if rewriter.upstream_reusable:
+                pool.release(conn)
+                released = True
+            clock.skip()
+            report_rewrite(client_ip, rewriter, listener)
+            clock.lap("log_write")
+            return rewriter.client_reusable
+        # ValueError — испорченный chunked-ответ upstream'а (размер куска не число)
+        except (OSError, HttpError, ValueError) as e:
+            if isinstance(e, OSError) and reused and not received:
+                UPSTREAM["stale"].inc()
+                continue
+            raise
+        finally:
+            if not released:
+                pool.discard(conn)
+    return False
+
+async def proxy_http_async(reader, writer, listener):
+    config = listener.config
+    client_ip = (writer.get_extra_info("peername") or ("?",))[0]
+    parser = RequestParser()
+    served = 0
+    start = time.time()
+
+    try:
+        while True:
+            try:
+                idle = config.first_request_timeout if not served else config.keepalive_timeout
+                parsed = await read_head_async(reader, parser, idle, config.header_timeout)
+                if parsed is None:
+                    if not served:
+                        writer.write(drop_empty(client_ip, listener))
+                        await writer.drain()
+                    break
+                head, info = parsed
+                served += 1
+                keep_alive = info.keep_alive and served < config.keepalive_max_requests and not listener.draining
+                clock = new_clock(STAGE_TIMING)
+                reusable = await forward_http_async(reader, writer, client_ip, parser, head, info, keep_alive, clock,
+                                                    listener)
+            except HttpError as e:
+                writer.write(reject_request(client_ip, e, listener))
+                await writer.drain()
+                break
+            clock.observe(STAGE_DURATION, listener.label)
+            listener.duration.observe(time.time() - start)
+            start = time.time()
+            if not reusable:
+                break
+
+    except Exception:
+        pass
+    finally:
+        if not served:
+            listener.duration.observe(time.time() - start)
+        await _close_writer(writer)
+
+async def proxy_tcp_generic_async(reader, writer, listener):
+    start = time.time()
+    config = listener.config
+    client_ip = (writer.get_extra_info("peername") or ("?",))[0]
+
+    try:
+        if config.banner:
+            clock = new_clock(STAGE_TIMING)
+            listener.blocked.inc()
+            listener.requests["fake_banner_sent"].inc()
+            write_log(client_ip, listener.port, "HONEYPOT_TRIGGER", f"Атака перехвачена")
+            clock.lap("log_write")
+            writer.write(config.banner)
+            await writer.drain()
+            clock.lap("client_write")
+            clock.observe(STAGE_DURATION, listener.label)
+        else:
+            # Прямой прокси: транспорты клиента и upstream пишут друг в друга напрямую
+            await AsyncRelay(config.idle_timeout).run(reader, writer, config.target_host, config.target_port,
+                                                      config.upstream_timeout)
+            listener.requests["direct_proxy"].inc()
+
+    except Exception:
+        pass
+    finally:
+        duration = time.time() - start
+        listener.duration.observe(duration)
+        await _close_writer(writer)
+
+async def serve_async(binding, limiter):
+    """Приём на сокете слушателя; каждое соединение берёт текущий binding.listener"""
+    loop = asyncio.get_running_loop()
+
+    async def on_connect(listener, accepted, reader, writer):
+        if STAGE_TIMING:
+            observe_stage(STAGE_DURATION, listener.label, "accept", time.perf_counter() - accepted)
+        listener.enter()
+        try:
+            await listener.handler_async(reader, writer, listener)
+        finally:
+            listener.leave()
+            limiter.release()
+
+    class Gate(asyncio.Protocol):
+        """Допуск в connection_made: отклонённым не создаются ни StreamReader, ни задача"""
+        def connection_made(self, transport):
+            accepted = time.perf_counter()
+            listener = binding.listener
+            client_ip = (transport.get_extra_info("peername") or ("?",))[0]
+            if admit(listener, client_ip, limiter):
+                reject(transport.abort, transport.pause_reading)
+                return
+            protocol = asyncio.StreamReaderProtocol(asyncio.StreamReader(loop=loop),
+                                                    functools.partial(on_connect, listener, accepted), loop=loop)
+            transport.set_protocol(protocol)
+            protocol.connection_made(transport)
+
+    server = await loop.create_server(Gate, sock=binding.sock, backlog=binding.backlog)
+    if binding.closed:
+        server.close()  # слушатель сняли, пока сервер создавался
+    else:
+        binding.server = server
+
+# === ТОЧКА ВХОДА ===
+
+HANDLERS = {
+    "http": (proxy_http, proxy_http_async),
+    "honeypot": (proxy_tcp_generic, proxy_tcp_generic_async),
+    "passthrough": (proxy_tcp_generic, proxy_tcp_generic_async),
+}
+BINDINGS = {}  # порт -> Binding
+
+def load_listeners(args):
+    """Файл конфигурации -> {порт: ListenerConfig}; --passthrough делает honeypot прямым прокси"""
+    configs = load_config(args.config, LISTENER_DEFAULTS)
+    for port in args.passthrough:
+        config = configs.get(port)
+        if config is None or config.mode != "honeypot":
+            continue
+        if config.target_port is None:
+            raise ConfigError(f"слушатель {port}: для --passthrough нужен target_port")
+        configs[port] = config._replace(mode="passthrough", banner=None)
+    return configs
+
+def apply_config(configs, args, start, new_pool, atomic=True, inherited=None):
+    """Привести слушателей к configs: новые порты привязать, снятые закрыть, у оставшихся
+    сохранить сокет и подменить Listener. atomic=True — если какой-то порт не привязался,
+    не меняется ничего; иначе (старт) такой порт пропускается.
+    start(binding) запускает приём на сокете, new_pool(config) создаёт пул к приложению.
+    inherited — {порт: сокет}, полученные от прежнего процесса: они берутся вместо привязки,
+    а порты, которых нет в configs, закрываются."""
+    inherited = dict(inherited or {})
+    sockets = {}
+    for port in configs:
+        if port in BINDINGS:
+            continue
+        if port in inherited:
+            sockets[port] = inherited[port]
+            continue
+        try:
+            sockets[port] = bind_socket(port, args.backlog, reuse_port=WORKER_ID is not None)
+        except OSError as e:
+            print(f"Ошибка запуска на порту {port}: {e}", flush=True)
+            if atomic:
+                for sock in sockets.values():
+                    sock.close()
+                return False
+
+    for port, config in configs.items():
+        binding = BINDINGS.get(port)
+        if binding is None and port not in sockets:
+            continue
+        old = binding.listener if binding is not None else None
+        if old is not None and old.config == config:
+            continue  # слушатель не изменился: те же сокет, пул и соединения keep-alive
+        pool = None
+        if config.mode == "http":
+            same_target = (old is not None and old.pool is not None and
+                           (old.config.target_host, old.config.target_port, old.config.upstream_timeout) ==
+                           (config.target_host, config.target_port, config.upstream_timeout))
+            pool = old.pool if same_target else new_pool(config)
+        listener = Listener(config, pool)
+        if binding is None:
+            binding = BINDINGS[port] = Binding(sockets[port], listener, args.backlog)
+            start(binding)
+            origin = ", сокет от прежнего процесса" if port in inherited else ""
+            print(f"🛡️ Proxy запущен на порту {port} ({args.engine}, backlog={args.backlog}{origin}): "
+                  f"{describe(config)}", flush=True)
+            continue
+        binding.listener = listener
+        old.retire(listener)
+        print(f">>> Слушатель :{port} обновлён: {describe(config)}", flush=True)
+
+    for port in [port for port in BINDINGS if port not in configs]:
+        binding = BINDINGS.pop(port)
+        binding.close()
+        binding.listener.retire(None)
+        print(f">>> Слушатель :{port} больше не принимает соединения, текущих: {binding.listener.active}",
+              flush=True)
+    for port in [port for port in inherited if port not in configs]:
+        inherited[port].close()  # порт снят, пока процессы сменялись: закроется, когда его отпустит и прежний
+        print(f">>> Порт {port} от прежнего процесса не настроен — закрыт", flush=True)
+    return True
+
+def reload_config(args, start, new_pool):
+    """SIGHUP: перечитать файл; при ошибке остаётся прежняя конфигурация целиком"""
+    try:
+        configs = load_listeners(args)
+    except ConfigError as e:
+        print(f"⚠️ Конфигурация не перечитана, работаем на прежней: {e}", flush=True)
+        return
+    if apply_config(configs, args, start, new_pool):
+        print(f">>> Конфигурация перечитана из {args.config}: слушатели {', '.join(map(str, BINDINGS))}", flush=True)
+    else:
+        print("⚠️ Конфигурация не применена, работаем на прежней", flush=True)
+
+METRICS_SERVER = [None]  # сервер метрик этого процесса (его сокет тоже передаётся при handoff)
+
+def handoff_sockets():
+    """Что отдать следующему процессу: слушающие сокеты портов и сокет метрик"""
+    sockets = {port: binding.sock for port, binding in list(BINDINGS.items())}
+    if METRICS_SERVER[0] is not None:
+        sockets["metrics"] = METRICS_SERVER[0].socket
+    return sockets
+
+def start_handoff(args, chan, on_handoff):
+    """Приём запущен: отпустить прежний процесс и ждать следующего на args.handoff"""
+    confirm_handoff(chan)
+    if args.handoff:
+        HandoffServer(args.handoff, handoff_sockets, on_handoff).start()
+
+def stop_accepting(args, limiter, handed_off):
+    """Остановка: закрыть приём, keep-alive соединениям — закрыться после текущего запроса.
+    С --handoff сокеты могут быть общими с другим процессом, поэтому закрываются только
+    свои копии. Сервер метрик останавливается, если сокеты переданы: scrape должен
+    попадать в новый процесс"""
+    for binding in BINDINGS.values():
+        binding.close(release=bool(args.handoff))
+        binding.listener.draining = True
+    if handed_off and METRICS_SERVER[0] is not None:
+        httpd = METRICS_SERVER[0]
+        threading.Thread(target=lambda: (httpd.shutdown(), httpd.server_close()), daemon=True).start()
+    print(f">>> {'Сокеты переданы новому процессу' if handed_off else 'SIGTERM'}: приём закрыт, "
+          f"соединений в работе: {limiter.active}, ждём до {args.drain_timeout:g} с", flush=True)
+    return time.monotonic()
+
+def finish_drain(limiter, started):
+    """Итог остановки; журнал и метрики дописываются до выхода"""
+    if limiter.active:
+        print(f"⚠️ Срок остановки вышел, прерываются соединения: {limiter.active}", flush=True)
+    else:
+        print(f">>> Все соединения завершены за {time.monotonic() - started:.1f} с", flush=True)
+    LOCAL_METRICS.flush()
+    EVENT_LOG.close()
+
+def run_threaded(args, configs, inherited=None, chan=None):
+    threading.Thread(target=housekeeping_loop, daemon=True).start()
+    limiter = ConnectionLimiter(args.max_connections)
+
+    def start(binding):
+        threading.Thread(target=serve, args=(binding, limiter), daemon=True).start()
+
+    def new_pool(config):
+        pool = UpstreamPool(config.target_host, config.target_port, args.pool_size, POOL_IDLE_TIMEOUT,
+                            config.upstream_timeout)
+        pool.start_reaper()
+        return pool
+
+    apply_config(configs, args, start, new_pool, atomic=False, inherited=inherited)
+    # Перечитывание и остановка — в главном потоке, а не в обработчике сигнала посреди чужого кода
+    wake = threading.Event()
+    requests = set()  # "reload" | "signal" | "handoff"
+
+    def request(what):
+        requests.add(what)
+        wake.set()
+
+    signal.signal(signal.SIGHUP, lambda *_: request("reload"))
+    signal.signal(signal.SIGTERM, lambda *_: request("signal"))
+    start_handoff(args, chan, lambda: request("handoff"))
+    while not requests & {"signal", "handoff"}:
+        if wake.wait(1):
+            wake.clear()
+            if "reload" in requests:
+                requests.discard("reload")
+                reload_config(args, start, new_pool)
+
+    started = stop_accepting(args, limiter, "handoff" in requests)
+    deadline = started + args.drain_timeout
+    for binding in list(BINDINGS.values()):
+        # Пока поток accept не вышел, он ещё может принять соединение
+        binding.stopped.wait(max(deadline - time.monotonic(), 0))
+    while limiter.active and time.monotonic() < deadline:
+        time.sleep(0.05)
+    finish_drain(limiter, started)
+
+async def run_asyncio(args, configs, inherited=None, chan=None):
+    loop = asyncio.get_running_loop()
+    limiter = ConnectionLimiter(args.max_connections)
+    tasks = set()  # ссылки на фоновые задачи, чтобы их не собрал GC
+
+    def spawn(coro):
+        task = loop.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def start(binding):
+        spawn(serve_async(binding, limiter))
+
+    def new_pool(config):
+        pool = AsyncUpstreamPool(config.target_host, config.target_port, args.pool_size, POOL_IDLE_TIMEOUT,
+                                 config.upstream_timeout)
+        spawn(pool.reaper())
+        return pool
+
+    apply_config(configs, args, start, new_pool, atomic=False, inherited=inherited)
+    await asyncio.sleep(0)  # serve_async успевают создать серверы до ответа прежнему процессу
+    loop.add_signal_handler(signal.SIGHUP, reload_config, args, start, new_pool)
+    stop_requested = asyncio.Event()
+    requests = set()  # "signal" | "handoff"
+
+    def request_stop(what):
+        requests.add(what)
+        stop_requested.set()
+
+    loop.add_signal_handler(signal.SIGTERM, request_stop, "signal")
+    # Передача идёт в потоке HandoffServer — в event loop через call_soon_threadsafe
+    start_handoff(args, chan, lambda: loop.call_soon_threadsafe(request_stop, "handoff"))
+    spawn(housekeeping_loop_async())
+    await stop_requested.wait()
+
+    started = stop_accepting(args, limiter, "handoff" in requests)
+    deadline = started + args.drain_timeout
+    # Принятые до close() соединения доходят до Gate.connection_made (и до limiter)
+    # только через несколько итераций цикла — не выходим раньше них
+    await asyncio.sleep(0.1)
+    while limiter.active and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    finish_drain(limiter, started)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Security Proxy")
+    parser.add_argument("--engine", choices=["asyncio", "threaded"], default=ENGINE,
+                        help="asyncio — один event loop; threaded — поток на соединение (для A/B сравнения)")
+    parser.add_argument("--backlog", type=int, default=LISTEN_BACKLOG, help="Размер очереди accept()")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help="Максимум одновременно обслуживаемых соединений")
+    parser.add_argument("--config", default=CONFIG_FILE,
+                        help="Файл слушателей (порты, режимы, баннеры, таймауты); SIGHUP перечитывает его")
+    parser.add_argument("--passthrough", type=lambda v: [int(p) for p in v.split(",") if p],
+                        default=[int(p) for p in os.environ.get("PROXY_PASSTHROUGH", "").split(",") if p],
+                        help="Honeypot-порты, которые проксировать напрямую вместо баннера (через запятую)")
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE,
+                        help="Простаивающих соединений к приложению в пуле (0 — пул выключен)")
+    parser.add_argument("--reject-policy", choices=["close", "tarpit"], default=REJECT_POLICY,
+                        help="Что делать с соединениями сверх лимитов: закрыть сразу или подержать в tarpit")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Число процессов-воркеров с SO_REUSEPORT (1 — один процесс, как раньше)")
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT,
+                        help="Сколько секунд после SIGTERM дорабатывать текущие соединения")
+    parser.add_argument("--handoff", default=HANDOFF_PATH,
+                        help="Unix-сокет передачи слушающих сокетов: новый процесс с тем же путём "
+                             "забирает порты у работающего без их закрытия")
+    return parser.parse_args(argv)
+
+def run_supervisor(args):
+    """Супервизор: воркеры + общий endpoint метрик с суммой по процессам"""
+    multiproc_dir = prepare_multiproc_dir()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=multiproc_dir)
+    offenders = os.path.join(multiproc_dir, OFFENDERS_FILE)
+    if DETECT:
+        registry.register(OffenderCollector(lambda: merge_top(load_tops(offenders.format(pid="*")), DETECT_TOP)))
+    serve_metrics(METRICS_PORT, registry)
+    print(f">>> Супервизор: {args.workers} воркеров, метрики из {multiproc_dir} на :{METRICS_PORT}", flush=True)
+
+    def worker_exited(pid):
+        multiprocess.mark_process_dead(pid, multiproc_dir)
+        try:
+            os.remove(offenders.format(pid=pid))
+        except FileNotFoundError:
             pass
 
+    Supervisor(args.workers, [os.path.abspath(__file__)] + sys.argv[1:], multiproc_dir,
+               on_exit=worker_exited,
+               stop_timeout=args.drain_timeout + 5).run()
+    print("\nОстановка...")
+
 if __name__ == "__main__":
-    start_http_server(8000)
+    args = parse_args()
+    # До старта журнала и привязки портов: первое же принятое соединение — уже по политике из аргументов
+    REJECT_POLICY = args.reject_policy
+    try:
+        configs = load_listeners(args)
+    except ConfigError as e:
+        print(f"Ошибка конфигурации слушателей: {e}", flush=True)
+        sys.exit(1)
+    if args.handoff and (args.workers > 1 or WORKER_ID is not None):
+        # У каждого воркера свои сокеты с SO_REUSEPORT — передавать их некому поодиночке
+        print("--handoff работает только в однопроцессном режиме (без --workers)", flush=True)
+        sys.exit(1)
+    if args.workers > 1 and WORKER_ID is None:
+        run_supervisor(args)
+        sys.exit(0)
+
+    inherited, handoff_chan = {}, None
+    if args.handoff:
+        try:
+            inherited, handoff_chan = take_sockets(args.handoff)
+        except OSError as e:
+            print(f"⚠️ Сокеты от прежнего процесса не получены ({e}), привязываемся сами", flush=True)
+        if handoff_chan is not None:
+            print(f">>> Получены сокеты от прежнего процесса: {', '.join(map(str, inherited))}", flush=True)
+
+    EVENT_LOG.start()
+    atexit.register(EVENT_LOG.close)
+    if WORKER_ID is None:
+        METRICS_SERVER[0] = serve_metrics(METRICS_PORT, REGISTRY, profiling=PROFILER, on_scrape=LOCAL_METRICS.flush,
+                                          sock=inherited.pop("metrics", None))
+    else:
+        if PROFILER:
+            # Стеки снимаются внутри процесса, поэтому у каждого воркера свой порт профайлера
+            serve_metrics(METRICS_PORT + 1 + WORKER_ID, REGISTRY, profiling=True, on_scrape=LOCAL_METRICS.flush)
     init_metrics()
-    
-    print(f">>> Логирование включено в {LOG_FILE}", flush=True)
+    atexit.register(LOCAL_METRICS.flush)  # последняя секунда счёта воркера — в файлы до выхода
+    if DETECTOR is not None:
+        REGISTRY.register(OffenderCollector(lambda: DETECTOR.top(DETECT_TOP)))
 
-    threading.Thread(target=serve, args=(PROXY_PORT_WEB, proxy_http), daemon=True).start()
-    
-    threading.Thread(target=serve, args=(PROXY_PORT_DB, proxy_tcp_generic), 
-                     kwargs={"target_port": TARGET_PORT_DB, "fake_banner": "SSH-2.0-OpenSSH_8.9", "proxy_port": PROXY_PORT_DB}, daemon=True).start()
-    
-    threading.Thread(target=serve, args=(PROXY_PORT_ADMIN, proxy_tcp_generic), 
-                     kwargs={"target_port": TARGET_PORT_ADMIN, "fake_banner": "Login:", "proxy_port": PROXY_PORT_ADMIN}, daemon=True).start()
+    if not WORKER_ID:
+        print(f">>> Логирование включено в {LOG_FILE}", flush=True)
+        print(f">>> Слушатели: {args.config} (SIGHUP — перечитать, SIGTERM — остановка с ожиданием "
+              f"до {args.drain_timeout:g} с)", flush=True)
+        if args.handoff:
+            print(f">>> Передача сокетов при перезапуске: {args.handoff}", flush=True)
+        print(f">>> Движок: {args.engine}, backlog={args.backlog}, max_connections={args.max_connections}, pool_size={args.pool_size}", flush=True)
+        per_ip = f"{IP_RATE:g} соед/с на IP (запас {IP_BURST:g})" if IP_RATE > 0 else "без лимита на IP"
+        print(f">>> Допуск: {per_ip}, отказ: {REJECT_POLICY}", flush=True)
+        if DETECTOR is not None:
+            print(f">>> Детектор: окно {DETECT_WINDOW:g} с, обход от {DETECT_SWEEP_PORTS} портов, "
+                  f"поток от {DETECT_RATE} соединений, память {DETECTOR.memory_bytes() // 1024} КБ", flush=True)
+        if STAGE_TIMING or PROFILER:
+            print(f">>> Диагностика: стадии={'вкл' if STAGE_TIMING else 'выкл'}, "
+                  f"профайлер={'/debug/profile' if PROFILER else 'выкл'}", flush=True)
 
     try:
-        while True: time.sleep(1)
+        if args.engine == "threaded":
+            run_threaded(args, configs, inherited, handoff_chan)
+        else:
+            asyncio.run(run_asyncio(args, configs, inherited, handoff_chan))
     except KeyboardInterrupt:
         print("\nОстановка...")
\ No newline at end of file
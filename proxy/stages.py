@@ -0,0 +1,65 @@
+# stages.py
+# Время по стадиям обработки одного запроса (подключение к upstream, первый байт,
+# чтение, переписка, отправка клиенту, лог). Стадии, повторяющиеся по кускам
+# ответа, суммируются и попадают в гистограмму один раз на запрос.
+# Выключенный учёт — общий пустой объект: на горячем пути остаётся вызов-пустышка.
+import time
+
+_children = {}  # (гистограмма, порт, стадия) -> дочерняя метрика: labels() на каждый запрос дорог
+
+def _child(histogram, port, stage):
+    key = (histogram, port, stage)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = histogram.labels(port=port, stage=stage)
+    return child
+
+def observe_stage(histogram, port, stage, elapsed):
+    """Одна стадия вне секундомера (accept — до того, как у соединения появились часы)"""
+    _child(histogram, port, stage).observe(elapsed)
+
+class StageClock:
+    """Секундомер с кругами: lap(стадия) относит время с прошлой отметки к стадии"""
+    __slots__ = ("totals", "mark")
+
+    def __init__(self):
+        self.totals = {}
+        self.mark = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        elapsed = now - self.mark
+        self.totals[stage] = self.totals.get(stage, 0.0) + elapsed
+        self.mark = now
+        return elapsed
+
+    def add(self, stage, elapsed):
+        self.totals[stage] = self.totals.get(stage, 0.0) + elapsed
+
+    def skip(self):
+        """Сдвинуть отметку, не относя время ни к одной стадии"""
+        self.mark = time.perf_counter()
+
+    def observe(self, histogram, port):
+        for stage, elapsed in self.totals.items():
+            _child(histogram, port, stage).observe(elapsed)
+
+class _NullClock:
+    __slots__ = ()
+
+    def lap(self, stage):
+        return 0.0
+
+    def add(self, stage, elapsed):
+        pass
+
+    def skip(self):
+        pass
+
+    def observe(self, histogram, port):
+        pass
+
+NULL_CLOCK = _NullClock()
+
+def new_clock(enabled):
+    return StageClock() if enabled else NULL_CLOCK
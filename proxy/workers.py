@@ -0,0 +1,108 @@
+# workers.py
+# Многопроцессный режим (--workers N): супервизор запускает N процессов прокси,
+# каждый слушает те же порты с SO_REUSEPORT (ядро раскидывает соединения),
+# и перезапускает упавшие. Метрики процессы пишут в общий каталог
+# prometheus_client (multiprocess mode), супервизор отдаёт их сумму на :8000.
+import glob
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+WORKER_ENV = "PROXY_WORKER_ID"
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+OFFENDERS_FILE = "offenders_{pid}.json"  # лидеры детектора воркера, рядом с файлами метрик
+
+def worker_id():
+    """Номер процесса-воркера или None, если это не воркер"""
+    value = os.environ.get(WORKER_ENV)
+    return int(value) if value is not None else None
+
+def prepare_multiproc_dir():
+    """Каталог для файлов метрик воркеров; остатки прошлого запуска удаляются,
+    иначе они попадут в суммы"""
+    path = os.environ.get(MULTIPROC_ENV) or tempfile.mkdtemp(prefix="proxy-metrics-")
+    os.makedirs(path, exist_ok=True)
+    for pattern in ("*.db", OFFENDERS_FILE.format(pid="*")):
+        for stale in glob.glob(os.path.join(path, pattern)):
+            os.remove(stale)
+    return path
+
+class Supervisor:
+    """Запускает воркеров и перезапускает упавших с нарастающей задержкой"""
+    def __init__(self, count, argv, multiproc_dir, on_exit=None, max_backoff=30.0, stop_timeout=10.0):
+        self.count = count
+        self.argv = argv
+        self.multiproc_dir = multiproc_dir
+        self.on_exit = on_exit          # on_exit(pid) — после смерти воркера
+        self.max_backoff = max_backoff
+        self.stop_timeout = stop_timeout  # сколько ждать воркеров после SIGTERM (они дорабатывают соединения)
+        self.procs = {}                 # номер -> Popen
+        self.restarts = {}              # номер -> подряд неудачных запусков
+        self.started_at = {}
+        self._stopping = False
+
+    def _spawn(self, i):
+        # Новый интерпретатор, а не fork: переменная окружения должна быть
+        # выставлена до импорта prometheus_client, а у родителя он уже импортирован
+        env = dict(os.environ, **{WORKER_ENV: str(i), MULTIPROC_ENV: self.multiproc_dir})
+        self.procs[i] = subprocess.Popen([sys.executable] + self.argv, env=env)
+        self.started_at[i] = time.monotonic()
+        print(f">>> Воркер {i} запущен (pid {self.procs[i].pid})", flush=True)
+
+    def _backoff(self, i):
+        # Воркер, проживший дольше минуты, считаем здоровым — счётчик сбрасывается
+        if time.monotonic() - self.started_at[i] > 60:
+            self.restarts[i] = 0
+        self.restarts[i] = self.restarts.get(i, 0) + 1
+        return min(0.5 * 2 ** (self.restarts[i] - 1), self.max_backoff)
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def reload(self, *_):
+        """SIGHUP супервизору — каждому воркеру: он сам перечитает конфигурацию"""
+        for i, proc in self.procs.items():
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGHUP)
+        print(f">>> SIGHUP передан воркерам ({len(self.procs)})", flush=True)
+
+    def run(self, poll_interval=0.5):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.reload)
+        for i in range(self.count):
+            self._spawn(i)
+        pending = {}  # номер -> момент перезапуска
+        try:
+            while not self._stopping:
+                now = time.monotonic()
+                for i, proc in list(self.procs.items()):
+                    if i in pending or proc.poll() is None:
+                        continue
+                    if self.on_exit is not None:
+                        self.on_exit(proc.pid)
+                    delay = self._backoff(i)
+                    print(f"⚠️ Воркер {i} (pid {proc.pid}) завершился с кодом {proc.returncode}, "
+                          f"перезапуск через {delay:.1f} с", flush=True)
+                    pending[i] = now + delay
+                for i, at in list(pending.items()):
+                    if now >= at:
+                        del pending[i]
+                        self._spawn(i)
+                time.sleep(poll_interval)
+        finally:
+            self.shutdown(self.stop_timeout)
+
+    def shutdown(self, timeout=10.0):
+        for proc in self.procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        deadline = time.monotonic() + timeout
+        for proc in self.procs.values():
+            try:
+                proc.wait(max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                proc.kill()
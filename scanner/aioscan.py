@@ -0,0 +1,195 @@
+# aioscan.py
+# Асинхронный движок сканирования: порты обрабатывают N корутин-воркеров,
+# выбирающих цели из общего итератора (память не растёт с диапазоном).
+# Ограничения: общий темп подключений (token bucket), число одновременных
+# соединений на хост. Движок только собирает сырые ответы на пробы — анализ
+# делает scanner.py, поэтому результат совпадает с синхронным scan_port.
+# План проб (ожидания, границы сообщений, порядок) — общий, из probing.py.
+import asyncio
+import time
+
+from probing import ProbeTimeouts, message_complete, probe_order
+
+class RateLimiter:
+    """Не больше rate подключений в секунду (0 — без ограничения)"""
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate / 10, 1)
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self._lock:  # очередь ожидающих — по порядку, без гонки за токен
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class HostLimits:
+    """Семафор на хост: не больше per_host одновременных соединений к одному адресу"""
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self._sems = {}
+        self._users = {}
+
+    def slot(self, host):
+        return _HostSlot(self, host)
+
+    def _get(self, host):
+        sem = self._sems.get(host)
+        if sem is None:
+            sem = self._sems[host] = asyncio.Semaphore(self.per_host)
+            self._users[host] = 0
+        self._users[host] += 1
+        return sem
+
+    def _put(self, host):
+        self._users[host] -= 1
+        if not self._users[host]:
+            del self._sems[host], self._users[host]  # хосты не копятся при сканировании подсетей
+
+class _HostSlot:
+    def __init__(self, limits, host):
+        self._limits = limits
+        self._host = host
+
+    async def __aenter__(self):
+        self._sem = self._limits._get(self._host)
+        try:
+            await self._sem.acquire()
+        except BaseException:
+            self._limits._put(self._host)
+            raise
+
+    async def __aexit__(self, *exc):
+        self._sem.release()
+        self._limits._put(self._host)
+
+async def connect(host, port, timeout):
+    try:
+        return await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+
+async def read_message(reader, first_wait, idle, max_bytes=8192):
+    """Асинхронный recv_message: (данные, закрыл ли сервис соединение)"""
+    data = b""
+    deadline = time.monotonic() + first_wait
+    while len(data) < max_bytes:
+        wait = deadline - time.monotonic() if not data else idle
+        if wait <= 0:
+            break
+        try:
+            chunk = await asyncio.wait_for(reader.read(min(4096, max_bytes - len(data))), wait)
+        except asyncio.TimeoutError:
+            break
+        except OSError:
+            return data, True
+        if not chunk:
+            return data, True
+        data += chunk
+        if message_complete(data):
+            break
+    return data, False
+
+async def _close(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+class AsyncScanner:
+    """Сбор ответов на пробы для множества (хост, порт).
+
+    probes — список Probe (probing.py); пустой payload означает «только слушать баннер».
+    Проба идёт по текущему соединению, пока сервис его не закрыл; is_confident(data)
+    позволяет остановиться, когда тип сервиса уже ясен.
+    """
+    def __init__(self, probes, concurrency=500, rate=0, per_host=100, timeout=3.0,
+                 is_confident=None):
+        self.probes = probes
+        self.concurrency = concurrency
+        self.rate = rate
+        self.per_host = per_host
+        self.timeout = timeout
+        self.is_confident = is_confident
+
+    async def _open(self, host, port):
+        await self._limiter.acquire()
+        return await connect(host, port, self.timeout)
+
+    async def probe(self, host, port, probes=None):
+        """{имя пробы: ответ} или None, если порт закрыт; probes — вместо self.probes"""
+        responses = {}
+        async with self._hosts.slot(host):
+            started = time.monotonic()
+            conn = await self._open(host, port)
+            if conn is None:
+                return None
+            timeouts = ProbeTimeouts(time.monotonic() - started, self.timeout)
+            fresh = True  # по соединению ещё ничего не отправляли: можно слушать баннер
+            try:
+                for probe in probe_order(port, probes or self.probes):
+                    name, payload = probe.name, probe.payload
+                    if conn is None or (not payload and not fresh):
+                        if conn is not None:
+                            await _close(conn[1])
+                        conn = await self._open(host, port)
+                        if conn is None:
+                            continue  # как в scan_port: не ответившая проба просто пропускается
+                        fresh = True
+                    reader, writer = conn
+                    try:
+                        if payload:
+                            writer.write(payload)
+                            await writer.drain()
+                        data, closed = await read_message(
+                            reader, timeouts.reply if payload else timeouts.banner, timeouts.idle)
+                    except OSError:
+                        data, closed = b"", True
+                    responses[name] = data
+                    fresh = False
+                    if closed:
+                        await _close(writer)
+                        conn = None  # следующей пробе нужно новое соединение
+                    if self.is_confident and self.is_confident(b"".join(responses.values())):
+                        break
+            finally:
+                if conn is not None:
+                    await _close(conn[1])
+        return responses
+
+    async def run(self, targets, on_result, probe=None):
+        """Сканирует targets, вызывая on_result(host, port, responses).
+
+        targets — итерируемое (хост, порт) или asyncio.Queue с ними, где None
+        означает конец: так цели могут поступать, пока скан уже идёт.
+        probe — своя корутина probe(host, port) вместо self.probe; её результат
+        передаётся в on_result как есть.
+        """
+        probe = probe or self.probe
+        self._limiter = RateLimiter(self.rate)
+        self._hosts = HostLimits(self.per_host)
+        queue = targets if isinstance(targets, asyncio.Queue) else None
+        targets = iter(()) if queue is not None else iter(targets)
+
+        async def worker():
+            if queue is not None:
+                while True:
+                    target = await queue.get()
+                    if target is None:
+                        queue.put_nowait(None)  # конец — и для остальных воркеров
+                        return
+                    on_result(*target, await probe(*target))
+            for host, port in targets:  # общий итератор: каждая цель достаётся одному воркеру
+                on_result(host, port, await probe(host, port))
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
@@ -0,0 +1,176 @@
+# fingerprint.py
+# Определение сервиса и рисков по ответам за один проход по данным.
+# Сигнатуры сервисов, чувствительные слова, раскрывающие заголовки и метки
+# баннеров загружаются из файла (signatures.json) и компилируются в один
+# автомат Ахо-Корасик (pyahocorasick) по тексту в нижнем регистре, а без него —
+# в одну trie-регулярку. Время разбора почти не зависит от числа сигнатур.
+# Версии ищутся одним заранее скомпилированным шаблоном; префикс "v" и соседство
+# с точкой проверяются уже на найденных совпадениях — lookbehind и необязательный
+# префикс в самом шаблоне замедляют re в разы.
+import json
+import os
+import re
+
+try:
+    import ahocorasick
+except ImportError:  # C-расширение не установлено — работаем на trie-регулярке
+    ahocorasick = None
+
+SIGNATURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "signatures.json")
+
+# Виды совпадений в общей таблице
+SERVICE, KEYWORD, HEADER, MARK = range(4)
+
+class SignatureError(ValueError):
+    pass
+
+def trie_regex(words):
+    """Регулярное выражение-префиксное дерево для набора литералов (длинный побеждает)"""
+    trie = {}
+    for word in words:
+        node = trie
+        for byte in word:
+            node = node.setdefault(byte, {})
+        node[None] = True
+
+    def build(node):
+        terminal = None in node
+        alts = [re.escape(bytes([k])) + build(node[k]) for k in sorted(k for k in node if k is not None)]
+        if not alts:
+            return b""
+        if len(alts) == 1 and not terminal:
+            return alts[0]
+        group = b"(?:" + b"|".join(alts) + b")"
+        return group + b"?" if terminal else group
+
+    return build(trie)
+
+class Fingerprinter:
+    """Скомпилированный набор сигнатур.
+
+    services — по убыванию приоритета: [{"name", "signatures", "ignore_case"}];
+    при нескольких сработавших побеждает первый в списке.
+    """
+    def __init__(self, services=(), keywords=(), headers=(), marks=(), version_pattern=None,
+                 default_service="Unknown Service", use_automaton=True):
+        self.service_names = []
+        self.default_service = default_service
+        self.entries = {}  # литерал в нижнем регистре -> [(вид, значение, точный литерал или None)]
+        for priority, service in enumerate(services):
+            self.service_names.append(service["name"])
+            exact = not service.get("ignore_case")
+            for sig in service["signatures"]:
+                self._add(sig.encode(), SERVICE, priority, exact)
+        for word in keywords:
+            self._add(word.encode(), KEYWORD, word, False)
+        for name in headers:
+            self._add(name.encode().lower() + b":", HEADER, None, False)
+        for mark in marks:
+            self._add(mark.encode(), MARK, None, False)
+        self.versions = re.compile(version_pattern.encode()) if version_pattern else None
+
+        self.automaton = None
+        self.pattern = None
+        if self.entries and use_automaton and ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for key, targets in self.entries.items():
+                word = key.decode("latin-1") if ahocorasick.unicode else key
+                self.automaton.add_word(word, (len(key), targets))
+            self.automaton.make_automaton()
+        elif self.entries:
+            # Заглядывание вперёд: совпадения могут перекрываться ("login" в "login:")
+            self.pattern = re.compile(b"(?=(" + trie_regex(self.entries) + b"))")
+            # Литерал, который короче другого с того же начала, trie-регулярка не отдаст:
+            # для каждого литерала заранее известны его литералы-префиксы
+            self.prefixes = {key: [key[:i] for i in range(1, len(key)) if key[:i] in self.entries]
+                             for key in self.entries}
+
+    def _add(self, needle, kind, value, exact):
+        if not needle:
+            raise SignatureError("Пустая сигнатура")
+        self.entries.setdefault(needle.lower(), []).append((kind, value, needle if exact else None))
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        return cls(data.get("services", ()), data.get("keywords", ()), data.get("headers", ()),
+                   data.get("banner_marks", ()), data.get("version_pattern"),
+                   data.get("default_service", "Unknown Service"), **kwargs)
+
+    @classmethod
+    def load(cls, path=SIGNATURES_PATH, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f), **kwargs)
+
+    def _hits(self, lowered):
+        """(начало, длина, цели) для всех вхождений литералов, включая перекрывающиеся"""
+        if self.automaton is not None:
+            text = lowered.decode("latin-1") if ahocorasick.unicode else lowered
+            for end, (length, targets) in self.automaton.iter(text):
+                yield end - length + 1, length, targets
+            return
+        entries = self.entries
+        for m in self.pattern.finditer(lowered):
+            key = m.group(1)
+            start = m.start()
+            yield start, len(key), entries[key]
+            for shorter in self.prefixes[key]:
+                yield start, len(shorter), entries[shorter]
+
+    def analyze(self, data, with_risks=True):
+        """-> (тип сервиса, список рисков) для сырых байт ответа(ов)"""
+        lowered = data.lower()
+        best = len(self.service_names)
+        keywords = set()
+        headers = []
+        marked = False
+        for start, length, targets in self._hits(lowered):
+            for kind, value, exact in targets:
+                if exact is not None and data[start:start + length] != exact:
+                    continue
+                if kind == SERVICE:
+                    best = min(best, value)
+                elif not with_risks:
+                    continue
+                elif kind == KEYWORD:
+                    keywords.add(value)
+                elif kind == HEADER:
+                    line_start = max(data.rfind(b"\n", 0, start), data.rfind(b"\r", 0, start)) + 1
+                    if not data[line_start:start].strip():  # имя заголовка — в начале строки
+                        line_end = len(data)
+                        for sep in (b"\r", b"\n"):
+                            pos = data.find(sep, start)
+                            if 0 <= pos < line_end:
+                                line_end = pos
+                        headers.append((start, data[start:line_end].decode("utf-8", errors="ignore").strip()))
+                else:
+                    marked = True
+
+        service = self.service_names[best] if best < len(self.service_names) else self.default_service
+        if not with_risks:
+            return service, []
+        risks = []
+        if self.versions is not None:
+            found = set()
+            for m in self.versions.finditer(data):
+                start = m.start()
+                before = data[start - 1:start]
+                if before == b".":
+                    continue  # хвост чего-то вроде ".5.1" — не версия
+                if before in (b"v", b"V"):
+                    start -= 1
+                found.add(data[start:m.end()].decode("latin-1"))
+            if found:
+                risks.append(f"Обнаружены версии: {', '.join(sorted(found))}")
+        for _, line in sorted(headers):
+            risks.append(f"Раскрыт заголовок: {line}")
+        if keywords:
+            risks.append(f"Чувствительные ключевые слова: {', '.join(sorted(keywords))}")
+        if marked:
+            risks.append("Обнаружен стилизованный баннер")
+        return service, risks
+
+    def detect_service(self, data):
+        return self.analyze(data, with_risks=False)[0]
+
+    def __len__(self):
+        return sum(len(targets) for targets in self.entries.values())
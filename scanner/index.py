@@ -0,0 +1,130 @@
+# index.py
+# Индекс отпечатков для повторных сканов: файл SQLite с последним известным
+# состоянием каждого открытого порта (хост:порт -> проба-подтверждение и хэш её
+# ответа, сервис, риски, баннер, время разбора). Повторный скан проверяет порт
+# с неустаревшей записью одной пробой и делает полный разбор только при
+# несовпадении хэша или истёкшем TTL. Каждое изменение (новый, закрытый,
+# изменившийся порт) дописывается в таблицу history — это история по парку.
+import hashlib
+import json
+import re
+import sqlite3
+
+# Заголовки HTTP, которые меняются от запроса к запросу: в хэш не входят
+VOLATILE_HEADERS = [b"date", b"expires", b"last-modified", b"set-cookie", b"age", b"etag", b"x-request-id"]
+_VOLATILE = re.compile(rb"^(?:" + b"|".join(VOLATILE_HEADERS) + rb")[ \t]*:[^\n]*\n?",
+                       re.IGNORECASE | re.MULTILINE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ports (
+    host     TEXT NOT NULL,
+    port     INTEGER NOT NULL,
+    probe    TEXT NOT NULL,    -- проба для подтверждения
+    hash     TEXT NOT NULL,    -- response_hash её ответа
+    service  TEXT NOT NULL,
+    risks    TEXT NOT NULL,    -- JSON-список
+    banner   TEXT NOT NULL,
+    analyzed REAL NOT NULL,    -- время последнего полного разбора
+    checked  REAL NOT NULL,    -- время последней проверки
+    PRIMARY KEY (host, port)
+);
+CREATE TABLE IF NOT EXISTS history (
+    at     REAL NOT NULL,
+    host   TEXT NOT NULL,
+    port   INTEGER NOT NULL,
+    change TEXT NOT NULL,      -- new | closed | changed
+    detail TEXT NOT NULL       -- JSON записи из diff
+);
+"""
+
+def response_hash(data):
+    """Хэш ответа без изменчивых заголовков HTTP"""
+    if data.startswith(b"HTTP/"):
+        head, sep, body = data.partition(b"\r\n\r\n")
+        if not sep:
+            head, sep, body = data.partition(b"\n\n")
+        data = _VOLATILE.sub(b"", head) + sep + body
+    return hashlib.sha256(data).hexdigest()
+
+class FingerprintIndex:
+    """Последнее известное состояние открытых портов в файле SQLite"""
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def get(self, host, port):
+        return self.db.execute("SELECT * FROM ports WHERE host = ? AND port = ?", (host, port)).fetchone()
+
+    def entries(self, hosts, ports):
+        """{(хост, порт): запись} для портов из сканируемых хостов и портов.
+
+        Хосты и порты скана — во временных таблицах (в IN (...) их может быть больше,
+        чем SQLite разрешает параметров), отбор — соединением по первичному ключу.
+        """
+        # Не executescript: он молча фиксирует начатую транзакцию
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS scan_hosts (host TEXT PRIMARY KEY)")
+        self.db.execute("CREATE TEMP TABLE IF NOT EXISTS scan_ports (port INTEGER PRIMARY KEY)")
+        self.db.execute("DELETE FROM scan_hosts")
+        self.db.execute("DELETE FROM scan_ports")
+        self.db.executemany("INSERT OR IGNORE INTO scan_hosts VALUES (?)", ((host,) for host in hosts))
+        self.db.executemany("INSERT OR IGNORE INTO scan_ports VALUES (?)", ((port,) for port in ports))
+        rows = self.db.execute("SELECT ports.* FROM scan_hosts JOIN ports USING (host) "
+                               "JOIN scan_ports USING (port)")
+        return {(row["host"], row["port"]): row for row in rows}
+
+    def touch(self, host, port, now):
+        """Проба-подтверждение совпала: только отметить время проверки"""
+        self.db.execute("UPDATE ports SET checked = ? WHERE host = ? AND port = ?", (now, host, port))
+
+    def store(self, host, port, probe, digest, result, now):
+        """Записать полный разбор порта -> запись для diff или None, если ничего не изменилось"""
+        old = self.get(host, port)
+        self.db.execute("INSERT OR REPLACE INTO ports VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (host, port, probe, digest, result["service_guess"],
+                         json.dumps(result["risks"], ensure_ascii=False), result["initial_banner"], now, now))
+        change = {
+            "change": "new",
+            "target": host,
+            "port": port,
+            "service_guess": result["service_guess"],
+            "risks": result["risks"],
+            "initial_banner": result["initial_banner"],
+        }
+        if old is not None:
+            was_risks = json.loads(old["risks"])
+            banner_changed = old["probe"] != probe or old["hash"] != digest
+            if not banner_changed and old["service"] == result["service_guess"] and was_risks == result["risks"]:
+                return None
+            change.update({
+                "change": "changed",
+                "banner_changed": banner_changed,
+                "risks_added": [r for r in result["risks"] if r not in was_risks],
+                "risks_removed": [r for r in was_risks if r not in result["risks"]],
+                "was": {"service_guess": old["service"], "risks": was_risks, "initial_banner": old["banner"]},
+            })
+        self._log(change, now)
+        return change
+
+    def remove(self, host, port, now):
+        """Порт закрылся -> запись для diff"""
+        old = self.get(host, port)
+        if old is None:
+            return None
+        self.db.execute("DELETE FROM ports WHERE host = ? AND port = ?", (host, port))
+        change = {"change": "closed", "target": host, "port": port, "service_guess": old["service"]}
+        self._log(change, now)
+        return change
+
+    def _log(self, change, now):
+        self.db.execute("INSERT INTO history VALUES (?, ?, ?, ?, ?)",
+                        (now, change["target"], change["port"], change["change"],
+                         json.dumps(change, ensure_ascii=False)))
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,101 @@
+# probing.py
+# Адаптивный план проб одного порта, общий для синхронного и асинхронного движков.
+# - Ожидания считаются от измеренного RTT подключения, а не фиксированные 3 с.
+# - Чтение заканчивается на границе сообщения: полный HTTP-ответ с Content-Length,
+#   строка идентификации SSH, последняя строка ответа FTP/SMTP ("220 ...").
+# - Соединение переиспользуется следующей пробой, пока сервис его не закрыл.
+# - Для известных портов порядок проб — от вероятного протокола.
+# Пробы — объекты Probe: имя, что отправить, на каких портах применима, где идёт
+# первой и как разобрать ответ. Набор по умолчанию — scanner.PROBES.
+import re
+import socket
+import time
+
+BANNER_GRACE = 0.25   # сколько ждать баннера сверх 4 RTT: сервисы с баннером шлют его сразу
+REPLY_GRACE = 1.0     # ответ на пробу может требовать работы сервера
+IDLE_GRACE = 0.1      # пауза после данных, после которой считаем, что сервис договорил
+
+# Порты, где первым лучше говорить самим (HTTP не шлёт баннер — его ожидание пустое)
+HTTP_PORTS = {80, 443, 591, 3000, 5000, 8000, 8008, 8080, 8081, 8443, 8888, 9000}
+
+_CONTENT_LENGTH = re.compile(rb"\ncontent-length:[ \t]*(\d+)", re.IGNORECASE)
+_REPLY_LINE = re.compile(rb"\d{3}[ -]")
+
+class ProbeTimeouts:
+    """Ожидания для пробы по RTT подключения, не больше limit"""
+    def __init__(self, rtt, limit):
+        self.banner = min(BANNER_GRACE + 4 * rtt, limit)
+        self.reply = min(REPLY_GRACE + 8 * rtt, limit)
+        self.idle = min(IDLE_GRACE + 4 * rtt, limit)
+
+class Probe:
+    """Проба порта.
+
+    payload — что отправить (b"" — только слушать баннер); ports — на каких портах
+    проба применима (None — на всех); first_on — порты, где она идёт первой;
+    parser(data) -> dict или None — разбор ответа в поле details результата.
+    """
+    def __init__(self, name, payload=b"", ports=None, first_on=(), parser=None):
+        self.name = name
+        self.payload = payload
+        self.ports = None if ports is None else frozenset(ports)
+        self.first_on = frozenset(first_on)
+        self.parser = parser
+
+    def applies(self, port):
+        return self.ports is None or port in self.ports
+
+    def __repr__(self):
+        return f"Probe({self.name!r}, {self.payload!r})"
+
+def probe_order(port, probes):
+    """Применимые к порту пробы в порядке вероятности: сначала те, у которых порт в first_on"""
+    return sorted((p for p in probes if p.applies(port)), key=lambda p: port not in p.first_on)
+
+def message_complete(data):
+    """True, если data — целое сообщение известного протокола и ждать больше нечего"""
+    if data.startswith(b"HTTP/"):
+        end = data.find(b"\r\n\r\n")
+        sep = 4
+        if end < 0:
+            end, sep = data.find(b"\n\n"), 2
+            if end < 0:
+                return False
+        match = _CONTENT_LENGTH.search(data, 0, end)
+        # Без Content-Length конец ответа — закрытие соединения
+        return match is not None and len(data) - end - sep >= int(match.group(1))
+    if data.startswith(b"SSH-"):
+        return b"\n" in data
+    if _REPLY_LINE.match(data):
+        # FTP/SMTP: многострочный ответ "220-..." заканчивается строкой "220 ..."
+        if not data.endswith(b"\n"):
+            return False
+        last = data.rstrip(b"\r\n").rsplit(b"\n", 1)[-1]
+        return last[3:4] == b" " and last[:3].isdigit()
+    return False
+
+def recv_message(sock, first_wait, idle, max_bytes=8192):
+    """Прочитать ответ: (данные, закрыл ли сервис соединение).
+
+    До первого байта ждём first_wait, дальше — не дольше idle между кусками,
+    и сразу выходим, если сообщение уже целое.
+    """
+    data = b""
+    deadline = time.monotonic() + first_wait
+    while len(data) < max_bytes:
+        wait = deadline - time.monotonic() if not data else idle
+        if wait <= 0:
+            break
+        sock.settimeout(wait)
+        try:
+            chunk = sock.recv(min(4096, max_bytes - len(data)))
+        except socket.timeout:
+            break
+        except OSError:
+            return data, True
+        if not chunk:
+            return data, True
+        data += chunk
+        if message_complete(data):
+            break
+    return data, False
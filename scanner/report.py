@@ -0,0 +1,154 @@
+# report.py
+# Потоковый отчёт сканера в JSONL: строка на каждый завершённый порт пишется
+# сразу, так что память не растёт с числом портов, а при падении теряется не
+# больше одной строки. Перезапуск с тем же файлом пропускает уже записанные порты.
+# Виды строк:
+#   {"scan": {"target", "ports": [первый, последний], "started"}} — начало прогона
+#   {"target", "port", "open": true, ...}  — результат по открытому порту
+#   {"target", "port", "open": false}      — закрытый порт (коротко)
+#   {"done": {"target", "elapsed_seconds", "phases"?}} — конец прогона
+# Запуск как скрипт собирает из потока сводку в формате recon_report.json:
+#   python report.py scan.jsonl [-o recon_report.json]
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+def read_records(path):
+    """Строки потока по порядку; оборванная при падении последняя строка пропускается"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            yield json.loads(line)
+
+def _repair_tail(path):
+    """Отрезает недописанную последнюю строку, чтобы дозапись не склеилась с ней"""
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return
+        f.seek(max(size - 65536, 0))
+        tail = f.read()
+        if tail.endswith(b"\n"):
+            return
+        cut = tail.rfind(b"\n")
+        if cut < 0 and size > len(tail):
+            raise ValueError(f"{path}: последняя строка длиннее 64 КБ — файл не похож на поток сканера")
+        f.truncate(size - len(tail) + cut + 1)
+
+class StreamReport:
+    """Дозапись результатов в JSONL; full_text по умолчанию не пишется — он повторяет responses"""
+    def __init__(self, path, full_text=False):
+        self.path = path
+        self.full_text = full_text
+        self.recorded = set()  # (хост, порт) уже в файле — их пропускаем при продолжении
+        if os.path.exists(path):
+            _repair_tail(path)
+            for record in read_records(path):
+                if "port" in record:
+                    self.recorded.add((record["target"], record["port"]))
+        self._file = open(path, "a", encoding="utf-8", buffering=1)  # построчный сброс
+
+    def start(self, target, ports):
+        self._file.write(_dumps({"scan": {"target": target, "ports": [ports[0], ports[-1]],
+                                          "started": datetime.now().isoformat(timespec="seconds")}}) + "\n")
+
+    def result(self, target, res):
+        if not res["open"]:
+            record = {"target": target, "port": res["port"], "open": False}
+        else:
+            record = {"target": target, **res}
+            if not self.full_text:
+                del record["full_text"]
+        self._file.write(_dumps(record) + "\n")
+        self.recorded.add((target, res["port"]))
+
+    def done(self, target, elapsed, phases=None):
+        info = {"target": target, "elapsed_seconds": round(elapsed, 3)}
+        if phases:
+            info["phases"] = phases
+        self._file.write(_dumps({"done": info}) + "\n")
+
+    def close(self):
+        self._file.close()
+
+def build_summaries(records):
+    """Сводки в формате recon_report.json по каждой цели потока: {цель: сводка}"""
+    targets = {}
+
+    def summary(target):
+        if target not in targets:
+            targets[target] = {"ports": None, "open": {}, "elapsed": 0.0, "phases": None}
+        return targets[target]
+
+    for record in records:
+        if "scan" in record:
+            scan = summary(record["scan"]["target"])
+            first, last = record["scan"]["ports"]
+            if scan["ports"]:
+                first, last = min(first, scan["ports"][0]), max(last, scan["ports"][1])
+            scan["ports"] = [first, last]
+        elif "done" in record:
+            scan = summary(record["done"]["target"])
+            scan["elapsed"] += record["done"]["elapsed_seconds"]
+            scan["phases"] = record["done"].get("phases") or scan["phases"]
+        else:
+            scan = summary(record.pop("target"))
+            if record["open"]:
+                if "full_text" not in record:
+                    # Восстанавливаем из responses, на прежнем месте среди ключей
+                    ordered = {}
+                    for key, value in record.items():
+                        if key == "service_guess":
+                            ordered["full_text"] = "\n".join(record["responses"].values())
+                        ordered[key] = value
+                    record = ordered
+                scan["open"][record["port"]] = record
+            else:
+                scan["open"].pop(record["port"], None)  # при повторном прогоне порт мог закрыться
+
+    out = {}
+    for target, scan in targets.items():
+        results = [scan["open"][port] for port in sorted(scan["open"])]
+        ports = scan["ports"]
+        if ports is None:  # заголовок прогона потерян — диапазон по найденным портам
+            ports = [results[0]["port"], results[-1]["port"]] if results else []
+        report = {
+            "target": target,
+            "scanned_ports": ports,
+            "open_ports_count": len(results),
+            "elapsed_seconds": round(scan["elapsed"], 3),
+        }
+        if scan["phases"]:
+            report["phases"] = scan["phases"]
+        report["results"] = results
+        out[target] = report
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Сводка recon_report.json из потокового отчёта сканера")
+    parser.add_argument("stream", help="JSONL-файл, записанный scanner.py --jsonl")
+    parser.add_argument("-o", "--output", default="recon_report.json", help="Куда записать сводку ('-' — stdout)")
+    args = parser.parse_args()
+
+    summaries = build_summaries(read_records(args.stream))
+    # Одна цель — ровно прежний формат, несколько — список сводок по целям с открытыми портами
+    if len(summaries) == 1:
+        report = next(iter(summaries.values()))
+    else:
+        report = {"targets": [summary for summary in summaries.values() if summary["results"]]}
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[+] Сводка сохранена в {args.output} (целей: {len(summaries)})")
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,47 @@
 # scanner.py
+# Сканер портов: командная строка (main) и библиотечный API — scan() и
+# scan_async() отдают результаты по портам по мере готовности, набор проб
+# расширяется через register_probe().
 import socket
 import sys
-import re
 import time
 import json
+import asyncio
+import argparse
+import resource
+import itertools
+import threading
+import multiprocessing
+import queue as queue_module
+from datetime import datetime
 from typing import Dict, List, Tuple
 
-# === ЭВРИСТИКИ ===
-HTTP_SIGNATURES = [
-    b"HTTP/", b"<!DOCTYPE", b"<html", b"<HTML", b"Content-Type",
-    b"Server:", b"X-Powered-By", b"Set-Cookie", b"Location:"
-]
-SSH_SIGNATURES = [b"SSH-"]
-FTP_SIGNATURES = [b"220", b"FTP"]
-SMTP_SIGNATURES = [b"220", b"ESMTP", b"SMTP"]
-TELNET_LIKE = [b"login:", b"password:", b"console", b"***", b"access denied", b"Login:", b"Username:"]
-
-SENSITIVE_KEYWORDS = [
-    "erp", "warehouse", "internal", "legacy", "backend", "console",
-    "admin", "root", "powered by", "built with", "debug", "test",
-    "dashboard", "portal", "service", "ready", "error", "protocol",
-    "database", "db", "management", "system"
-]
+from aioscan import AsyncScanner
+from fingerprint import Fingerprinter
+from index import FingerprintIndex, response_hash
+from probing import HTTP_PORTS, Probe, ProbeTimeouts, probe_order, recv_message
+from report import StreamReport
+from sweep import connect_sweep
+from targets import TargetError, expand_hosts, interleave, parse_ports
+
+# Сигнатуры сервисов и рисков — в signatures.json, --signatures подменяет файл
+FINGERPRINTS = Fingerprinter.load()
+
+# Пробы по порядку; пустой payload — только слушать баннер. Дополняется register_probe()
+HTTP_PROBE = b"GET / HTTP/1.0\r\nHost: localhost\r\nUser-Agent: ReconScanner/1.0\r\nConnection: close\r\n\r\n"
+PROBES = [Probe("banner"), Probe("http", HTTP_PROBE, first_on=HTTP_PORTS), Probe("neutral", b"\n")]
+# После такого вывода остальные пробы ничего не уточнят
+CONFIDENT_SERVICES = {"HTTP-like", "SSH", "FTP", "SMTP", "Telnet/Admin Console"}
+PROGRESS_INTERVAL = 1.0  # как часто печатать прогресс многопроцессного скана, сек
+DEFAULT_TTL = 24 * 3600  # через сколько секунд повторный скан разбирает порт заново, даже без изменений
+
+def register_probe(probe: Probe) -> None:
+    """Добавить пробу в набор по умолчанию; проба с тем же именем заменяется"""
+    for i, known in enumerate(PROBES):
+        if known.name == probe.name:
+            PROBES[i] = probe
+            return
+    PROBES.append(probe)
 
 def tcp_connect(host: str, port: int, timeout: float = 3.0) -> socket.socket | None:
     try:
@@ -32,86 +52,17 @@ def tcp_connect(host: str, port: int, timeout: float = 3.0) -> socket.socket | N
     except (OSError, socket.timeout):
         return None
 
-def safe_recv(s: socket.socket, timeout: float = 3.0, max_bytes: int = 8192) -> bytes:
-    try:
-        s.settimeout(timeout)
-        data = b""
-        while len(data) < max_bytes:
-            try:
-                chunk = s.recv(1024)
-                if not chunk:
-                    break
-                data += chunk
-            except socket.timeout:
-                break
-        return data
-    except Exception:
-        return b""
-
-def send_and_recv(s: socket.socket, probe: bytes) -> bytes:
-    try:
-        if probe:
-            s.sendall(probe)
-        return safe_recv(s)
-    except Exception:
-        return b""
-
 def detect_service_from_data(data: bytes) -> str:
-    total = data.lower()
-    if any(sig.lower() in total for sig in HTTP_SIGNATURES):
-        return "HTTP-like"
-    if any(sig in data for sig in SSH_SIGNATURES):
-        return "SSH"
-    if any(sig in data for sig in FTP_SIGNATURES):
-        return "FTP"
-    if any(sig in data for sig in SMTP_SIGNATURES):
-        return "SMTP"
-    if any(kw in total for kw in [b"login:", b"password:", b"console", b"access denied", b"***", b"login", b"username:"]):
-        return "Telnet/Admin Console"
-    if b"ready" in total or b"error" in total or b"protocol" in total:
-        return "Custom TCP Service"
-    return "Unknown Service"
+    return FINGERPRINTS.detect_service(data)
+
+def is_confident(data: bytes) -> bool:
+    return detect_service_from_data(data) in CONFIDENT_SERVICES
 
 def extract_risks(full_data: bytes) -> List[str]:
-    text = full_data.decode('utf-8', errors='ignore')
-    lines = text.splitlines()
-    risks = []
-
-    # Версии
-    version_patterns = [
-        r'\b\d+\.\d+(?:\.\d+)?\b',
-        r'[vV]\d+\.?\d*',
-        r'/\d+\.\d+',
-        r'-v\d+\.\d+',
-    ]
-    found_versions = set()
-    for pattern in version_patterns:
-        matches = re.findall(pattern, text)
-        for m in matches:
-            ver = m if isinstance(m, str) else (m[0] if isinstance(m, tuple) else str(m))
-            found_versions.add(ver)
-    if found_versions:
-        risks.append(f"Обнаружены версии: {', '.join(sorted(found_versions))}")
-
-    # Заголовки
-    for line in lines:
-        stripped = line.strip()
-        if stripped.lower().startswith(("server:", "x-powered-by:", "x-generator:", "x-backend:")):
-            risks.append(f"Раскрыт заголовок: {stripped}")
-
-    # Ключевые слова
-    text_lower = text.lower()
-    found_keywords = [kw for kw in SENSITIVE_KEYWORDS if kw in text_lower]
-    if found_keywords:
-        risks.append(f"Чувствительные ключевые слова: {', '.join(sorted(set(found_keywords)))}")
-
-    if "***" in text or "!!!" in text or "###" in text:
-        risks.append("Обнаружен стилизованный баннер")
-
-    return risks
-
-def scan_port(host: str, port: int) -> Dict:
-    result = {
+    return FINGERPRINTS.analyze(full_data)[1]
+
+def empty_result(port: int) -> Dict:
+    return {
         "port": port,
         "open": False,
         "initial_banner": "",
@@ -121,128 +72,622 @@ def scan_port(host: str, port: int) -> Dict:
         "risks": []
     }
 
-    s = tcp_connect(host, port)
-    if not s:
-        return result
-
+def analyze_responses(port: int, responses: Dict[str, bytes], probes: List[Probe] | None = None) -> Dict:
+    """Результат по порту из сырых ответов на пробы (общий для обоих движков).
+    Разбор ответов парсерами проб, если они что-то вернули, — в поле details.
+    """
+    result = empty_result(port)
     result["open"] = True
 
-    # Сбор всех ответов
-    responses = {}
-
-    # 1. Получаем начальный баннер (без отправки данных)
-    banner = safe_recv(s)
-    responses["banner"] = banner
-    all_data = banner
-
-    # 2. Пробуем HTTP
-    s2 = tcp_connect(host, port)
-    if s2:
-        http_probe = b"GET / HTTP/1.0\r\nHost: localhost\r\nUser-Agent: ReconScanner/1.0\r\nConnection: close\r\n\r\n"
-        http_resp = send_and_recv(s2, http_probe)
-        responses["http"] = http_resp
-        all_data += http_resp
-        s2.close()
-
-    # 3. Пробуем нейтральный пробник
-    s3 = tcp_connect(host, port)
-    if s3:
-        neutral_resp = send_and_recv(s3, b"\n")
-        responses["neutral"] = neutral_resp
-        all_data += neutral_resp
-        s3.close()
-
     # Объединяем всё для анализа
-    full_data = all_data
+    banner = responses.get("banner", b"")
+    full_data = b"".join(responses.values())
     result["initial_banner"] = banner.decode('utf-8', errors='ignore').strip()
     result["responses"] = {
         k: v.decode('utf-8', errors='ignore').strip() for k, v in responses.items() if v
     }
     result["full_text"] = full_data.decode('utf-8', errors='ignore')
 
-    # Определяем тип по всему набору данных
-    result["service_guess"] = detect_service_from_data(full_data)
-    result["risks"] = extract_risks(full_data)
+    # Тип и риски — за один проход по всему набору данных
+    result["service_guess"], result["risks"] = FINGERPRINTS.analyze(full_data)
+
+    details = {}
+    for probe in PROBES if probes is None else probes:
+        if probe.parser is not None and responses.get(probe.name):
+            parsed = probe.parser(responses[probe.name])
+            if parsed:
+                details[probe.name] = parsed
+    if details:
+        result["details"] = details
+    return result
+
+def scan_port(host: str, port: int, timeout: float = 3.0) -> Dict:
+    started = time.monotonic()
+    s = tcp_connect(host, port, timeout)
+    if not s:
+        return empty_result(port)
+    timeouts = ProbeTimeouts(time.monotonic() - started, timeout)
 
+    # Сбор всех ответов
+    responses = {}
+    fresh = True  # по соединению ещё ничего не отправляли: можно слушать баннер
     try:
-        s.close()
-    except:
-        pass
+        for probe in probe_order(port, PROBES):
+            name, payload = probe.name, probe.payload
+            if s is None or (not payload and not fresh):
+                if s is not None:
+                    s.close()
+                s = tcp_connect(host, port, timeout)
+                if s is None:
+                    continue
+                fresh = True
+            try:
+                if payload:
+                    s.sendall(payload)
+                data, closed = recv_message(s, timeouts.reply if payload else timeouts.banner, timeouts.idle)
+            except OSError:
+                data, closed = b"", True
+            responses[name] = data
+            fresh = False
+            if closed:
+                s.close()
+                s = None  # следующей пробе нужно новое соединение
+            if is_confident(b"".join(responses.values())):
+                break
+    finally:
+        if s is not None:
+            s.close()
+
+    return analyze_responses(port, responses)
+
+def scan_targets(targets, on_result, concurrency: int = 500, rate: float = 0, per_host: int = 100,
+                 timeout: float = 3.0, window: int = 2000, report_closed: bool = False) -> Dict:
+    """Двухфазное сканирование пар (хост, порт): быстрый connect-обход всех, затем пробы
+    только по открытым. on_result(host, result) вызывается для открытых портов по мере
+    готовности, а при report_closed — и для закрытых (сразу по итогам обхода).
+    -> сводка фаз для отчёта (длительности и счётчики обхода)
+    """
+    t0 = time.perf_counter()
+    open_targets = []
+    on_closed = (lambda h, p, state: on_result(h, empty_result(p))) if report_closed else None
+    sweep = connect_sweep(targets, lambda h, p: open_targets.append((h, p)),
+                          window=window, rate=rate, per_host=per_host, max_timeout=timeout,
+                          on_closed=on_closed)
+    t1 = time.perf_counter()
+
+    if open_targets:
+        scanner = AsyncScanner(PROBES, concurrency=min(concurrency, len(open_targets)), rate=rate,
+                               per_host=per_host, timeout=timeout, is_confident=is_confident)
+
+        def done(host, port, responses):
+            # Порт мог закрыться между фазами
+            on_result(host, empty_result(port) if responses is None else analyze_responses(port, responses))
+
+        asyncio.run(scanner.run(open_targets, done))
+    t2 = time.perf_counter()
+    return {
+        "sweep_seconds": round(t1 - t0, 3),
+        "probe_seconds": round(t2 - t1, 3),
+        "sweep": sweep,
+    }
 
-    return result
+def scan_ports_async(host: str, ports: List[int], on_result, **options) -> Dict:
+    """scan_targets для одного хоста: on_result(result)"""
+    return scan_targets(((host, port) for port in ports), lambda h, res: on_result(res), **options)
+
+def confirmation_probe(port: int, responses: Dict[str, bytes]) -> str:
+    """Проба, по ответу которой повторный скан узнаёт сервис: первая ответившая по порядку"""
+    order = [probe.name for probe in probe_order(port, PROBES) if probe.name in responses]
+    for name in order:
+        if responses[name]:
+            return name
+    return order[0] if order else PROBES[0].name
+
+def rescan_targets(hosts: List[str], ports: List[int], index: FingerprintIndex, on_change,
+                   ttl: float = DEFAULT_TTL, concurrency: int = 500, rate: float = 0, per_host: int = 100,
+                   timeout: float = 3.0, window: int = 2000) -> Dict:
+    """Повторное сканирование по индексу отпечатков. После connect-обхода порт с
+    записью моложе ttl проверяется одной пробой-подтверждением; полный разбор —
+    только для новых портов, при другом ответе или устаревшей записи. Записи
+    закрывшихся портов удаляются. on_change(change) получает записи diff.
+    -> сводка фаз (как у scan_targets) со счётчиками confirmed/analyzed
+    """
+    now = time.time()
+    known = index.entries(set(hosts), set(ports))
+    t0 = time.perf_counter()
+    open_targets = []
+    sweep = connect_sweep(interleave(hosts, ports), lambda h, p: open_targets.append((h, p)),
+                          window=window, rate=rate, per_host=per_host, max_timeout=timeout)
+    t1 = time.perf_counter()
+
+    def closed(host, port):
+        change = index.remove(host, port, now)
+        if change is not None:
+            on_change(change)
+
+    for target in known.keys() - set(open_targets):
+        closed(*target)
+
+    counts = {"confirmed": 0, "analyzed": 0}
+    if open_targets:
+        by_name = {probe.name: probe for probe in PROBES}
+        scanner = AsyncScanner(PROBES, concurrency=min(concurrency, len(open_targets)), rate=rate,
+                               per_host=per_host, timeout=timeout, is_confident=is_confident)
+
+        async def check(host, port):
+            entry = known.get((host, port))
+            if entry is not None and now - entry["analyzed"] < ttl and entry["probe"] in by_name:
+                name = entry["probe"]
+                responses = await scanner.probe(host, port, [by_name[name]])
+                if responses is None:
+                    return None
+                if response_hash(responses.get(name, b"")) == entry["hash"]:
+                    return "confirmed"
+            return await scanner.probe(host, port)
+
+        def done(host, port, outcome):
+            if outcome is None:  # порт закрылся между фазами
+                closed(host, port)
+            elif outcome == "confirmed":
+                counts["confirmed"] += 1
+                index.touch(host, port, now)
+            else:
+                counts["analyzed"] += 1
+                name = confirmation_probe(port, outcome)
+                change = index.store(host, port, name, response_hash(outcome.get(name, b"")),
+                                     analyze_responses(port, outcome), now)
+                if change is not None:
+                    on_change(change)
+
+        asyncio.run(scanner.run(open_targets, done, probe=check))
+    index.commit()
+    t2 = time.perf_counter()
+    return {
+        "sweep_seconds": round(t1 - t0, 3),
+        "probe_seconds": round(t2 - t1, 3),
+        "sweep": sweep,
+        **counts,
+    }
 
-def parse_port_range(arg: str) -> range:
+async def scan_async(hosts, ports, probes: List[Probe] | None = None, on_open=None, on_risk=None,
+                     closed: bool = False, concurrency: int = 500, rate: float = 0, per_host: int = 100,
+                     timeout: float = 3.0, window: int = 2000):
+    """Асинхронный итератор результатов по портам по мере готовности:
+    {"target": хост, **результат как в recon_report.json}.
+
+    hosts и ports — строки в формате командной строки ("10.0.0.0/24,@hosts.txt",
+    "22,80,8000-8100") или списки. Connect-обход идёт в отдельном потоке, и
+    открытые порты уходят в пробы сразу, не дожидаясь конца обхода. on_open(result)
+    вызывается для каждого открытого порта, on_risk(result, risk) — для каждого
+    риска; closed=True отдаёт и закрытые порты. Прерванный скан (aclose(), отмена)
+    останавливает обход.
+    """
+    hosts = expand_hosts(hosts) if isinstance(hosts, str) else list(hosts)
+    ports = parse_ports(ports) if isinstance(ports, str) else sorted(ports)
+    probes = list(PROBES if probes is None else probes)
+    loop = asyncio.get_running_loop()
+    found = asyncio.Queue()    # открытые по итогам обхода; None — обход закончен
+    results = asyncio.Queue()  # готовые результаты; None — скан закончен
+    stop = threading.Event()
+
+    def opened(host, port):
+        loop.call_soon_threadsafe(found.put_nowait, (host, port))
+
+    def refused(host, port, state):
+        loop.call_soon_threadsafe(results.put_nowait, {"target": host, **empty_result(port)})
+
+    def sweep():
+        targets = itertools.takewhile(lambda _: not stop.is_set(), interleave(hosts, ports))
+        try:
+            return connect_sweep(targets, opened, window=window, rate=rate, per_host=per_host,
+                                 max_timeout=timeout, on_closed=refused if closed else None)
+        finally:
+            loop.call_soon_threadsafe(found.put_nowait, None)
+
+    scanner = AsyncScanner(probes, concurrency=concurrency, rate=rate, per_host=per_host,
+                           timeout=timeout, is_confident=is_confident)
+
+    def done(host, port, responses):
+        if responses is not None:
+            results.put_nowait({"target": host, **analyze_responses(port, responses, probes)})
+        elif closed:  # порт закрылся между обходом и пробами
+            results.put_nowait({"target": host, **empty_result(port)})
+
+    async def probe_all():
+        try:
+            await scanner.run(found, done)
+        finally:
+            results.put_nowait(None)
+
+    sweeping = loop.run_in_executor(None, sweep)
+    probing = asyncio.ensure_future(probe_all())
     try:
-        if '-' in arg:
-            start, end = map(int, arg.split('-'))
-            if start > end:
-                raise ValueError("Начало диапазона больше конца")
-            return range(start, end + 1)
-        else:
-            port = int(arg)
-            return range(port, port + 1)
-    except Exception as e:
-        print(f"Ошибка в формате диапазона портов: {e}")
-        sys.exit(1)
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            if result["open"]:
+                if on_open is not None:
+                    on_open(result)
+                if on_risk is not None:
+                    for risk in result["risks"]:
+                        on_risk(result, risk)
+            yield result
+        await sweeping   # ошибки обхода и проб — вызывающему
+        await probing
+    finally:
+        stop.set()
+        probing.cancel()
+        await asyncio.gather(sweeping, probing, return_exceptions=True)
+
+def scan(hosts, ports, **options):
+    """Синхронный генератор поверх scan_async (те же аргументы): результаты по мере
+    готовности, сам скан идёт в фоновом потоке со своим циклом событий. Если
+    перестать читать и закрыть генератор (break, close()), скан останавливается.
+    """
+    results = queue_module.Queue()
+    finished = object()
+    loop = asyncio.new_event_loop()
+
+    async def pump():
+        async for result in scan_async(hosts, ports, **options):
+            results.put(result)
+
+    task = loop.create_task(pump())
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(finished)
+
+    thread = threading.Thread(target=run, name="scan", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is finished:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        if thread.is_alive():
+            loop.call_soon_threadsafe(task.cancel)
+        thread.join()
+        loop.close()
+
+def _shard_worker(index, count, hosts, ports, skip, options, signatures, record_closed, queue):
+    """Процесс-воркер: каждая count-я пара начиная с index, результаты — в очередь родителю"""
+    if signatures:
+        global FINGERPRINTS
+        FINGERPRINTS = Fingerprinter.load(signatures)
+    closed = []
+    closed_count = 0
+    last_flush = time.monotonic()
+
+    def flush():
+        nonlocal closed_count, last_flush
+        queue.put(("closed", closed_count, closed[:]))
+        closed.clear()
+        closed_count = 0
+        last_flush = time.monotonic()
+
+    def on_result(host, res):
+        nonlocal closed_count
+        if res["open"]:
+            queue.put(("open", host, res))
+            return
+        # Закрытых портов много — шлём пачками, а без потокового отчёта только их число
+        closed_count += 1
+        if record_closed:
+            closed.append((host, res["port"]))
+        if closed_count >= 1000 or time.monotonic() - last_flush > PROGRESS_INTERVAL / 4:
+            flush()
+
+    targets = itertools.islice(interleave(hosts, ports), index, None, count)
+    if skip:
+        targets = (target for target in targets if target not in skip)
+    phases = scan_targets(targets, on_result, report_closed=True, **options)
+    flush()
+    queue.put(("done", index, phases))
+
+def scan_sharded(hosts: List[str], ports: List[int], workers: int, on_result, skip=frozenset(),
+                 signatures: str | None = None, record_closed: bool = False, **options) -> Dict:
+    """scan_targets в workers процессах. Пары (хост, порт) делятся по кругу в порядке
+    interleave, так что каждый воркер идёт вперемешку по всем хостам; --rate и --per-host
+    делятся между воркерами. on_result(host, result) вызывается в этом процессе — для
+    закрытых портов только при record_closed. Раз в PROGRESS_INTERVAL печатается общий прогресс.
+    """
+    total = len(hosts) * len(ports) - len(skip)
+    if options.get("rate"):
+        options["rate"] = options["rate"] / workers
+    options["per_host"] = max(-(-options.get("per_host", 100) // workers), 1)
+    ctx = multiprocessing.get_context()
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_shard_worker, daemon=True,
+                         args=(i, workers, hosts, ports, skip, options, signatures, record_closed, queue))
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+
+    started = time.perf_counter()
+    next_report = started + PROGRESS_INTERVAL
+    done = open_count = 0
+    shard_phases = []
+    try:
+        while len(shard_phases) < workers:
+            try:
+                msg = queue.get(timeout=0.2)
+            except queue_module.Empty:
+                if any(proc.exitcode not in (None, 0) for proc in procs):
+                    raise RuntimeError("Воркер сканирования завершился с ошибкой")
+                msg = None
+            if msg is not None:
+                kind = msg[0]
+                if kind == "open":
+                    done += 1
+                    open_count += 1
+                    on_result(msg[1], msg[2])
+                elif kind == "closed":
+                    done += msg[1]
+                    for host, port in msg[2]:
+                        on_result(host, {"port": port, "open": False})
+                else:
+                    shard_phases.append(msg[2])
+            now = time.perf_counter()
+            if now >= next_report:
+                next_report = now + PROGRESS_INTERVAL
+                print(f"[~] Проверено {done}/{total} ({done * 100 / max(total, 1):.1f}%), "
+                      f"открыто {open_count}, {done / (now - started):.0f} проверок/с", flush=True)
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+
+    sweep = {"open": 0, "closed": 0, "filtered": 0, "timeout": 0.0}
+    for phases in shard_phases:
+        for key in ("open", "closed", "filtered"):
+            sweep[key] += phases["sweep"][key]
+        sweep["timeout"] = max(sweep["timeout"], phases["sweep"]["timeout"])
+    return {
+        "workers": workers,
+        # Воркеры работают параллельно — длительность фазы по самому долгому
+        "sweep_seconds": max(p["sweep_seconds"] for p in shard_phases),
+        "probe_seconds": max(p["probe_seconds"] for p in shard_phases),
+        "sweep": sweep,
+    }
+
+def raise_fd_limit(needed: int) -> None:
+    """Каждое одновременное соединение — дескриптор; мягкий лимит часто всего 1024"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard == resource.RLIM_INFINITY else min(needed, hard), hard))
+
+def print_result(res: Dict, host: str | None = None) -> None:
+    port = res["port"]
+    print(f"\n[OPEN] Порт {host}:{port}/tcp" if host else f"\n[OPEN] Порт {port}/tcp")
+    print(f"  → Сервис (гипотеза): {res['service_guess']}")
+
+    if res["initial_banner"]:
+        banner_lines = res["initial_banner"].splitlines()[:3]
+        print(f"  → Баннер:\n      " + "\n      ".join(banner_lines))
+    else:
+        print("  → Баннер не получен")
+
+    # Показываем наиболее информативный ответ
+    best_resp = ""
+    for key, resp in res["responses"].items():
+        if resp and len(resp) > len(best_resp):
+            best_resp = resp
+    if best_resp:
+        resp_lines = best_resp.splitlines()[:3]
+        print(f"  → Наиболее полный ответ:\n      " + "\n      ".join(resp_lines))
+
+    if res["risks"]:
+        print("  → ПОТЕНЦИАЛЬНЫЕ РИСКИ:")
+        for r in res["risks"]:
+            print(f"      • {r}")
+    else:
+        print("  → Явных рисков не обнаружено")
+
+def print_change(change: Dict) -> None:
+    where = f"{change['target']}:{change['port']}/tcp"
+    if change["change"] == "closed":
+        print(f"\n[CLOSED] Порт {where} (был: {change['service_guess']})")
+        return
+    if change["change"] == "new":
+        print(f"\n[NEW] Порт {where}")
+        print(f"  → Сервис (гипотеза): {change['service_guess']}")
+        for r in change["risks"]:
+            print(f"      • {r}")
+        return
+    print(f"\n[CHANGED] Порт {where}")
+    was = change["was"]
+    if was["service_guess"] != change["service_guess"]:
+        print(f"  → Сервис: {was['service_guess']} → {change['service_guess']}")
+    if change["banner_changed"]:
+        print("  → Ответ сервиса изменился")
+    for r in change["risks_added"]:
+        print(f"      + {r}")
+    for r in change["risks_removed"]:
+        print(f"      - {r}")
+
+def run_rescan(args, hosts: List[str], ports: List[int]) -> None:
+    """Режим --index: повторный скан с diff вместо полного отчёта"""
+    index = FingerprintIndex(args.index)
+    changes = []
+
+    def on_change(change):
+        changes.append(change)
+        print_change(change)
+
+    raise_fd_limit(max(args.concurrency, args.window) + 64)
+    start_time = time.time()
+    try:
+        phases = rescan_targets(hosts, ports, index, on_change, ttl=args.ttl, concurrency=args.concurrency,
+                                rate=args.rate, per_host=args.per_host, timeout=args.timeout, window=args.window)
+    finally:
+        index.close()
+    elapsed = time.time() - start_time
+
+    summary = {kind: sum(c["change"] == kind for c in changes) for kind in ("new", "closed", "changed")}
+    print(f"\n[✓] Повторное сканирование завершено за {elapsed:.1f} сек. Новых: {summary['new']}, "
+          f"закрылось: {summary['closed']}, изменилось: {summary['changed']}")
+    print(f"    Подтверждено одной пробой: {phases['confirmed']}, разобрано полностью: {phases['analyzed']}")
+
+    changes.sort(key=lambda c: (c["target"], c["port"]))
+    diff = {
+        "scanned_at": datetime.now().isoformat(timespec="seconds"),
+        "hosts": len(hosts),
+        "scanned_ports": [ports[0], ports[-1]],
+        "elapsed_seconds": round(elapsed, 3),
+        "phases": phases,
+        "summary": summary,
+        "changes": changes,
+    }
+    with open(args.diff, "w", encoding="utf-8") as f:
+        json.dump(diff, f, indent=2, ensure_ascii=False)
+    print(f"\n[+] Изменения сохранены в {args.diff}; состояние — в {args.index}")
 
 def main():
-    if len(sys.argv) < 3:
-        print("Использование: python scanner.py <хост> <диапазон_портов>")
-        print("Пример: python scanner.py localhost 9000-9002")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Мультипротокольный сканер портов",
+                                     epilog="Пример: python scanner.py localhost 9000-9002; "
+                                            "python scanner.py 10.0.0.0/22,@hosts.txt 22,80,8000-8100 --workers 4")
+    parser.add_argument("host", help="Хост, подсеть CIDR, @файл со списком или несколько через запятую")
+    parser.add_argument("ports", help="Порты и диапазоны через запятую, например 22,80,1000-2000")
+    parser.add_argument("--concurrency", type=int, default=500,
+                        help="Сколько портов сканируется одновременно")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Не больше N подключений в секунду (0 — без ограничения)")
+    parser.add_argument("--per-host", type=int, default=100,
+                        help="Не больше N одновременных соединений к хосту")
+    parser.add_argument("--timeout", type=float, default=3.0,
+                        help="Таймаут подключения и паузы при чтении, сек")
+    parser.add_argument("--window", type=int, default=2000,
+                        help="Сколько connect() одновременно в фазе обхода")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Сколько процессов делят между собой пары (хост, порт)")
+    parser.add_argument("--signatures", help="Файл сигнатур вместо scanner/signatures.json")
+    parser.add_argument("--jsonl", metavar="FILE",
+                        help="Писать результаты построчно в FILE по мере готовности вместо recon_report.json; "
+                             "повторный запуск с тем же файлом пропускает уже записанные порты")
+    parser.add_argument("--full-text", action="store_true",
+                        help="Писать в --jsonl и full_text (по умолчанию только responses)")
+    parser.add_argument("--sync", action="store_true",
+                        help="Старый последовательный режим (по одному порту)")
+    parser.add_argument("--index", metavar="DB",
+                        help="Повторный скан по индексу отпечатков в файле SQLite DB: неизменившиеся порты "
+                             "подтверждаются одной пробой, вместо отчёта — изменения в --diff")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL,
+                        help="Через сколько секунд порт из --index разбирается полностью даже без изменений")
+    parser.add_argument("--diff", default="recon_diff.json",
+                        help="Куда записать изменения в режиме --index")
+    args = parser.parse_args()
+    if args.index and (args.sync or args.jsonl or args.workers > 1):
+        parser.error("--index нельзя совмещать с --sync, --jsonl и --workers")
+    if args.signatures:
+        global FINGERPRINTS
+        FINGERPRINTS = Fingerprinter.load(args.signatures)
 
-    host = sys.argv[1]
-    port_range = parse_port_range(sys.argv[2])
-    ports = list(port_range)
+    try:
+        hosts = expand_hosts(args.host)
+        ports = parse_ports(args.ports)
+    except (TargetError, OSError) as e:
+        print(f"Ошибка в задании целей: {e}")
+        sys.exit(1)
+    multi = len(hosts) > 1
+    total = len(hosts) * len(ports)
 
-    print(f"[+] Сканирование хоста: {host}")
+    if multi:
+        print(f"[+] Сканирование хостов: {len(hosts)} ({hosts[0]} … {hosts[-1]})")
+    else:
+        print(f"[+] Сканирование хоста: {hosts[0]}")
     print(f"[+] Диапазон портов: {ports[0]}–{ports[-1]} (всего: {len(ports)})")
     print("[+] Режим: мультипротокольная пассивная рекогносцировка\n")
 
+    if args.index:
+        run_rescan(args, hosts, ports)
+        return
+
+    stream = None
+    skip = frozenset()
+    if args.jsonl:
+        stream = StreamReport(args.jsonl, full_text=args.full_text)
+        host_set, port_set = set(hosts), set(ports)
+        skip = frozenset(t for t in stream.recorded if t[0] in host_set and t[1] in port_set)
+        if skip:
+            print(f"[+] Продолжение: {len(skip)} портов уже в {args.jsonl}, осталось {total - len(skip)}\n")
+        for host in hosts:
+            stream.start(host, ports)
+
     open_count = 0
-    all_results = []
+    all_results = {}
     start_time = time.time()
 
-    for port in ports:
-        res = scan_port(host, port)
-        all_results.append(res)
-
+    def on_result(host, res):
+        nonlocal open_count
+        if stream is not None:
+            stream.result(host, res)  # в памяти ничего не копится
         if res["open"]:
             open_count += 1
-            print(f"\n[OPEN] Порт {port}/tcp")
-            print(f"  → Сервис (гипотеза): {res['service_guess']}")
-            
-            if res["initial_banner"]:
-                banner_lines = res["initial_banner"].splitlines()[:3]
-                print(f"  → Баннер:\n      " + "\n      ".join(banner_lines))
-            else:
-                print("  → Баннер не получен")
-
-            # Показываем наиболее информативный ответ
-            best_resp = ""
-            for key, resp in res["responses"].items():
-                if resp and len(resp) > len(best_resp):
-                    best_resp = resp
-            if best_resp:
-                resp_lines = best_resp.splitlines()[:3]
-                print(f"  → Наиболее полный ответ:\n      " + "\n      ".join(resp_lines))
-
-            if res["risks"]:
-                print("  → ПОТЕНЦИАЛЬНЫЕ РИСКИ:")
-                for r in res["risks"]:
-                    print(f"      • {r}")
-            else:
-                print("  → Явных рисков не обнаружено")
+            if stream is None:
+                all_results.setdefault(host, []).append(res)
+            print_result(res, host if multi else None)
+
+    phases = {}
+    targets = interleave(hosts, ports)
+    if skip:
+        targets = (target for target in targets if target not in skip)
+    if args.sync:
+        for host, port in targets:
+            on_result(host, scan_port(host, port, args.timeout))
+    elif total > len(skip):
+        raise_fd_limit(max(args.concurrency, args.window) + 64)
+        options = dict(concurrency=args.concurrency, rate=args.rate, per_host=args.per_host,
+                       timeout=args.timeout, window=args.window)
+        if args.workers > 1:
+            phases = scan_sharded(hosts, ports, args.workers, on_result, skip=skip, signatures=args.signatures,
+                                  record_closed=stream is not None, **options)
+        else:
+            phases = scan_targets(targets, on_result, report_closed=stream is not None, **options)
 
     elapsed = time.time() - start_time
-    print(f"\n[✓] Сканирование завершено за {elapsed:.1f} сек. Открыто портов: {open_count}")
-
-    report = {
-        "target": host,
-        "scanned_ports": [ports[0], ports[-1]],
-        "open_ports_count": open_count,
-        "results": [r for r in all_results if r["open"]]
-    }
+    checked = total - len(skip)
+    print(f"\n[✓] Сканирование завершено за {elapsed:.1f} сек. Открыто портов: {open_count} "
+          f"(проверено {checked}, {checked / max(elapsed, 1e-6):.0f} проверок/с)")
+    if phases:
+        sweep = phases["sweep"]
+        print(f"    Обход: {phases['sweep_seconds']:.1f} сек (открыто {sweep['open']}, закрыто {sweep['closed']}, "
+              f"без ответа {sweep['filtered']}, таймаут {sweep['timeout']} сек); "
+              f"пробы: {phases['probe_seconds']:.1f} сек")
+
+    if stream is not None:
+        for host in hosts:
+            stream.done(host, elapsed, phases)
+        stream.close()
+        print(f"\n[+] Результаты записаны в {args.jsonl}; сводка: python report.py {args.jsonl}")
+        return
+
+    reports = []
+    for host in hosts:
+        results = all_results.get(host, [])
+        reports.append({
+            "target": host,
+            "scanned_ports": [ports[0], ports[-1]],
+            "open_ports_count": len(results),
+            "elapsed_seconds": round(elapsed, 3),
+            **({"phases": phases} if phases else {}),
+            # Порты завершаются вразнобой — в отчёте по возрастанию, как раньше
+            "results": sorted(results, key=lambda r: r["port"])
+        })
+    # Один хост — прежний формат, несколько — список отчётов (как у report.py)
+    report = reports[0] if not multi else {"targets": [r for r in reports if r["results"]]}
 
     with open("recon_report.json", "w", encoding="utf-8") as f:
         json.dump(report, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,177 @@
+# sweep.py
+# Первая фаза сканирования: только проверка, принимает ли порт соединение.
+# Тысячи неблокирующих connect() одновременно через selectors (epoll на Linux),
+# без корутин и StreamReader на каждый порт. Таймаут адаптивный — по измеренному
+# RTT ответов (и SYN-ACK, и RST), как RTO в TCP (RFC 6298). Не ответившие порты
+# (filtered) повторяются retries раз с удвоенным таймаутом.
+import errno
+import heapq
+import selectors
+import socket
+import struct
+import time
+from collections import deque
+
+LINGER_RST = struct.pack("ii", 1, 0)  # close() шлёт RST: ни TIME_WAIT у нас, ни висящего accept у цели
+
+class RttEstimator:
+    """Сглаженный RTT и разброс; timeout() = srtt + 4 * rttvar в пределах [min, max]"""
+    def __init__(self, initial, min_timeout, max_timeout):
+        self.srtt = None
+        self.rttvar = 0.0
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+    def update(self, rtt):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def timeout(self):
+        if self.srtt is None:
+            return self.initial
+        return min(max(self.srtt + 4 * self.rttvar, self.min_timeout), self.max_timeout)
+
+def _resolve(host, cache):
+    addr = cache.get(host)
+    if addr is None:
+        addr = cache[host] = socket.gethostbyname(host)
+    return addr
+
+def connect_sweep(targets, on_open, window=2000, rate=0, per_host=100, initial_timeout=1.0,
+                  min_timeout=0.1, max_timeout=3.0, retries=1, on_closed=None):
+    """Проверяет (хост, порт) из targets, вызывая on_open(host, port) для принявших соединение
+    и on_closed(host, port, "closed"|"filtered") — для остальных.
+
+    window — сколько connect() в полёте одновременно, per_host — из них на один хост,
+    rate — не больше N новых connect() в секунду (0 — без ограничения).
+    -> {"open", "closed", "filtered", "timeout"} — счётчики и итоговый таймаут
+    """
+    rtt = RttEstimator(initial_timeout, min_timeout, max_timeout)
+    sel = selectors.DefaultSelector()
+    targets = iter(targets)
+    retry = deque()             # (хост, порт, попытка, таймаут) после таймаута
+    deferred = deque()          # цели, упёршиеся в per_host
+    deadlines = []              # куча (срок, номер сокета)
+    in_flight = {}              # номер сокета -> (sock, хост, порт, старт, попытка, таймаут)
+    per_host_count = {}
+    addr_cache = {}
+    stats = {"open": 0, "closed": 0, "filtered": 0}
+    exhausted = False
+    seq = 0
+    next_launch = time.monotonic()
+
+    def closed(host, port, state):
+        stats[state] += 1
+        if on_closed is not None:
+            on_closed(host, port, state)
+
+    def launch(host, port, attempt, timeout):
+        nonlocal seq
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RST)
+        started = time.monotonic()
+        try:
+            err = sock.connect_ex((_resolve(host, addr_cache), port))
+        except OSError as e:  # не разрешилось имя и т.п.
+            err = e.errno or errno.EHOSTUNREACH
+        if err != errno.EINPROGRESS:
+            sock.close()
+            if err == 0:
+                stats["open"] += 1
+                on_open(host, port)
+            else:
+                closed(host, port, "closed")
+            return
+        seq += 1
+        in_flight[seq] = (sock, host, port, started, attempt, timeout)
+        per_host_count[host] = per_host_count.get(host, 0) + 1
+        sel.register(sock, selectors.EVENT_WRITE, seq)
+        heapq.heappush(deadlines, (started + timeout, seq))
+
+    def finish(key):
+        sock, host, port = in_flight.pop(key)[:3]
+        sel.unregister(sock)
+        sock.close()
+        per_host_count[host] -= 1
+        if not per_host_count[host]:
+            del per_host_count[host]
+
+    def next_target():
+        nonlocal exhausted
+        if retry:
+            return retry.popleft()
+        for _ in range(len(deferred)):
+            host, port, attempt, timeout = deferred.popleft()
+            if per_host_count.get(host, 0) < per_host:
+                return host, port, attempt, timeout
+            deferred.append((host, port, attempt, timeout))
+        while not exhausted:
+            try:
+                host, port = next(targets)
+            except StopIteration:
+                exhausted = True
+                break
+            if per_host_count.get(host, 0) < per_host:
+                return host, port, 0, None
+            deferred.append((host, port, 0, None))
+            if len(deferred) >= window:
+                break  # дальше читать цели бессмысленно: все ждут освобождения своих хостов
+        return None
+
+    try:
+        while True:
+            now = time.monotonic()
+            while len(in_flight) < window and (not rate or now >= next_launch):
+                target = next_target()
+                if target is None:
+                    break
+                host, port, attempt, timeout = target
+                launch(host, port, attempt, timeout or rtt.timeout())
+                if rate:
+                    next_launch = max(next_launch, now - 1.0) + 1.0 / rate
+            if not in_flight:
+                if exhausted and not retry and not deferred:
+                    break
+                time.sleep(max(next_launch - time.monotonic(), 0.001))
+                continue
+
+            wait = max(deadlines[0][0] - time.monotonic(), 0) if deadlines else 0.05
+            if rate:
+                wait = min(wait, max(next_launch - time.monotonic(), 0))
+            for key, _ in sel.select(min(wait, 0.05)):
+                seq_id = key.data
+                sock, host, port, started = in_flight[seq_id][:4]
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                finish(seq_id)
+                if err == 0:
+                    rtt.update(time.monotonic() - started)
+                    stats["open"] += 1
+                    on_open(host, port)
+                else:
+                    if err in (errno.ECONNREFUSED, errno.ECONNRESET):
+                        rtt.update(time.monotonic() - started)  # RST — тоже честный замер RTT
+                    closed(host, port, "closed")
+
+            now = time.monotonic()
+            while deadlines and deadlines[0][0] <= now:
+                _, seq_id = heapq.heappop(deadlines)
+                entry = in_flight.get(seq_id)
+                if entry is None:
+                    continue  # уже ответил
+                _, host, port, _, attempt, timeout = entry
+                finish(seq_id)
+                if attempt < retries:
+                    retry.append((host, port, attempt + 1, min(timeout * 2, max_timeout)))
+                else:
+                    closed(host, port, "filtered")
+    finally:
+        for sock, *_ in in_flight.values():
+            sock.close()
+        sel.close()
+    stats["timeout"] = round(rtt.timeout(), 3)
+    return stats
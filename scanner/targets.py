@@ -0,0 +1,70 @@
+# targets.py
+# Разбор целей сканирования: хосты — список через запятую из имён, адресов,
+# подсетей CIDR (10.0.0.0/22) и файлов со списком (@hosts.txt); порты — список
+# через запятую из портов и диапазонов (22,80,8000-8100). Пары (хост, порт)
+# выдаются лениво и вперемешку по хостам: подряд идут разные хосты, так что ни
+# один не получает всю пачку подключений разом.
+import ipaddress
+
+class TargetError(ValueError):
+    pass
+
+def _expand_one(item):
+    if "/" in item:
+        try:
+            network = ipaddress.ip_network(item, strict=False)
+        except ValueError as e:
+            raise TargetError(f"Некорректная подсеть {item}: {e}") from None
+        if network.num_addresses == 1:
+            return [str(network.network_address)]
+        return [str(addr) for addr in network.hosts()]
+    return [item]
+
+def expand_hosts(spec):
+    """"10.0.0.0/30,example.org,@hosts.txt" -> список хостов без повторов, в порядке появления"""
+    hosts = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if item.startswith("@"):
+            with open(item[1:], encoding="utf-8") as f:
+                lines = [line.split("#", 1)[0].strip() for line in f]
+            items = [line for line in lines if line]
+        else:
+            items = [item]
+        for entry in items:
+            for host in _expand_one(entry):
+                hosts[host] = None
+    if not hosts:
+        raise TargetError("Не задано ни одного хоста")
+    return list(hosts)
+
+def parse_ports(spec):
+    """"22,80,8000-8100" -> отсортированный список портов без повторов"""
+    ports = set()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            if "-" in item:
+                start, end = map(int, item.split("-"))
+                if start > end:
+                    raise TargetError("Начало диапазона больше конца")
+            else:
+                start = end = int(item)
+        except ValueError as e:
+            raise TargetError(f"Некорректный порт {item}: {e}") from None
+        if not 1 <= start <= end <= 65535:
+            raise TargetError(f"Порт вне диапазона 1-65535: {item}")
+        ports.update(range(start, end + 1))
+    if not ports:
+        raise TargetError("Не задано ни одного порта")
+    return sorted(ports)
+
+def interleave(hosts, ports):
+    """(хост, порт) по портам, а внутри порта — по всем хостам"""
+    for port in ports:
+        for host in hosts:
+            yield host, port